@@ -25,120 +25,6 @@ DELIMITER $$
 --
 -- Procedury
 --
-CREATE DEFINER=`u114951875_lapdb`@`127.0.0.1` PROCEDURE `CreateActiveEventPhaseResult` (IN `EventId` INT, IN `EventPhaseId` INT)   BEGIN
-    DECLARE v_result_type VARCHAR(4);
-
-    SELECT ep.result_type 
-      INTO v_result_type
-      FROM event_phase ep
-     WHERE ep.id = EventPhaseId;
-
-    DELETE FROM event_result 
-     WHERE event_phase_id = EventPhaseId
-       AND event_registration_id IN (
-           SELECT id 
-             FROM event_registration 
-            WHERE event_id = EventId
-       );
-
-    IF v_result_type = 'MIN' THEN
-        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, points, position)
-        SELECT 
-            er.id,
-            EventPhaseId,
-            MIN(el.laptime) AS total_time,
-
-            CASE
-                WHEN cc.name = 'S1+' THEN
-                    0
-                WHEN EventPhaseId = 2 THEN
-                    CASE 
-                      WHEN ROW_NUMBER() OVER (
-                             PARTITION BY er.car_category_id 
-                             ORDER BY 
-                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                               MIN(el.laptime)
-                           ) = 1 THEN 6
-                      WHEN ROW_NUMBER() OVER (
-                             PARTITION BY er.car_category_id 
-                             ORDER BY 
-                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                               MIN(el.laptime)
-                           ) = 2 THEN 3
-                      WHEN ROW_NUMBER() OVER (
-                             PARTITION BY er.car_category_id 
-                             ORDER BY 
-                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                               MIN(el.laptime)
-                           ) = 3 THEN 1
-                      ELSE 0
-                    END
-                ELSE
-                    0
-            END AS points,
-
-            ROW_NUMBER() OVER (
-                PARTITION BY er.car_category_id 
-                ORDER BY 
-                    CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                    MIN(el.laptime)
-            ) AS position
-
-        FROM event_registration er
-        INNER JOIN event_lap el 
-                ON er.id = el.event_registration_id
-        INNER JOIN car_category cc
-                ON er.car_category_id = cc.id
-        WHERE er.event_id = EventId
-          AND el.event_phase_id = EventPhaseId
-        GROUP BY er.id, er.car_category_id, cc.name
-        HAVING MIN(el.laptime) IS NOT NULL
-        ORDER BY er.car_category_id,
-                 CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                 MIN(el.laptime);
-
-    ELSEIF v_result_type = 'SUM' THEN
-        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, points, position)
-        SELECT 
-            er.id,
-            EventPhaseId,
-            SEC_TO_TIME(
-                FLOOR(SUM(TIME_TO_SEC(el.laptime)))
-            ) + INTERVAL ROUND(MOD(SUM(TIME_TO_SEC(el.laptime)), 1), 3) SECOND,
-            0,
-            ROW_NUMBER() OVER (
-                PARTITION BY er.car_category_id 
-                ORDER BY 
-                  CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END, 
-                  SUM(TIME_TO_SEC(el.laptime))
-            ) AS position
-        FROM event_registration er
-        INNER JOIN event_lap el 
-                ON er.id = el.event_registration_id
-        WHERE er.event_id = EventId
-          AND el.event_phase_id = EventPhaseId
-          AND el.laptime IS NOT NULL
-        GROUP BY er.id, er.car_category_id
-        HAVING SUM(TIME_TO_SEC(el.laptime)) IS NOT NULL
-        ORDER BY er.car_category_id,
-                 CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
-                 SUM(TIME_TO_SEC(el.laptime));
-
-        UPDATE event_result er
-        INNER JOIN points_definition pd 
-                ON er.position = pd.position
-        INNER JOIN event_registration reg 
-                ON er.event_registration_id = reg.id
-        INNER JOIN car_category cc
-                ON reg.car_category_id = cc.id
-        SET er.points = pd.points
-        WHERE reg.event_id = EventId
-          AND er.event_phase_id = EventPhaseId
-          AND cc.name <> 'S1+';
-    END IF;
-
-END$$
-
 CREATE DEFINER=`u114951875_lapdb`@`127.0.0.1` PROCEDURE `DeleteCar` (IN `input_car_id` INT)   BEGIN
     DELETE FROM event_result
     WHERE event_registration_id IN (
@@ -248,61 +134,15 @@ CREATE DEFINER=`u114951875_lapdb`@`127.0.0.1` PROCEDURE `InsertLapTime` (IN `p_w
     VALUES (v_event_registration_id, p_laptime, p_event_phase_id);
 END$$
 
-CREATE DEFINER=`u114951875_lapdb`@`127.0.0.1` PROCEDURE `UpdateActiveEventPhaseResults` (IN `EventId` INT, IN `EventPhaseId` INT)   BEGIN
-    DECLARE v_result_type VARCHAR(4);
-
-    SELECT ep.result_type INTO v_result_type
-    FROM event_phase ep
-    WHERE ep.id = EventPhaseId;
-
-    DELETE FROM event_result 
-    WHERE event_phase_id = EventPhaseId
-    AND event_registration_id IN (
-        SELECT id FROM event_registration WHERE event_id = EventId
-    );
-
-    IF v_result_type = 'MIN' THEN
-        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, position)
-        SELECT 
-            er.id AS event_registration_id,
-            EventPhaseId,
-            MIN(el.laptime) AS total_time,
-            ROW_NUMBER() OVER (
-                PARTITION BY er.car_category_id 
-                ORDER BY MIN(el.laptime)
-            ) AS position
-        FROM 
-            event_registration er
-        INNER JOIN event_lap el ON er.id = el.event_registration_id
-        WHERE 
-            er.event_id = EventId
-            AND el.event_phase_id = EventPhaseId
-        GROUP BY 
-            er.id, er.car_category_id
-        HAVING MIN(el.laptime) IS NOT NULL;
-
-    ELSEIF v_result_type = 'SUM' THEN
-        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, position)
-        SELECT 
-            er.id AS event_registration_id,
-            EventPhaseId,
-            SEC_TO_TIME(SUM(TIME_TO_SEC(el.laptime))) AS total_time,
-            ROW_NUMBER() OVER (
-                PARTITION BY er.car_category_id 
-                ORDER BY SUM(TIME_TO_SEC(el.laptime))
-            ) AS position
-        FROM 
-            event_registration er
-        INNER JOIN event_lap el ON er.id = el.event_registration_id
-        WHERE 
-            er.event_id = EventId
-            AND el.event_phase_id = EventPhaseId
-        GROUP BY 
-            er.id, er.car_category_id
-        HAVING SUM(TIME_TO_SEC(el.laptime)) IS NOT NULL;
-    END IF;
-
-END$$
+--
+-- Funkce
+--
+CREATE DEFINER=`u114951875_lapdb`@`127.0.0.1` FUNCTION `FormatTimeMs` (`ms` INT UNSIGNED) RETURNS VARCHAR(12) CHARSET utf8mb4 COLLATE utf8mb4_general_ci DETERMINISTIC NO SQL RETURN CONCAT(
+        LPAD(FLOOR(ms / 3600000), 2, '0'), ':',
+        LPAD(FLOOR(MOD(ms, 3600000) / 60000), 2, '0'), ':',
+        LPAD(FLOOR(MOD(ms, 60000) / 1000), 2, '0'), '.',
+        LPAD(FLOOR(MOD(ms, 1000) / 10), 2, '0')
+    )$$
 
 DELIMITER ;
 
@@ -562,18 +402,6 @@ INSERT INTO `event` (`id`, `name`, `number_of_laps`, `date`, `location`, `start_
 (55, 'Circuit of the Americas', 10, '2025-03-16', '9201 Circuit of the Americas Blvd, Del Valle, TX 78617, Spojené státy', '30.13362669844563,-97.64216835739438;30.133445762916462,-97.64232393322688', '30.13362669844563,-97.64216835739438;30.133445762916462,-97.64232393322688', NULL, NULL, 2, 18),
 (56, 'WeatherTech Raceway Laguna Seca', 8, '2025-03-17', '1021 Monterey Salinas Hwy, Salinas, CA 93908, Spojené státy', '36.584872943478764,-121.75519995386531;36.584536964525,-121.75531261222675', '36.584872943478764,-121.75519995386531;36.584536964525,-121.75531261222675', NULL, NULL, 1, 18);
 
---
--- Triggery `event`
---
-DELIMITER $$
-CREATE TRIGGER `after_event_phase_id_update` AFTER UPDATE ON `event` FOR EACH ROW BEGIN
-    IF OLD.event_phase_id <> NEW.event_phase_id THEN
-        CALL CreateActiveEventPhaseResult(OLD.id, 				OLD.event_phase_id);
-    END IF;
-END
-$$
-DELIMITER ;
-
 -- --------------------------------------------------------
 
 --
@@ -584,9 +412,24 @@ CREATE TABLE `event_lap` (
   `id` mediumint(9) NOT NULL,
   `event_registration_id` smallint(6) NOT NULL,
   `laptime` varchar(12) NOT NULL,
-  `event_phase_id` tinyint(4) NOT NULL
+  `laptime_ms` int(10) UNSIGNED NOT NULL,
+  `event_phase_id` tinyint(4) NOT NULL,
+  `client_lap_id` varchar(64) COLLATE utf8mb4_bin DEFAULT NULL,
+  `created_at` timestamp(3) NOT NULL DEFAULT current_timestamp(3)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+--
+-- Triggery `event_lap`
+--
+DELIMITER $$
+CREATE TRIGGER `before_event_lap_insert` BEFORE INSERT ON `event_lap` FOR EACH ROW BEGIN
+    IF NEW.laptime_ms IS NULL THEN
+        SET NEW.laptime_ms = ROUND(TIME_TO_SEC(NEW.laptime) * 1000);
+    END IF;
+END
+$$
+DELIMITER ;
+
 --
 -- Vypisuji data pro tabulku `event_lap`
 --
@@ -2909,10 +2752,23 @@ CREATE TABLE `event_result` (
   `event_registration_id` smallint(6) NOT NULL,
   `event_phase_id` tinyint(4) NOT NULL,
   `total_time` varchar(12) NOT NULL,
+  `total_time_ms` int(10) UNSIGNED NOT NULL,
   `points` tinyint(4) NOT NULL,
   `position` tinyint(4) NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+--
+-- Triggery `event_result`
+--
+DELIMITER $$
+CREATE TRIGGER `before_event_result_insert` BEFORE INSERT ON `event_result` FOR EACH ROW BEGIN
+    IF NEW.total_time_ms IS NULL THEN
+        SET NEW.total_time_ms = ROUND(TIME_TO_SEC(NEW.total_time) * 1000);
+    END IF;
+END
+$$
+DELIMITER ;
+
 --
 -- Vypisuji data pro tabulku `event_result`
 --
@@ -3457,7 +3313,9 @@ ALTER TABLE `event`
 ALTER TABLE `event_lap`
   ADD PRIMARY KEY (`id`),
   ADD KEY `fk_event_lap_registration` (`event_registration_id`),
-  ADD KEY `fk_event_lap_phase` (`event_phase_id`);
+  ADD KEY `fk_event_lap_phase` (`event_phase_id`),
+  ADD UNIQUE KEY `uq_event_lap_client_lap` (`event_registration_id`,`event_phase_id`,`client_lap_id`),
+  ADD KEY `idx_event_lap_registration_phase_time` (`event_registration_id`,`event_phase_id`,`laptime_ms`);
 
 --
 -- Indexy pro tabulku `event_phase`
@@ -3481,7 +3339,7 @@ ALTER TABLE `event_registration`
 --
 ALTER TABLE `event_result`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `fk_event_result_registration` (`event_registration_id`),
+  ADD UNIQUE KEY `uq_event_result_registration_phase` (`event_registration_id`,`event_phase_id`),
   ADD KEY `fk_event_result_phase` (`event_phase_id`);
 
 --
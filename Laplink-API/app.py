@@ -1,15 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from routes import login,phase_results, events, drivers, results, series, phases, cars, laps, registrations, car_categories, raceboxes, points_definitions, statistics, flags
-from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse
+from routes import login,phase_results, events, drivers, results, series, phases, cars, laps, registrations, car_categories, raceboxes, points_definitions, statistics, flags, admin
+from db.connection import close_connection_pool, init_connection_pool, get_pool_stats, pool_state
+from service.metrics import RequestScopeMiddleware, render_metrics
+from service.executor import shutdown_executor
+from service.lap_journal import LAP_WRITE_BEHIND, lap_journal
+from service.results_recompute import results_recompute
+from service.leader import results_leader
+from service.scheduler import scheduler_service
+from service.standings_feed import standings_feeds
+from service.flag_hub import flag_hub
+from routes.events import start_result_leadership
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool se vytváří na pozadí, worker tak začne přijímat požadavky i při nedostupné databázi
+    pool_init = asyncio.create_task(init_connection_pool())
+    if LAP_WRITE_BEHIND:
+        # Nedokončená kola z minulého běhu se uloží, jakmile bude databáze dostupná
+        await lap_journal.start()
+    # Jeden plánovač úloh na worker, průběžné výsledky každé aktivní fáze přepočítává jen vedoucí worker
+    scheduler_service.start()
+    start_result_leadership()
+    yield
+    # Otevřené odběry živého pořadí (SSE) skončí, klienti se připojí k jinému workeru
+    await standings_feeds.stop()
+    await flag_hub.close()
+    if LAP_WRITE_BEHIND:
+        await lap_journal.stop()
+    # Výsledky kol uložených těsně před vypnutím se uloží hned, pak se vedení předá
+    await results_recompute.stop()
+    await scheduler_service.stop()
+    # Puštěné vedení převezmou ostatní workery při své nejbližší volbě
+    await results_leader.close()
+    pool_init.cancel()
+    await close_connection_pool()
+    shutdown_executor()
 
 app = FastAPI(
     title="Laplink API",
     description="API pro aplikaci Laplink",
     version="1.0",
     docs_url="/",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -19,12 +56,32 @@ app.add_middleware(
     allow_methods=["PUT", "POST", "GET", "DELETE"],
     allow_headers=["*"],
 )
-executor = ThreadPoolExecutor(max_workers=10)
+app.add_middleware(RequestScopeMiddleware)
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     return FileResponse("static/favicon.ico")
 
+@app.get("/health/live", include_in_schema=False)
+async def liveness():
+    return {"status": "ok"}
+
+@app.get("/health/ready", include_in_schema=False)
+async def readiness():
+    """
+    Worker je připravený, jakmile má vytvořený connection pool.
+    """
+    ready = pool_state["status"] == "ready"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else pool_state["status"], "pool": get_pool_stats()},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.include_router(login.router, prefix="/auth", tags=["Authentication"])
 app.include_router(events.router, prefix="/events", tags=["Events"])
@@ -40,4 +97,5 @@ app.include_router(points_definitions.router, prefix="/points-definitions", tags
 app.include_router(statistics.router, prefix="/statistics", tags=["Statistics"])
 app.include_router(phase_results.router, prefix="/phase-results", tags=["Phase Results"])
 app.include_router(results.router, prefix="/results", tags=["Results"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
 #app.include_router(flags.router, prefix="/flags", tags=["Flags"])
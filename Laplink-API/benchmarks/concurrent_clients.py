@@ -0,0 +1,96 @@
+"""
+Měří propustnost API (požadavky za sekundu) při souběžném zápisu kol a čtení výsledků.
+
+Postup porovnání před a po změně:
+    1. spustit server na původní verzi:   uvicorn app:app --workers 1
+    2. python benchmarks/concurrent_clients.py --label before
+    3. spustit server na nové verzi a zopakovat s --label after
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv('.env.local')
+
+
+def random_laptime():
+    seconds = random.uniform(20, 90)
+    minutes, seconds = divmod(seconds, 60)
+    return f"00:{int(minutes):02}:{seconds:05.2f}"
+
+
+def build_requests(args):
+    headers = {"X-API-KEY": args.api_key}
+    lap_payload = lambda: {
+        "event_id": args.event_id,
+        "web_user": args.web_user,
+        "laptime": random_laptime(),
+        "event_phase_id": args.event_phase_id,
+    }
+    return [
+        ("POST /laps/event/lap/data", lambda s: s.post(
+            f"{args.base_url}/laps/event/lap/data", json=lap_payload(), headers=headers)),
+        ("GET /results/get/event/results", lambda s: s.get(
+            f"{args.base_url}/results/get/event/results",
+            params={"event_id": args.event_id, "event_phase_id": args.event_phase_id}, headers=headers)),
+        ("GET /statistics/get/event/phase/statistics", lambda s: s.get(
+            f"{args.base_url}/statistics/get/event/phase/statistics/{args.event_id}",
+            params={"event_phase_id": args.event_phase_id}, headers=headers)),
+    ]
+
+
+def run_client(client_id, args, deadline, counters, lock):
+    session = requests.Session()
+    routes = build_requests(args)
+    # Každý pátý klient zapisuje kola, ostatní čtou výsledky
+    name, send = routes[0] if client_id % 5 == 0 else random.choice(routes[1:])
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            ok = send(session).status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            counters[name]["requests"] += 1
+            counters[name]["errors"] += 0 if ok else 1
+            counters[name]["latency"] += elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark souběžných klientů Laplink API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"))
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--event-id", type=int, default=56)
+    parser.add_argument("--event-phase-id", type=int, default=1)
+    parser.add_argument("--web-user", default="dominik")
+    parser.add_argument("--label", default="run")
+    args = parser.parse_args()
+
+    counters = defaultdict(lambda: {"requests": 0, "errors": 0, "latency": 0.0})
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        for client_id in range(args.clients):
+            pool.submit(run_client, client_id, args, deadline, counters, lock)
+
+    total = sum(c["requests"] for c in counters.values())
+    print(f"[{args.label}] {args.clients} klientů, {args.duration:.0f} s")
+    for name, c in sorted(counters.items()):
+        avg_ms = c["latency"] / c["requests"] * 1000 if c["requests"] else 0
+        print(f"  {name:45} {c['requests'] / args.duration:8.1f} req/s  avg {avg_ms:7.1f} ms  chyby {c['errors']}")
+    print(f"  {'celkem':45} {total / args.duration:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
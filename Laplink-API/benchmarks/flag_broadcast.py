@@ -0,0 +1,152 @@
+"""
+Změří rozesílání vlajek (service/flag_hub.py) na simulovaných WebSocket připojeních.
+
+Připojí --sockets simulovaných zařízení jednoho závodu, každé s náhodnou síťovou
+latencí do --jitter-ms. Jedno zařízení je záměrně pomalé, odeslání zprávy mu trvá
+--slow-ms. Potom rozešle --flags vlajek v intervalu --interval a měří, za jak dlouho
+dorazí ostatním zařízením a jak dlouho trvá samotné volání rozeslání.
+
+S --sequential pro srovnání změří i původní rozesílání (await send_json postupně
+na každém socketu). Správnost rozesílání a odpojení pomalého zařízení ověřuje
+tests/test_flag_hub.py. Databázi ani server nepotřebuje:
+    python benchmarks/flag_broadcast.py --sockets 500 --flags 20 --sequential
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import service.flag_hub as flag_hub_module  # noqa: E402
+from service.flag_hub import flag_hub  # noqa: E402
+
+EVENT_ID = 1
+
+
+class SimulatedSocket:
+    def __init__(self, latency):
+        self.latency = latency
+        self.received = []
+        self.close_code = None
+        self._closed = asyncio.Event()
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.latency)
+        self.received.append((time.perf_counter(), json.loads(text)))
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data))
+
+    async def receive_text(self):
+        # Zařízení nic neposílá, čeká se do zavření
+        await self._closed.wait()
+        raise RuntimeError("WebSocket is not connected")
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self._closed.set()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def create_sockets(args):
+    rng = random.Random(args.seed)
+    sockets = [SimulatedSocket(rng.uniform(0, args.jitter_ms) / 1000) for _ in range(args.sockets)]
+    # Pomalé zařízení na začátku seznamu, postupné rozesílání zdrží všechna ostatní
+    slow = sockets[0]
+    slow.latency = args.slow_ms / 1000
+    return sockets, slow
+
+
+def delivery_latencies(sockets, sent_at):
+    return sorted(received_at - sent_at[message["flag_id"]]
+                  for socket in sockets for received_at, message in socket.received)
+
+
+def print_latencies(label, latencies, broadcast_durations):
+    print(f"  {label:10} doručení p50 {percentile(latencies, 0.5) * 1000:8.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms  max {(latencies[-1] if latencies else 0) * 1000:8.2f} ms  "
+          f"volání rozeslání max {max(broadcast_durations) * 1000:8.2f} ms")
+
+
+async def run_sequential(args):
+    """
+    Původní notify_all: await send_json na jednom socketu po druhém.
+    """
+    sockets, slow = create_sockets(args)
+    sent_at = {}
+    durations = []
+    for flag_id in range(args.flags):
+        sent_at[flag_id] = started = time.perf_counter()
+        for socket in sockets:
+            await socket.send_json({"flag_id": flag_id, "event_id": EVENT_ID})
+        durations.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+    print_latencies("postupně", delivery_latencies([socket for socket in sockets if socket is not slow], sent_at), durations)
+
+
+async def run_hub(args):
+    flag_hub_module.FLAG_SEND_TIMEOUT_MS = args.send_timeout_ms
+    sockets, slow = create_sockets(args)
+    serving = [asyncio.create_task(flag_hub.serve(socket, EVENT_ID, driver_id)) for driver_id, socket in enumerate(sockets, start=1)]
+    await asyncio.sleep(0)
+
+    sent_at = {}
+    durations = []
+    recipients = []
+    started_at = time.perf_counter()
+    for flag_id in range(args.flags):
+        sent_at[flag_id] = started = time.perf_counter()
+        recipients.append(flag_hub.broadcast(EVENT_ID, {"flag_id": flag_id, "event_id": EVENT_ID}))
+        durations.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+
+    # Doběhnutí front rychlých zařízení
+    fast = [socket for socket in sockets if socket is not slow]
+    deadline = time.perf_counter() + args.jitter_ms / 1000 * 2 + 1
+    while time.perf_counter() < deadline and any(len(socket.received) < args.flags for socket in fast):
+        await asyncio.sleep(0.01)
+    # Odpojení pomalého zařízení
+    deadline = time.perf_counter() + args.send_timeout_ms / 1000 + 1
+    while time.perf_counter() < deadline and slow.close_code is None:
+        await asyncio.sleep(0.01)
+    evicted_after = time.perf_counter() - started_at
+
+    print_latencies("hub", delivery_latencies(fast, sent_at), durations)
+    missing = sum(1 for socket in fast if len(socket.received) < args.flags)
+    print(f"  příjemců první vlajky {recipients[0]}, poslední {recipients[-1]}, bez všech vlajek {missing}, "
+          f"pomalé zařízení zavřeno kódem {slow.close_code} po {evicted_after:.2f} s")
+
+    await flag_hub.close()
+    await asyncio.gather(*serving, return_exceptions=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark rozesílání vlajek s pomalým zařízením")
+    parser.add_argument("--sockets", type=int, default=500)
+    parser.add_argument("--flags", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="interval mezi vlajkami (s)")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="nejvyšší síťová latence rychlých zařízení")
+    parser.add_argument("--slow-ms", type=float, default=5000.0, help="doba odeslání zprávy pomalému zařízení")
+    parser.add_argument("--send-timeout-ms", type=float, default=flag_hub_module.FLAG_SEND_TIMEOUT_MS)
+    parser.add_argument("--sequential", action="store_true", help="změří i původní postupné rozesílání")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.sockets} zařízení (1 pomalé, {args.slow_ms:.0f} ms na zprávu), {args.flags} vlajek")
+    await run_hub(args)
+    if args.sequential:
+        await run_sequential(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+"""
+Ověří volbu vedoucího workeru (service/leader.py) s několika procesy proti skutečné databázi.
+
+Spustí --workers procesů, každý v intervalu --interval volí vedoucího pro --keys klíčů
+stejně jako volba průběžných výsledků (GET_LOCK s nulovým timeoutem na vlastním připojení).
+Kontroluje, že každý klíč vede v každém okamžiku nejvýše jeden proces. Potom vedoucí
+procesy postupně tvrdě ukončí (SIGKILL, bez uvolnění zámků) a měří, za jak dlouho
+klíče převezme jiný proces. Zámky mají vlastní prefix, běžící API neovlivní.
+
+Spouští se přímo proti databázi z .env.local, server API nemusí běžet:
+    python benchmarks/leader_failover.py --workers 4 --keys 3 --kills 2
+Skončí s kódem 1, pokud klíč vedly dva procesy zároveň nebo ho nikdo nepřevzal včas.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.leader import LeaderElection  # noqa: E402
+
+
+def run_worker(worker_id, keys, interval, events):
+    async def elect():
+        election = LeaderElection("failover_check")
+        held = set()
+        while True:
+            acquired, released = await election.elect(keys)
+            held = (held - released) | acquired
+            for key in acquired:
+                events.put((time.time(), worker_id, "acquired", key))
+            for key in released:
+                events.put((time.time(), worker_id, "released", key))
+            events.put((time.time(), worker_id, "held", tuple(sorted(held))))
+            await asyncio.sleep(interval)
+
+    asyncio.run(elect())
+
+
+def drain(events, leaders, errors):
+    """
+    Zpracuje hlášení workerů. Klíč vedený dvěma živými procesy je chyba.
+    """
+    while not events.empty():
+        _, worker_id, change, payload = events.get()
+        if change == "held":
+            for key in payload:
+                owner = leaders.get(key)
+                if owner is not None and owner != worker_id:
+                    errors.append(f"klíč {key} vedou workery {owner} a {worker_id}")
+                leaders[key] = worker_id
+        elif change == "released" and leaders.get(payload) == worker_id:
+            del leaders[payload]
+
+
+def wait_for_leaders(events, leaders, errors, keys, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        drain(events, leaders, errors)
+        if all(key in leaders for key in keys):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test volby vedoucího workeru s více procesy")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--kills", type=int, default=2, help="kolik vedoucích procesů se postupně ukončí")
+    parser.add_argument("--interval", type=float, default=1.0, help="interval volby v procesu (s)")
+    parser.add_argument("--timeout", type=float, default=15.0, help="nejdelší povolená doba převzetí (s)")
+    args = parser.parse_args()
+
+    keys = [(os.getpid(), index) for index in range(args.keys)]
+    events = multiprocessing.Queue()
+    processes = {
+        worker_id: multiprocessing.Process(target=run_worker, args=(worker_id, keys, args.interval, events), daemon=True)
+        for worker_id in range(args.workers)
+    }
+    for process in processes.values():
+        process.start()
+
+    leaders = {}
+    errors = []
+    try:
+        started = time.monotonic()
+        if not wait_for_leaders(events, leaders, errors, keys, args.timeout):
+            errors.append("klíče nikdo nepřevzal ani po startu")
+        print(f"Start: vedoucí {dict(sorted(leaders.items()))} za {time.monotonic() - started:.2f} s")
+
+        for kill in range(args.kills):
+            if errors:
+                break
+            victim = leaders[keys[kill % len(keys)]]
+            orphaned = [key for key, owner in leaders.items() if owner == victim]
+            processes[victim].kill()
+            processes[victim].join()
+            for key in orphaned:
+                del leaders[key]
+            killed_at = time.monotonic()
+            if not wait_for_leaders(events, leaders, errors, keys, args.timeout):
+                errors.append(f"klíče workeru {victim} nikdo nepřevzal do {args.timeout} s")
+                break
+            print(f"Ukončen worker {victim}: klíče {orphaned} převzaty za {time.monotonic() - killed_at:.2f} s, "
+                  f"vedoucí {dict(sorted(leaders.items()))}")
+
+        # Chvíle ustáleného běhu, kdy se hledají souběžní vedoucí
+        settle = time.monotonic() + args.interval * 3
+        while time.monotonic() < settle:
+            drain(events, leaders, errors)
+            time.sleep(0.05)
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.kill()
+
+    for error in errors:
+        print(f"CHYBA: {error}")
+    print("OK" if not errors else "SELHALO")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
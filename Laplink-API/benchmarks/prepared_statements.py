@@ -0,0 +1,107 @@
+"""
+Porovná cenu parsování dotazu get_event_results (join přes pět tabulek) při běžném
+textovém dotazu a při použití cache prepared statementů.
+
+Spouští se přímo proti databázi z .env.local, server API nemusí běžet:
+    python benchmarks/prepared_statements.py --event-id 56 --event-phase-id 1 --iterations 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import close_connection_pool, prioritized_get_db_connection  # noqa: E402
+
+EVENT_RESULTS_QUERY = """SELECT
+            reg.car_category_id,
+            cc.name AS category_name,
+            er.id AS result_id,
+            er.event_phase_id,
+            er.event_registration_id,
+            er.total_time,
+            er.points,
+            er.position,
+            reg.dnf,
+            drv.name AS driver_name,
+            drv.surname AS driver_surname,
+            drv.email AS driver_email,
+            drv.number,
+            ep.phase_name
+        FROM
+            event_result er
+        INNER JOIN
+            event_registration reg ON er.event_registration_id = reg.id
+        INNER JOIN
+            car_category cc ON reg.car_category_id = cc.id
+        INNER JOIN
+            driver drv ON reg.driver_id = drv.id
+        INNER JOIN
+            event_phase ep ON er.event_phase_id = ep.id
+        WHERE
+            er.event_phase_id = %s
+            AND reg.event_id = %s
+        ORDER BY
+            reg.car_category_id,
+            er.position;
+"""
+
+
+async def session_counter(cursor, name):
+    await cursor.execute("SHOW SESSION STATUS LIKE %s", (name,))
+    row = await cursor.fetchone()
+    return int(row["Value"]) if row else 0
+
+
+async def run(label, prepared, args):
+    connection = await prioritized_get_db_connection(priority="high", read_only=False)
+    cursor = connection.cursor(dictionary=True, prepared=prepared)
+    status_cursor = connection.cursor(dictionary=True)
+    values = (args.event_phase_id, args.event_id)
+    try:
+        for _ in range(args.warmup):
+            await cursor.execute(EVENT_RESULTS_QUERY, values)
+            await cursor.fetchall()
+
+        prepares_before = await session_counter(status_cursor, "Com_prepare_sql")
+        durations = []
+        rows = 0
+        for _ in range(args.iterations):
+            started = time.perf_counter()
+            await cursor.execute(EVENT_RESULTS_QUERY, values)
+            rows = len(await cursor.fetchall())
+            durations.append(time.perf_counter() - started)
+        prepares = await session_counter(status_cursor, "Com_prepare_sql") - prepares_before
+    finally:
+        await cursor.close()
+        await status_cursor.close()
+        await connection.close()
+
+    durations.sort()
+    p50 = statistics.median(durations) * 1000
+    p95 = durations[int(len(durations) * 0.95) - 1] * 1000
+    print(f"  {label:10} {len(durations) / sum(durations):8.0f} dotazů/s  p50 {p50:6.3f} ms  "
+          f"p95 {p95:6.3f} ms  řádků {rows}  PREPARE během měření {prepares}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark prepared statementů pro get_event_results")
+    parser.add_argument("--event-id", type=int, default=56)
+    parser.add_argument("--event-phase-id", type=int, default=1)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"get_event_results, {args.iterations} opakování")
+    try:
+        await run("text", False, args)
+        await run("prepared", True, args)
+    finally:
+        await close_connection_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
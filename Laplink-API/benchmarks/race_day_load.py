@@ -0,0 +1,231 @@
+"""
+Zátěžový test závodního dne: N jezdců posílá kola, M diváků obnovuje výsledky.
+
+Každý jezdec posílá kola na /laps/event/lap/data v intervalu --lap-interval sekund
+(s náhodným rozptylem a posunutým startem, aby nepřišla všechna kola najednou).
+Každý divák v intervalu --poll-interval střídá výsledky pro aplikaci a statistiky
+fáze. S --sse diváci místo dotazování odebírají živé pořadí (GET /results/stream/event),
+u SSE se měří doba do prvního snapshotu a odstup mezi příchozími změnami pořadí.
+Na konci se pro každou routu vypíše propustnost, p50/p95/p99 latence a chyby.
+
+Jezdci se berou z registrací závodu přes API, server tedy musí běžet nad databází
+s daty závodu. Lokální příprava z dumpu (příkazy 1 a 2 z kořene repozitáře):
+    1. mysql -e "CREATE DATABASE laplink_load"
+    2. mysql laplink_load < "BM Racing - Databáze.sql" && mysql laplink_load < migrations/001_time_ms.sql
+    3. v .env.local nasměrovat DB_* na lokální databázi, spustit uvicorn app:app --workers 1
+    4. python benchmarks/race_day_load.py --drivers 60 --readers 200 --duration 120 --event-id 56
+
+Zapsaná kola v databázi zůstanou, test proto nespouštět proti produkční databázi.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv('.env.local')
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, elapsed, status):
+        with self._lock:
+            self.latencies[route].append(elapsed)
+            if status is None:
+                self.errors[route]["exception"] += 1
+            elif status >= 400:
+                self.errors[route][str(status)] += 1
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def timed(recorder, route, send):
+    started = time.perf_counter()
+    try:
+        status = send().status_code
+    except requests.RequestException:
+        status = None
+    recorder.record(route, time.perf_counter() - started, status)
+
+
+def sleep_until(deadline, seconds):
+    time.sleep(max(min(seconds, deadline - time.perf_counter()), 0))
+
+
+def load_web_users(args, headers):
+    """
+    Vrátí web_user registrovaných jezdců závodu.
+    """
+    response = requests.get(f"{args.base_url}/registrations/get/event/registrations",
+                            params={"event_id": args.event_id}, headers=headers, timeout=10)
+    response.raise_for_status()
+    web_users = []
+    for driver_id in sorted({registration["driver_id"] for registration in response.json()["data"]}):
+        response = requests.get(f"{args.base_url}/drivers/get/driver/{driver_id}", headers=headers, timeout=10)
+        if response.status_code == 200:
+            web_users.append(response.json()["data"]["web_user"])
+        if len(web_users) == args.drivers:
+            break
+    return web_users
+
+
+def format_laptime(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return f"{hours:02}:{minutes:02}:{seconds:05.2f}"
+
+
+def run_driver(driver_id, web_user, args, headers, deadline, recorder):
+    session = requests.Session()
+    rng = random.Random(f"{driver_id}:{web_user}")
+    # Tempo jezdce, jednotlivá kola kolem něj kolísají
+    pace = rng.uniform(60, 90)
+    sleep_until(deadline, rng.uniform(0, args.lap_interval))
+    while time.perf_counter() < deadline:
+        payload = {
+            "event_id": args.event_id,
+            "web_user": web_user,
+            "laptime": format_laptime(max(rng.gauss(pace, 1.5), 1)),
+            "event_phase_id": args.event_phase_id,
+            "client_lap_id": str(uuid.uuid4()),
+        }
+        timed(recorder, "POST /laps/event/lap/data",
+              lambda: session.post(f"{args.base_url}/laps/event/lap/data", json=payload, headers=headers, timeout=30))
+        sleep_until(deadline, max(rng.gauss(args.lap_interval, args.lap_interval * 0.2), 0.1))
+
+
+def run_reader(reader_id, args, headers, deadline, recorder):
+    session = requests.Session()
+    rng = random.Random(reader_id)
+    phase = {"event_phase_id": args.event_phase_id}
+    routes = [
+        ("GET /results/get/app/event/results", lambda: session.get(
+            f"{args.base_url}/results/get/app/event/results",
+            params={"event_id": args.event_id}, headers=headers, timeout=30)),
+        ("GET /statistics/get/event/phase/statistics", lambda: session.get(
+            f"{args.base_url}/statistics/get/event/phase/statistics/{args.event_id}",
+            params=phase, headers=headers, timeout=30)),
+        ("GET /statistics/get/event/phase/statistics/categories", lambda: session.get(
+            f"{args.base_url}/statistics/get/event/phase/statistics/categories/{args.event_id}",
+            params=phase, headers=headers, timeout=30)),
+    ]
+    sleep_until(deadline, rng.uniform(0, args.poll_interval))
+    while time.perf_counter() < deadline:
+        # Divák většinou sleduje výsledky, statistiky otevře občas
+        route, send = routes[0] if rng.random() < 0.6 else rng.choice(routes[1:])
+        timed(recorder, route, send)
+        sleep_until(deadline, max(rng.gauss(args.poll_interval, args.poll_interval * 0.3), 0.1))
+
+
+def run_sse_reader(reader_id, args, headers, deadline, recorder):
+    """
+    Divák s otevřeným odběrem živého pořadí, spojení drží do konce testu.
+    """
+    rng = random.Random(reader_id)
+    sleep_until(deadline, rng.uniform(0, args.poll_interval))
+    while time.perf_counter() < deadline:
+        started = last_message = time.perf_counter()
+        try:
+            with requests.get(f"{args.base_url}/results/stream/event/{args.event_id}",
+                              params={"event_phase_id": args.event_phase_id}, headers=headers,
+                              stream=True, timeout=(10, 30)) as response:
+                if response.status_code >= 400:
+                    recorder.record("SSE snapshot", time.perf_counter() - started, response.status_code)
+                    sleep_until(deadline, args.poll_interval)
+                    continue
+                for line in response.iter_lines(decode_unicode=True):
+                    if line.startswith("event: "):
+                        now = time.perf_counter()
+                        kind = line[len("event: "):]
+                        recorder.record(f"SSE {kind}", now - (started if kind == "snapshot" else last_message), 200)
+                        last_message = now
+                    if time.perf_counter() >= deadline:
+                        break
+        except requests.RequestException:
+            recorder.record("SSE snapshot", time.perf_counter() - started, None)
+
+
+def report(recorder, args, duration):
+    summary = {}
+    print(f"[{args.label}] {args.drivers} jezdců, {args.readers} diváků, {duration:.0f} s")
+    print(f"  {'routa':55} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  chyby")
+    for route in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[route])
+        errors = dict(recorder.errors[route])
+        error_count = sum(errors.values())
+        summary[route] = {
+            "requests": len(latencies),
+            "throughput": len(latencies) / duration,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "error_rate": error_count / len(latencies),
+            "errors": errors,
+        }
+        row = summary[route]
+        detail = ", ".join(f"{status}: {count}" for status, count in sorted(errors.items()))
+        print(f"  {route:55} {row['throughput']:8.1f} {row['p50_ms']:7.1f}ms {row['p95_ms']:7.1f}ms "
+              f"{row['p99_ms']:7.1f}ms  {row['error_rate']:6.2%}{f' ({detail})' if detail else ''}")
+    total = sum(row["requests"] for row in summary.values())
+    print(f"  {'celkem':55} {total / duration:8.1f}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zátěžový test závodního dne pro Laplink API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"))
+    parser.add_argument("--event-id", type=int, default=56)
+    parser.add_argument("--event-phase-id", type=int, default=1)
+    parser.add_argument("--drivers", type=int, default=60)
+    parser.add_argument("--readers", type=int, default=100)
+    parser.add_argument("--lap-interval", type=float, default=5.0, help="průměrný interval mezi koly jezdce (s)")
+    parser.add_argument("--poll-interval", type=float, default=3.0, help="průměrný interval obnovení diváka (s)")
+    parser.add_argument("--sse", action="store_true", help="diváci odebírají živé pořadí místo dotazování")
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--json", help="uloží souhrn do souboru pro porovnání běhů")
+    args = parser.parse_args()
+
+    headers = {"X-API-KEY": args.api_key}
+    web_users = load_web_users(args, headers)
+    if not web_users:
+        parser.error(f"Závod {args.event_id} nemá registrované jezdce")
+    if len(web_users) < args.drivers:
+        print(f"Závod má jen {len(web_users)} jezdců, další zařízení posílají kola za stejné jezdce")
+    drivers = [web_users[index % len(web_users)] for index in range(args.drivers)]
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.drivers + args.readers) as pool:
+        for driver_id, web_user in enumerate(drivers):
+            pool.submit(run_driver, driver_id, web_user, args, headers, deadline, recorder)
+        for reader_id in range(args.readers):
+            pool.submit(run_sse_reader if args.sse else run_reader, reader_id, args, headers, deadline, recorder)
+
+    summary = report(recorder, args, time.perf_counter() - started)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            settings = {name: value for name, value in vars(args).items() if name != "api_key"}
+            json.dump({"label": args.label, "args": settings, "routes": summary}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Změří výpočet výsledků fáze v service/results_engine.py (NumPy) na syntetických datech
+a porovná ho s přímočarým výpočtem v čistém Pythonu se stejnými pravidly.
+
+Vygeneruje --registrations registrací v --categories kategoriích (první kategorie
+nebere body jako S1+, část jezdců má dnf) a každé --laps kol v náhodném pořadí.
+Výsledky obou výpočtů musí být shodné, jinak skončí s kódem 1. Databázi nepotřebuje:
+    python benchmarks/results_engine.py --registrations 10000 --laps 50 --event-phase-id 3
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from service.results_engine import (QUALIFICATION_PHASE, QUALIFICATION_POINTS, RACE_PHASE,  # noqa: E402
+                                    compute_phase_results, result_rows)
+
+# Tabulka points_definition z databáze
+POINTS_DEFINITION = [(1, 25), (2, 18), (3, 15), (4, 12), (5, 10), (6, 8), (7, 6), (8, 4), (9, 2), (10, 1)]
+
+
+def generate(args):
+    rng = np.random.default_rng(args.seed)
+    registration_ids = rng.permutation(np.arange(1, args.registrations + 1, dtype=np.int64) * 3)
+    category_ids = rng.integers(1, args.categories + 1, size=args.registrations, dtype=np.int64)
+    dnf = (rng.random(args.registrations) < 0.05).astype(np.int8)
+    lap_registration_ids = np.repeat(registration_ids, args.laps)
+    # Časy po setinách jako ze stopek, shody časů jsou tak časté
+    laptimes_ms = rng.integers(6_000, 18_000, size=len(lap_registration_ids), dtype=np.int64) * 10
+    order = rng.permutation(len(lap_registration_ids))
+    return {
+        "registration_ids": registration_ids,
+        "category_ids": category_ids,
+        "dnf": dnf,
+        "zero_point_category_ids": {1},
+        "lap_registration_ids": lap_registration_ids[order],
+        "laptimes_ms": laptimes_ms[order],
+        "points_definition": POINTS_DEFINITION,
+    }
+
+
+def compute_reference(registration_ids, category_ids, lap_registration_ids, laptimes_ms, result_type,
+                      event_phase_id=None, dnf=None, zero_point_category_ids=(), points_definition=()):
+    """
+    Stejná pravidla jako compute_phase_results, jen se slovníky a sorted().
+    """
+    registrations = {registration_id: (category_id, bool(dnf[index]) if dnf is not None else False)
+                     for index, (registration_id, category_id) in enumerate(zip(registration_ids.tolist(), category_ids.tolist()))}
+    totals = {}
+    for registration_id, laptime_ms in zip(lap_registration_ids.tolist(), laptimes_ms.tolist()):
+        if registration_id not in registrations:
+            continue
+        if result_type == "MIN":
+            totals[registration_id] = min(totals.get(registration_id, laptime_ms), laptime_ms)
+        else:
+            totals[registration_id] = totals.get(registration_id, 0) + laptime_ms
+
+    if result_type == "SUM":
+        table = dict(points_definition)
+    elif event_phase_id == QUALIFICATION_PHASE:
+        table = QUALIFICATION_POINTS
+    else:
+        table = {}
+
+    def sort_key(registration_id):
+        category_id, registration_dnf = registrations[registration_id]
+        return category_id, event_phase_id == RACE_PHASE and registration_dnf, totals[registration_id], registration_id
+
+    rows = []
+    position = 0
+    previous_category = None
+    for registration_id in sorted(totals, key=sort_key):
+        category_id = registrations[registration_id][0]
+        position = position + 1 if category_id == previous_category else 1
+        previous_category = category_id
+        rows.append({
+            "event_registration_id": registration_id,
+            "car_category_id": category_id,
+            "total_time_ms": totals[registration_id],
+            "position": position,
+            "points": 0 if category_id in zero_point_category_ids else table.get(position, 0),
+        })
+    return rows
+
+
+def measure(label, func, args):
+    durations = []
+    result = None
+    for iteration in range(args.warmup + args.iterations):
+        started = time.perf_counter()
+        result = func()
+        if iteration >= args.warmup:
+            durations.append(time.perf_counter() - started)
+    durations.sort()
+    p50 = statistics.median(durations) * 1000
+    p95 = durations[max(int(len(durations) * 0.95) - 1, 0)] * 1000
+    print(f"  {label:8} p50 {p50:9.2f} ms  p95 {p95:9.2f} ms")
+    return result, p50
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark výpočtu výsledků fáze v NumPy")
+    parser.add_argument("--registrations", type=int, default=10_000)
+    parser.add_argument("--laps", type=int, default=50, help="kol na registraci")
+    parser.add_argument("--categories", type=int, default=8)
+    parser.add_argument("--event-phase-id", type=int, default=3)
+    parser.add_argument("--result-type", choices=("MIN", "SUM"), default=None,
+                        help="výchozí podle fáze: 1 a 2 MIN, 3 SUM")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    result_type = args.result_type or ("SUM" if args.event_phase_id == RACE_PHASE else "MIN")
+    data = generate(args)
+    print(f"{args.registrations} registrací × {args.laps} kol = {len(data['laptimes_ms'])} kol, "
+          f"fáze {args.event_phase_id} ({result_type}), {args.iterations} opakování")
+
+    numpy_results, numpy_p50 = measure(
+        "numpy", lambda: compute_phase_results(result_type=result_type, event_phase_id=args.event_phase_id, **data), args)
+    reference_rows, python_p50 = measure(
+        "python", lambda: compute_reference(result_type=result_type, event_phase_id=args.event_phase_id, **data), args)
+    print(f"  zrychlení {python_p50 / numpy_p50:.1f}×")
+
+    numpy_rows = result_rows(numpy_results)
+    if numpy_rows != reference_rows:
+        mismatch = next((index for index, (a, b) in enumerate(zip(numpy_rows, reference_rows)) if a != b),
+                        min(len(numpy_rows), len(reference_rows)))
+        print(f"CHYBA: výsledky se liší od řádku {mismatch} (numpy {len(numpy_rows)}, python {len(reference_rows)} řádků)")
+        sys.exit(1)
+    print(f"OK, {len(numpy_rows)} výsledků shodných")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Porovná přepočet pořadí fáze nad řetězcovými časy (event_lap.laptime), nad celými
+milisekundami (event_lap.laptime_ms) a výpočtem v API (service/results_store.py,
+načtení kol, NumPy a zápis výsledků).
+
+Benchmark v jedné transakci vytvoří testovací závod s --drivers jezdci a --laps koly,
+změří původní a nový INSERT ... SELECT dřívější procedury UpdateActiveEventPhaseResults
+a výpočet v API a nakonec transakci vrátí (ROLLBACK),
+v databázi tedy nic nezůstane, jen se posunou AUTO_INCREMENT čítače.
+Předpokládá provedenou migraci migrations/001_time_ms.sql.
+
+Spouští se přímo proti databázi z .env.local, server API nemusí běžet:
+    python benchmarks/standings_recompute.py --laps 100000 --drivers 100 --event-phase-id 3 --iterations 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import close_connection_pool, prioritized_get_db_connection  # noqa: E402
+from service.results_store import compute_phase_rows, load_phase_data, write_phase_results  # noqa: E402
+from utilities.formatting import format_time_ms  # noqa: E402
+
+INSERT_BATCH = 1000
+
+DELETE_RESULTS = """DELETE FROM event_result
+    WHERE event_phase_id = %s
+    AND event_registration_id IN (SELECT id FROM event_registration WHERE event_id = %s);"""
+
+# Těla dřívější procedury UpdateActiveEventPhaseResults před migrací 001 a po ní
+RECOMPUTE = {
+    ("string", "MIN"): """INSERT INTO event_result (event_registration_id, event_phase_id, total_time, position)
+        SELECT er.id, %s, MIN(el.laptime),
+            ROW_NUMBER() OVER (PARTITION BY er.car_category_id ORDER BY MIN(el.laptime))
+        FROM event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE er.event_id = %s AND el.event_phase_id = %s
+        GROUP BY er.id, er.car_category_id
+        HAVING MIN(el.laptime) IS NOT NULL;""",
+    ("string", "SUM"): """INSERT INTO event_result (event_registration_id, event_phase_id, total_time, position)
+        SELECT er.id, %s, SEC_TO_TIME(SUM(TIME_TO_SEC(el.laptime))),
+            ROW_NUMBER() OVER (PARTITION BY er.car_category_id ORDER BY SUM(TIME_TO_SEC(el.laptime)))
+        FROM event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE er.event_id = %s AND el.event_phase_id = %s
+        GROUP BY er.id, er.car_category_id
+        HAVING SUM(TIME_TO_SEC(el.laptime)) IS NOT NULL;""",
+    ("ms", "MIN"): """INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, position)
+        SELECT er.id, %s, FormatTimeMs(MIN(el.laptime_ms)), MIN(el.laptime_ms),
+            ROW_NUMBER() OVER (PARTITION BY er.car_category_id ORDER BY MIN(el.laptime_ms))
+        FROM event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE er.event_id = %s AND el.event_phase_id = %s
+        GROUP BY er.id, er.car_category_id
+        HAVING MIN(el.laptime_ms) IS NOT NULL;""",
+    ("ms", "SUM"): """INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, position)
+        SELECT er.id, %s, FormatTimeMs(SUM(el.laptime_ms)), SUM(el.laptime_ms),
+            ROW_NUMBER() OVER (PARTITION BY er.car_category_id ORDER BY SUM(el.laptime_ms))
+        FROM event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE er.event_id = %s AND el.event_phase_id = %s
+        GROUP BY er.id, er.car_category_id
+        HAVING SUM(el.laptime_ms) IS NOT NULL;""",
+}
+
+
+async def create_dataset(cursor, args):
+    await cursor.execute("SELECT id FROM series ORDER BY id LIMIT 1;")
+    series_id = (await cursor.fetchone())["id"]
+    await cursor.execute("SELECT id FROM car ORDER BY id LIMIT 1;")
+    car_id = (await cursor.fetchone())["id"]
+    await cursor.execute("SELECT id FROM car_category ORDER BY id;")
+    category_ids = [row["id"] for row in await cursor.fetchall()]
+
+    await cursor.execute("""INSERT INTO event (name, number_of_laps, date, location, start_coordinates,
+        end_coordinates, event_phase_id, series_id) VALUES (%s, NULL, CURDATE(), %s, '', '', %s, %s);""",
+                         ("benchmark", "benchmark", args.event_phase_id, series_id))
+    event_id = cursor.lastrowid
+
+    registration_ids = []
+    for index in range(args.drivers):
+        await cursor.execute("""INSERT INTO driver (name, surname, birth_date, email, number, web_user, web_password)
+            VALUES (%s, %s, '2000-01-01', %s, %s, %s, '');""",
+                             ("Benchmark", str(index), f"bench{index}@example.com", str(index),
+                              f"benchmark-{event_id}-{index}"))
+        await cursor.execute("""INSERT INTO event_registration (driver_id, car_id, car_category_id, event_id)
+            VALUES (%s, %s, %s, %s);""",
+                             (cursor.lastrowid, car_id, category_ids[index % len(category_ids)], event_id))
+        registration_ids.append(cursor.lastrowid)
+
+    rng = random.Random(args.seed)
+    laps = []
+    for _ in range(args.laps):
+        laptime_ms = rng.randint(60_000, 180_000) // 10 * 10
+        laps.append((rng.choice(registration_ids), format_time_ms(laptime_ms), laptime_ms, args.event_phase_id))
+    for start in range(0, len(laps), INSERT_BATCH):
+        batch = laps[start:start + INSERT_BATCH]
+        await cursor.execute(
+            f"""INSERT INTO event_lap (event_registration_id, laptime, laptime_ms, event_phase_id)
+                VALUES {", ".join(["(%s, %s, %s, %s)"] * len(batch))};""",
+            tuple(value for lap in batch for value in lap))
+    return event_id
+
+
+def run_statements(cursor, statements):
+    async def run():
+        for command, values in statements:
+            await cursor.execute(command, values)
+    return run
+
+
+def run_engine(connection, event_id, event_phase_id):
+    async def run():
+        cursor = connection.cursor()
+        try:
+            await cursor.execute(DELETE_RESULTS, (event_phase_id, event_id))
+            data = await load_phase_data(cursor, event_id, event_phase_id)
+            await write_phase_results(cursor, event_id, event_phase_id, compute_phase_rows(data), with_points=True)
+        finally:
+            await cursor.close()
+    return run
+
+
+async def measure(cursor, label, run, args, event_id):
+    durations = []
+    for iteration in range(args.warmup + args.iterations):
+        started = time.perf_counter()
+        await run()
+        if iteration >= args.warmup:
+            durations.append(time.perf_counter() - started)
+
+    durations.sort()
+    p50 = statistics.median(durations) * 1000
+    p95 = durations[max(int(len(durations) * 0.95) - 1, 0)] * 1000
+    await cursor.execute("""SELECT COUNT(*) AS results FROM event_result er
+        INNER JOIN event_registration reg ON er.event_registration_id = reg.id
+        WHERE reg.event_id = %s AND er.event_phase_id = %s;""", (event_id, args.event_phase_id))
+    results = (await cursor.fetchone())["results"]
+    print(f"  {label:10} p50 {p50:8.2f} ms  p95 {p95:8.2f} ms  výsledků {results}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark přepočtu pořadí nad řetězcovými a číselnými časy")
+    parser.add_argument("--laps", type=int, default=100_000)
+    parser.add_argument("--drivers", type=int, default=100)
+    parser.add_argument("--event-phase-id", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    connection = await prioritized_get_db_connection(priority="high", read_only=False)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        await cursor.execute("SELECT result_type FROM event_phase WHERE id = %s;", (args.event_phase_id,))
+        result_type = (await cursor.fetchone())["result_type"]
+
+        started = time.perf_counter()
+        event_id = await create_dataset(cursor, args)
+        print(f"Testovací závod {event_id}: {args.drivers} jezdců, {args.laps} kol ve fázi {args.event_phase_id} "
+              f"({result_type}), vytvořeno za {time.perf_counter() - started:.1f} s")
+
+        delete = (DELETE_RESULTS, (args.event_phase_id, event_id))
+        recompute_values = (args.event_phase_id, event_id, args.event_phase_id)
+        print(f"Přepočet pořadí, {args.iterations} opakování")
+        await measure(cursor, "string", run_statements(cursor, [delete, (RECOMPUTE[("string", result_type)], recompute_values)]),
+                      args, event_id)
+        await measure(cursor, "ms", run_statements(cursor, [delete, (RECOMPUTE[("ms", result_type)], recompute_values)]),
+                      args, event_id)
+        await measure(cursor, "numpy", run_engine(connection, event_id, args.event_phase_id), args, event_id)
+    finally:
+        await connection.rollback()
+        await cursor.close()
+        await connection.close()
+        await close_connection_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
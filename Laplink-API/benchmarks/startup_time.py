@@ -0,0 +1,86 @@
+"""
+Měří dobu od spuštění workeru po první úspěšnou odpověď.
+
+Pro každý běh změří import modulu app v čistém interpretu, pak spustí samostatný
+proces uvicorn a opakovaně se dotazuje /health/live (worker přijímá požadavky)
+a /health/ready (worker má connection pool).
+
+    python benchmarks/startup_time.py --runs 5 --label after
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=API_DIR, check=True)
+    return time.perf_counter() - started
+
+
+def wait_for(url, started, timeout):
+    while time.perf_counter() - started < timeout:
+        try:
+            if requests.get(url, timeout=0.5).status_code == 200:
+                return time.perf_counter() - started
+        except requests.RequestException:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def measure_worker(args):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", "1", "--log-level", "warning"],
+        cwd=API_DIR,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        live = wait_for(f"{base_url}/health/live", started, args.timeout)
+        ready = wait_for(f"{base_url}/health/ready", started, args.timeout)
+        return live, ready
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def format_seconds(value):
+    return "timeout" if value is None else f"{value * 1000:8.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark startu workeru Laplink API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--label", default="run")
+    args = parser.parse_args()
+
+    imports, lives, readies = [], [], []
+    for run in range(1, args.runs + 1):
+        import_time = measure_import()
+        live, ready = measure_worker(args)
+        imports.append(import_time)
+        if live is not None:
+            lives.append(live)
+        if ready is not None:
+            readies.append(ready)
+        print(f"  běh {run}: import {format_seconds(import_time)}  live {format_seconds(live)}  ready {format_seconds(ready)}")
+
+    print(f"[{args.label}] medián z {args.runs} běhů")
+    print(f"  import app          {format_seconds(statistics.median(imports))}")
+    print(f"  první odpověď       {format_seconds(statistics.median(lives) if lives else None)}")
+    print(f"  připraven (pool)    {format_seconds(statistics.median(readies) if readies else None)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,497 @@
 import os
+import time
+import asyncio
+import logging
 from dotenv import load_dotenv
-import mysql.connector.pooling
-import queue
+import asyncmy
+from asyncmy.cursors import DictCursor
+from asyncmy.errors import MySQLError
+from fastapi import HTTPException
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+from service.metrics import Counter, Gauge, Histogram, current_route
+from service.query_stats import record_query
+from db.prepared import PREPARED_STATEMENTS, prepared_statement_cache
 
 load_dotenv('.env.local')
 
+logger = logging.getLogger(__name__)
+
 
 db_config = {
     'host': os.getenv("DB_HOST"),
     'user': os.getenv("DB_USER"),
     'password': os.getenv("DB_PASSWORD"),
     'database': os.getenv("DB_DATABASE"),
-    'port': os.getenv("DB_PORT", 3306),
+    'port': int(os.getenv("DB_PORT", 3306)),
+}
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+# Kolik připojení se otevře hned při vytvoření poolu, ostatní se otevírají podle potřeby
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))
+# Počet připojení, která smí použít jen požadavky s prioritou high (zápis kol, průběžné výsledky)
+POOL_HIGH_RESERVED = int(os.getenv("DB_POOL_HIGH_RESERVED", 2))
+# Maximální doba čekání na volné připojení v sekundách, poté se vrací 503
+POOL_ACQUIRE_TIMEOUT = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", 10))
+# Počet pokusů o vytvoření poolu při startu (0 = zkoušet, dokud se databáze neozve)
+POOL_INIT_RETRIES = int(os.getenv("DB_POOL_INIT_RETRIES", 0))
+POOL_INIT_BACKOFF_MAX = float(os.getenv("DB_POOL_INIT_BACKOFF_MAX", 30))
+
+# Volitelná read replika. Pokud není DB_REPLICA_HOST nastaven, vše jde na primární server.
+replica_db_config = {
+    'host': os.getenv("DB_REPLICA_HOST"),
+    'user': os.getenv("DB_REPLICA_USER", db_config['user']),
+    'password': os.getenv("DB_REPLICA_PASSWORD", db_config['password']),
+    'database': os.getenv("DB_REPLICA_DATABASE", db_config['database']),
+    'port': int(os.getenv("DB_REPLICA_PORT", db_config['port'])),
 }
+REPLICA_ENABLED = bool(replica_db_config['host'])
+REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", POOL_SIZE))
+# Replika zpožděná víc než tento počet sekund se nepoužívá
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+# Jak často se ověřuje dostupnost a zpoždění repliky
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))
+# Jak dlouho čtení čeká na volné připojení repliky, poté ho hned obslouží primární server
+REPLICA_ACQUIRE_TIMEOUT = float(os.getenv("DB_REPLICA_ACQUIRE_TIMEOUT", 0))
+
+PRIORITIES = ("high", "low")
+
+# Asynchronní connection pooly, vytváří se až při prvním použití uvnitř event loopu
+connection_pool = None
+replica_pool = None
+replica_state = {"healthy": REPLICA_ENABLED, "lag_seconds": None, "checked_at": 0.0}
+pool_state = {"status": "pending", "attempts": 0, "last_error": None, "ready_at": None}
+_pool_lock = asyncio.Lock()
+
+
+def _active_pools():
+    return [pool for pool in (connection_pool, replica_pool) if pool is not None]
+
+
+def _collect_pool_gauge(attribute):
+    return {
+        (pool.name, priority): value
+        for pool in _active_pools()
+        for priority, value in getattr(pool, attribute).items()
+    }
+
+
+POOL_CHECKOUTS = Counter(
+    "laplink_db_pool_checkouts_total", "Počet zapůjčení připojení z poolu.", ("pool", "priority", "route"))
+POOL_TIMEOUTS = Counter(
+    "laplink_db_pool_timeouts_total", "Počet požadavků, které nedostaly připojení včas.", ("pool", "priority", "route"))
+POOL_WAIT_SECONDS = Histogram(
+    "laplink_db_pool_wait_seconds", "Doba čekání na připojení z poolu.", ("pool", "priority", "route"))
+POOL_HOLD_SECONDS = Histogram(
+    "laplink_db_pool_hold_seconds", "Doba, po kterou požadavek drží připojení.", ("pool", "priority", "route"))
+POOL_IN_USE = Gauge(
+    "laplink_db_pool_in_use", "Aktuálně zapůjčená připojení.", ("pool", "priority"),
+    collect=lambda: _collect_pool_gauge("in_use_by_priority"))
+POOL_WAITING = Gauge(
+    "laplink_db_pool_waiting", "Požadavky čekající na připojení.", ("pool", "priority"),
+    collect=lambda: _collect_pool_gauge("waiting"))
+POOL_SIZE_GAUGE = Gauge(
+    "laplink_db_pool_size", "Velikost connection poolu.", ("pool",),
+    collect=lambda: {(pool.name,): pool.size for pool in _active_pools()})
+REPLICA_FALLBACKS = Counter(
+    "laplink_db_replica_fallbacks_total", "Čtení přesměrovaná z repliky na primární server (lagging, unavailable, busy).", ("reason",))
+REPLICA_LAG = Gauge(
+    "laplink_db_replica_lag_seconds", "Poslední naměřené zpoždění repliky.",
+    collect=lambda: {(): replica_state["lag_seconds"]} if replica_state["lag_seconds"] is not None else {})
+
+
+class AsyncCursor:
+    """
+    Obal nad kurzorem asyncmy se stejným rozhraním jako kurzor mysql.connector,
+    jen jsou operace nad databází awaitable.
+    Kurzor vytvořený s prepared=True posílá parametrizované dotazy přes cache prepared statementů připojení.
+    """
+
+    def __init__(self, connection, cursor, prepared=False):
+        self._connection = connection
+        self._cursor = cursor
+        self.prepared = prepared and PREPARED_STATEMENTS
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    async def execute(self, operation, params=None):
+        self._connection.in_transaction = True
+        started = time.perf_counter()
+        if self.prepared and isinstance(params, (tuple, list)):
+            result = await self._connection.prepared_statements().execute(
+                self._connection.raw_connection, self._cursor, operation, params
+            )
+        else:
+            result = await self._cursor.execute(operation, params)
+        record_query(operation, self._connection.route, time.perf_counter() - started, self._cursor.rowcount)
+        return result
+
+    async def executemany(self, operation, seq_params):
+        self._connection.in_transaction = True
+        started = time.perf_counter()
+        result = await self._cursor.executemany(operation, seq_params)
+        record_query(operation, self._connection.route, time.perf_counter() - started, self._cursor.rowcount)
+        return result
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return await self._cursor.fetchall()
+
+    async def close(self):
+        await self._cursor.close()
+
 
-# Vytvoření connection poolu
-connection_pool = mysql.connector.pooling.MySQLConnectionPool(
-    pool_name="laplink_pool",
-    pool_size=10,
-    **db_config
-)
+class AsyncPooledConnection:
+    """
+    Připojení zapůjčené z poolu. Metoda close() ho vrací zpět do poolu,
+    stejně jako u PooledMySQLConnection z mysql.connector.
+    """
+
+    def __init__(self, pool, connection, priority="low", route="background"):
+        self._pool = pool
+        self._connection = connection
+        self.priority = priority
+        self.route = route
+        self.in_transaction = False
+        self._acquired_at = time.monotonic()
+
+    @property
+    def raw_connection(self):
+        return self._connection
+
+    def prepared_statements(self):
+        return prepared_statement_cache(self._connection)
+
+    def cursor(self, dictionary=False, prepared=False):
+        cursor = self._connection.cursor(DictCursor) if dictionary else self._connection.cursor()
+        return AsyncCursor(self, cursor, prepared)
+
+    async def commit(self):
+        await self._connection.commit()
+        self.in_transaction = False
 
-high_priority_queue = queue.Queue()
-low_priority_queue = queue.Queue()
+    async def rollback(self):
+        await self._connection.rollback()
+        self.in_transaction = False
 
-def get_db_connection():
+    async def close(self):
+        """
+        Vrátí připojení do poolu. Neuzavřená transakce se před vrácením odroluje,
+        aby si další požadavek nepřevzal cizí snapshot nebo zámky.
+        """
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        try:
+            if self.in_transaction:
+                await connection.rollback()
+        except Exception:
+            connection.close()
+        finally:
+            await self._pool.release(connection, self.priority)
+            POOL_HOLD_SECONDS.observe(
+                time.monotonic() - self._acquired_at, pool=self._pool.name, priority=self.priority, route=self.route
+            )
+
+
+class PrioritizedConnectionPool:
     """
-    Získání připojení z poolu.
+    Pool s prioritizací požadavků nad poolem asyncmy.
+
+    Čekající požadavky parkují na podmínce. Požadavky s prioritou high se obslouží
+    dříve než low a posledních `reserved_high` připojení mohou dostat jen ony.
+    Pokud se připojení nepodaří získat do `acquire_timeout` sekund, vrací se 503.
     """
+
+    def __init__(self, pool, size, reserved_high, acquire_timeout, name="primary"):
+        self._pool = pool
+        self.name = name
+        self.size = size
+        self.reserved_high = max(0, min(reserved_high, size - 1))
+        self.acquire_timeout = acquire_timeout
+        self.in_use = 0
+        self.in_use_by_priority = {priority: 0 for priority in PRIORITIES}
+        self.waiting = {priority: 0 for priority in PRIORITIES}
+        self.stats = {
+            priority: {"acquired": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for priority in PRIORITIES
+        }
+        self._condition = asyncio.Condition()
+
+    def _can_acquire(self, priority):
+        if priority == "high":
+            return self.in_use < self.size
+        return self.waiting["high"] == 0 and self.in_use < self.size - self.reserved_high
+
+    async def acquire(self, priority="low", route="background", timeout=None):
+        """
+        Získá připojení, bez timeout čeká nejvýše acquire_timeout sekund. S timeout=0
+        připojení vrátí, jen pokud je hned volné.
+        """
+        started = time.monotonic()
+
+        async with self._condition:
+            self.waiting[priority] += 1
+            try:
+                if not self._can_acquire(priority):
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._can_acquire(priority)),
+                        self.acquire_timeout if timeout is None else timeout
+                    )
+            except asyncio.TimeoutError:
+                self.stats[priority]["timeouts"] += 1
+                POOL_TIMEOUTS.inc(pool=self.name, priority=priority, route=route)
+                raise HTTPException(
+                    status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Všechna připojení jsou momentálně obsazena. Zkuste to prosím později.",
+                    headers={"Retry-After": "1"},
+                )
+            finally:
+                self.waiting[priority] -= 1
+                # Po odchodu čekajícího high mohou být na řadě požadavky low
+                self._condition.notify_all()
+            self.in_use += 1
+            self.in_use_by_priority[priority] += 1
+
+        try:
+            connection = await self._pool.acquire()
+        except BaseException:
+            await self._free_slot(priority)
+            raise
+
+        waited = time.monotonic() - started
+        stats = self.stats[priority]
+        stats["acquired"] += 1
+        stats["wait_seconds_total"] += waited
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+        POOL_CHECKOUTS.inc(pool=self.name, priority=priority, route=route)
+        POOL_WAIT_SECONDS.observe(waited, pool=self.name, priority=priority, route=route)
+        return connection
+
+    async def release(self, connection, priority="low"):
+        self._pool.release(connection)
+        await self._free_slot(priority)
+
+    async def _free_slot(self, priority):
+        async with self._condition:
+            self.in_use -= 1
+            self.in_use_by_priority[priority] -= 1
+            self._condition.notify_all()
+
+    def close(self):
+        self._pool.close()
+
+    async def wait_closed(self):
+        await self._pool.wait_closed()
+
+
+async def _create_pool(config, size, reserved_high, name):
+    pool = await asyncmy.create_pool(
+        minsize=min(POOL_MIN_SIZE, size),
+        maxsize=size,
+        pool_recycle=POOL_RECYCLE,
+        autocommit=False,
+        **config
+    )
+    return PrioritizedConnectionPool(pool, size, reserved_high, POOL_ACQUIRE_TIMEOUT, name)
+
+
+async def get_connection_pool():
+    """
+    Vrátí connection pool primárního serveru, při prvním volání ho vytvoří.
+    """
+    global connection_pool
+    if connection_pool is None:
+        async with _pool_lock:
+            if connection_pool is None:
+                connection_pool = await _create_pool(db_config, POOL_SIZE, POOL_HIGH_RESERVED, "primary")
+                pool_state.update(status="ready", last_error=None, ready_at=time.time())
+    return connection_pool
+
+
+async def init_connection_pool():
+    """
+    Vytvoří pool primárního serveru při startu aplikace. Pokud databáze není dostupná,
+    zkouší to znovu s exponenciálně rostoucí pauzou, aplikace mezitím běží a vrací 503.
+    """
+    delay = 0.5
+    while connection_pool is None:
+        pool_state["attempts"] += 1
+        try:
+            await get_connection_pool()
+        except (MySQLError, OSError) as e:
+            pool_state.update(status="retrying", last_error=str(e))
+            if POOL_INIT_RETRIES and pool_state["attempts"] >= POOL_INIT_RETRIES:
+                pool_state["status"] = "failed"
+                logger.error(f"Connection pool se nepodařilo vytvořit po {pool_state['attempts']} pokusech: {e}")
+                return None
+            logger.warning(f"Databáze není dostupná (pokus {pool_state['attempts']}), další pokus za {delay:.1f} s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POOL_INIT_BACKOFF_MAX)
+    return connection_pool
+
+
+async def get_replica_pool():
+    """
+    Vrátí connection pool read repliky, při prvním volání ho vytvoří.
+    Replika obsluhuje jen čtení s prioritou low, proto nemá rezervu pro high.
+    """
+    global replica_pool
+    if replica_pool is None:
+        async with _pool_lock:
+            if replica_pool is None:
+                replica_pool = await _create_pool(replica_db_config, REPLICA_POOL_SIZE, 0, "replica")
+    return replica_pool
+
+
+async def _read_replica_lag(pool):
+    """
+    Vrátí zpoždění repliky v sekundách, nebo None, pokud replikace neběží.
+    Server, který není replikou (např. lokální testovací instance), má zpoždění 0.
+    """
+    connection = await pool.acquire("low", "replica-health", timeout=REPLICA_ACQUIRE_TIMEOUT)
     try:
-        return connection_pool.get_connection()
-    except mysql.connector.Error as e:
-        raise Exception(f"Chyba při získávání připojení k databázi: {e}")
+        async with connection.cursor(DictCursor) as cursor:
+            try:
+                await cursor.execute("SHOW REPLICA STATUS")
+            except MySQLError:
+                await cursor.execute("SHOW SLAVE STATUS")
+            status = await cursor.fetchone()
+        await connection.rollback()
+    finally:
+        await pool.release(connection, "low")
+
+    if not status:
+        return 0.0
+    lag = status.get("Seconds_Behind_Master", status.get("Seconds_Behind_Source"))
+    return None if lag is None else float(lag)
+
 
-def prioritized_get_db_connection(priority="low"):
+def _mark_replica_unhealthy(reason):
+    replica_state["healthy"] = False
+    replica_state["checked_at"] = time.monotonic()
+    REPLICA_FALLBACKS.inc(reason=reason)
+
+
+async def _replica_is_usable():
     """
-    Získá připojení z poolu s prioritizací požadavků.
+    Ověří (nejvýše jednou za REPLICA_CHECK_INTERVAL), zda je replika dostupná a dostatečně aktuální.
     """
-    if priority == "high":
-        high_priority_queue.put(None)
+    if not REPLICA_ENABLED:
+        return False
+    now = time.monotonic()
+    if now - replica_state["checked_at"] < REPLICA_CHECK_INTERVAL:
+        return replica_state["healthy"]
+
+    replica_state["checked_at"] = now
+    try:
+        lag = await _read_replica_lag(await get_replica_pool())
+    except HTTPException:
+        # Vytížená replika není nedostupná, ponechá se poslední známý stav
+        return replica_state["healthy"]
+    except (MySQLError, OSError):
+        replica_state["healthy"] = False
+        replica_state["lag_seconds"] = None
+        return False
+
+    replica_state["lag_seconds"] = lag
+    replica_state["healthy"] = lag is not None and lag <= REPLICA_MAX_LAG
+    return replica_state["healthy"]
+
+
+async def close_connection_pool():
+    """
+    Uzavře connection pooly při ukončení aplikace.
+    """
+    global connection_pool, replica_pool
+    for pool in _active_pools():
+        pool.close()
+        await pool.wait_closed()
+    connection_pool = None
+    replica_pool = None
+    pool_state.update(status="closed", ready_at=None)
+
+
+def _pool_stats(pool):
+    return {
+        "size": pool.size,
+        "in_use": pool.in_use,
+        "waiting": dict(pool.waiting),
+        "priorities": {priority: dict(stats) for priority, stats in pool.stats.items()},
+    }
+
+
+def get_pool_stats():
+    """
+    Vrátí stav poolu a čítače čekání na připojení rozdělené podle priority.
+    """
+    if connection_pool is None:
+        stats = {"size": POOL_SIZE, "in_use": 0, "waiting": {}, "priorities": {}}
     else:
-        low_priority_queue.put(None)
+        stats = _pool_stats(connection_pool)
+    stats["state"] = dict(pool_state)
+    if REPLICA_ENABLED:
+        stats["replica"] = _pool_stats(replica_pool) if replica_pool else {}
+        stats["replica"].update(healthy=replica_state["healthy"], lag_seconds=replica_state["lag_seconds"])
+    return stats
+
+
+async def get_db_connection():
+    """
+    Získání připojení z poolu primárního serveru.
+    """
+    return await prioritized_get_db_connection(priority="low", read_only=False)
+
+
+async def prioritized_get_db_connection(priority="low", read_only=None):
+    """
+    Získá připojení z poolu s prioritizací požadavků.
+    Požadavek čeká bez blokování event loopu, high má přednost před low.
+    Po vypršení POOL_ACQUIRE_TIMEOUT vyhodí HTTPException 503.
 
-    while not high_priority_queue.empty() or not low_priority_queue.empty():
+    Čtení s prioritou low jdou na read repliku, pokud je nastavená, dostupná
+    a nezaostává víc než REPLICA_MAX_LAG. Pokud replika nemá volné připojení do
+    REPLICA_ACQUIRE_TIMEOUT, čtení hned obslouží primární server. Handlery, které s prioritou low zapisují,
+    musí předat read_only=False. Priorita high jde vždy na primární server.
+    """
+    priority = "high" if priority == "high" else "low"
+    if read_only is None:
+        read_only = priority == "low"
+    replica_read = read_only and priority == "low"
+    route = current_route()
+
+    if replica_read and await _replica_is_usable():
         try:
-            if not high_priority_queue.empty():
-                high_priority_queue.get()
-                return get_db_connection()
-            elif not low_priority_queue.empty():
-                low_priority_queue.get()
-                return get_db_connection()
-        except mysql.connector.pooling.PoolError:
-            pass
-
-    raise Exception("Všechna připojení jsou momentálně obsazena. Zkuste to prosím později.")
+            pool = await get_replica_pool()
+            connection = await pool.acquire(priority, route, timeout=REPLICA_ACQUIRE_TIMEOUT)
+            return AsyncPooledConnection(pool, connection, priority, route)
+        except HTTPException:
+            # Vytížená replika (bez volného připojení do REPLICA_ACQUIRE_TIMEOUT), čtení obslouží primární server
+            REPLICA_FALLBACKS.inc(reason="busy")
+        except (MySQLError, OSError):
+            _mark_replica_unhealthy("unavailable")
+    elif replica_read and REPLICA_ENABLED:
+        REPLICA_FALLBACKS.inc(reason="lagging" if replica_state["lag_seconds"] is not None else "unavailable")
+
+    try:
+        pool = await get_connection_pool()
+    except (MySQLError, OSError) as e:
+        pool_state.update(status="retrying", last_error=str(e))
+        raise HTTPException(
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Databáze je momentálně nedostupná. Zkuste to prosím později.",
+            headers={"Retry-After": "5"},
+        )
+    try:
+        connection = await pool.acquire(priority, route)
+    except MySQLError as e:
+        raise Exception(f"Chyba při získávání připojení k databázi: {e}")
+    return AsyncPooledConnection(pool, connection, priority, route)
@@ -0,0 +1,100 @@
+"""
+Cache serverových prepared statementů pro jednotlivá připojení z poolu.
+
+asyncmy nemá binární protokol pro prepared statementy (obdobu MySQLCursorPrepared
+z mysql.connector), proto se používají SQL příkazy PREPARE / EXECUTE. MariaDB
+v EXECUTE ... USING přijímá přímo hodnoty, takže opakované volání stojí jeden round trip
+a server už dotaz znovu neparsuje ani neoptimalizuje.
+
+Cache je klíčovaná textem SQL dotazu. Připojení z poolu žijí dlouho, proto má omezenou
+velikost a nejdéle nepoužité statementy uvolňuje přes DEALLOCATE PREPARE.
+"""
+import os
+import re
+import weakref
+from collections import OrderedDict
+
+from asyncmy.errors import MySQLError
+
+from service.metrics import Counter
+
+# Vypínač pro případ problémů na produkci (DB_PREPARED_STATEMENTS=0)
+PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "1").lower() not in ("0", "false", "no")
+PREPARED_CACHE_SIZE = int(os.getenv("DB_PREPARED_CACHE_SIZE", 64))
+
+# ER_UNKNOWN_STMT_HANDLER - server statement nezná (např. po znovupřipojení)
+_UNKNOWN_STMT_HANDLER = 1243
+_PLACEHOLDER = re.compile(r"%([%s])")
+
+PREPARED_EVENTS = Counter(
+    "laplink_db_prepared_statements_total",
+    "Použití cache prepared statementů (hit, miss, evict).", ("event",))
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def to_server_placeholders(operation):
+    """
+    Převede zástupné znaky %s používané v aplikaci na ? pro PREPARE a %% na %.
+    """
+    return _PLACEHOLDER.sub(lambda match: "%" if match.group(1) == "%" else "?", operation)
+
+
+class PreparedStatementCache:
+    """
+    LRU cache prepared statementů jednoho připojení k databázi.
+    """
+
+    def __init__(self, size=PREPARED_CACHE_SIZE):
+        self.size = size
+        self._statements = OrderedDict()
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._statements)
+
+    async def _prepare(self, connection, cursor, operation):
+        self._counter += 1
+        name = f"laplink_stmt_{self._counter}"
+        await cursor.execute(f"PREPARE {name} FROM {connection.escape(to_server_placeholders(operation))}")
+        self._statements[operation] = name
+        PREPARED_EVENTS.inc(event="miss")
+
+        while len(self._statements) > self.size:
+            _, evicted = self._statements.popitem(last=False)
+            await cursor.execute(f"DEALLOCATE PREPARE {evicted}")
+            PREPARED_EVENTS.inc(event="evict")
+        return name
+
+    async def execute(self, connection, cursor, operation, params=None):
+        """
+        Provede dotaz přes prepared statement, při prvním použití ho na serveru připraví.
+        """
+        name = self._statements.get(operation)
+        if name is None:
+            name = await self._prepare(connection, cursor, operation)
+        else:
+            self._statements.move_to_end(operation)
+            PREPARED_EVENTS.inc(event="hit")
+
+        using = ""
+        if params:
+            using = " USING " + ", ".join(connection.escape(param) for param in params)
+        try:
+            return await cursor.execute(f"EXECUTE {name}{using}")
+        except MySQLError as e:
+            if not e.args or e.args[0] != _UNKNOWN_STMT_HANDLER:
+                raise
+            self._statements.pop(operation, None)
+            name = await self._prepare(connection, cursor, operation)
+            return await cursor.execute(f"EXECUTE {name}{using}")
+
+
+def prepared_statement_cache(connection):
+    """
+    Vrátí cache prepared statementů pro dané (nezabalené) připojení asyncmy.
+    """
+    cache = _caches.get(connection)
+    if cache is None:
+        cache = _caches[connection] = PreparedStatementCache()
+    return cache
@@ -0,0 +1,92 @@
+"""
+FastAPI závislost, která požadavku přidělí jedno připojení a jeden kurzor.
+
+Použití v handleru:
+
+    @router.get("/...")
+    async def handler(api_key: APIKey = Depends(auth.get_api_key),
+                      db: DbSession = Depends(db_session("low"))):
+        await db.execute("SELECT ...", (...))
+        rows = await db.fetchall()
+        await db.release()
+        return rows
+
+Připojení se vrací do poolu voláním `release()` hned po posledním dotazu, takže
+serializace odpovědi ani další await (např. WebSocket notifikace) ho zbytečně nedrží.
+Pokud handler `release()` nezavolá, uvolní připojení závislost po doběhnutí handleru.
+Nepotvrzená transakce se při uvolnění vždy vrátí zpět.
+"""
+from db.connection import prioritized_get_db_connection
+
+
+class DbSession:
+    def __init__(self, connection, dictionary=True, prepared=False):
+        self._connection = connection
+        self._cursor = connection.cursor(dictionary=dictionary, prepared=prepared)
+
+    @property
+    def released(self):
+        return self._connection is None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def _require_connection(self):
+        if self._connection is None:
+            raise RuntimeError("Připojení k databázi už bylo vráceno do poolu")
+
+    async def execute(self, operation, params=None):
+        self._require_connection()
+        return await self._cursor.execute(operation, params)
+
+    async def executemany(self, operation, seq_params):
+        self._require_connection()
+        return await self._cursor.executemany(operation, seq_params)
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return await self._cursor.fetchall()
+
+    async def commit(self):
+        self._require_connection()
+        await self._connection.commit()
+
+    async def rollback(self):
+        if self._connection is not None:
+            await self._connection.rollback()
+
+    async def release(self):
+        """
+        Zavře kurzor a vrátí připojení do poolu. Opakované volání nic nedělá.
+        """
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            await self._cursor.close()
+        finally:
+            await connection.close()
+
+
+def db_session(priority="low", read_only=None, dictionary=True, prepared=False):
+    """
+    Vytvoří závislost, která pro každý požadavek otevře DbSession se zadanou prioritou.
+    Parametry priority a read_only mají stejný význam jako u prioritized_get_db_connection,
+    prepared=True posílá dotazy přes cache prepared statementů.
+    """
+    async def dependency():
+        connection = await prioritized_get_db_connection(priority=priority, read_only=read_only)
+        session = DbSession(connection, dictionary=dictionary, prepared=prepared)
+        try:
+            yield session
+        finally:
+            await session.release()
+
+    return dependency
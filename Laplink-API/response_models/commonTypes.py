@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -67,6 +67,9 @@ class PostLapData(BaseModel):
     web_user: str = Field(..., example="dominik")
     laptime: str = Field(..., example="00:01:30.00")
     event_phase_id: int = Field(..., example=1)
+    client_lap_id: Optional[str] = Field(None, min_length=1, max_length=64, example="7b0e4f52-3c1d-4d8e-9a51-2f7f3c8b1e0a")
+class PostLapDataBatch(BaseModel):
+    laps: List[PostLapData] = Field(..., min_length=1, max_length=1000)
 class RegisterDriverToEvent(BaseModel):
     driver_id: int = Field(..., example=1)
     car_id: int = Field(..., example=1)
@@ -21,6 +21,25 @@ class PutResponseModel(BaseModel):
 class DeleteResponseModel(BaseModel):
     status: str
     message: str
+class PostLapResponseModel(BaseModel):
+    status: str
+    message: str
+    lap_id: Optional[int] = None
+    laptime: Optional[str] = None
+    event_phase_id: Optional[int] = None
+    duplicate: bool = False
+class LapBatchItemResponseModel(BaseModel):
+    index: int
+    status: str
+    detail: Optional[str] = None
+    lap_id: Optional[int] = None
+class LapBatchResponseModel(BaseModel):
+    status: str
+    message: str
+    inserted: int
+    duplicates: int = 0
+    rejected: int
+    results: List[LapBatchItemResponseModel]
 class RaceResponseModel(BaseModel):
     id: int
     name: str
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.security.api_key import APIKey
+
+from db.connection import get_pool_stats
+from service.query_stats import get_query_stats, reset_query_stats
+from service.result_cache import result_cache, RESULT_CACHE_ENABLED, RESULT_CACHE_TTL
+from service.leader import results_leader
+from service.scheduler import scheduler_service
+import service.auth as auth
+
+router = APIRouter()
+
+@router.get("/db/queries")
+async def get_db_query_stats(
+    limit: int = Query(50, ge=1, le=500),
+    order_by: str = Query("total", pattern="^(total|p95|max|count)$"),
+    api_key: APIKey = Depends(auth.get_api_key)
+):
+    '''
+        Vrátí agregace SQL dotazů podle otisku (počet, p50, p95, max) a routy, ze kterých se volají.
+    '''
+    return get_query_stats(limit=limit, order_by=order_by)
+
+@router.delete("/db/queries")
+async def reset_db_query_stats(api_key: APIKey = Depends(auth.get_api_key)):
+    '''
+        Vynuluje agregace SQL dotazů, např. před začátkem závodu.
+    '''
+    reset_query_stats()
+    return {"status": "success", "message": "Query statistics reset"}
+
+@router.get("/db/pool")
+async def get_db_pool_stats(api_key: APIKey = Depends(auth.get_api_key)):
+    '''
+        Vrátí stav connection poolů a čítače čekání podle priority.
+    '''
+    return get_pool_stats()
+
+@router.get("/cache")
+async def get_result_cache_stats(api_key: APIKey = Depends(auth.get_api_key)):
+    '''
+        Vrátí stav cache výsledků (počet záznamů, zásahy a výpadky od startu).
+    '''
+    requests = result_cache.hits + result_cache.misses
+    return {
+        "enabled": RESULT_CACHE_ENABLED,
+        "ttl_seconds": RESULT_CACHE_TTL,
+        "entries": len(result_cache),
+        "hits": result_cache.hits,
+        "misses": result_cache.misses,
+        "hit_ratio": round(result_cache.hits / requests, 3) if requests else None,
+    }
+
+@router.delete("/cache")
+async def clear_result_cache(api_key: APIKey = Depends(auth.get_api_key)):
+    '''
+        Vyprázdní cache výsledků.
+    '''
+    result_cache.clear()
+    return {"status": "success", "message": "Result cache cleared"}
+
+
+@router.get("/jobs")
+async def get_scheduler_jobs(api_key: APIKey = Depends(auth.get_api_key)):
+    '''
+        Vrátí úlohy plánovače tohoto workeru: interval, příští a poslední běh, dobu běhu,
+        počet změněných řádků (poslední běh a celkem), chyby a přeskočené běhy.
+        Průběžné výsledky fáze běží jen ve workeru, který ji vede (leading).
+    '''
+    return {
+        "running": scheduler_service.running,
+        "leading": [{"event_id": event_id, "event_phase_id": event_phase_id}
+                    for event_id, event_phase_id in sorted(results_leader.held)],
+        "jobs": scheduler_service.jobs(),
+    }
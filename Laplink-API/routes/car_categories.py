@@ -6,6 +6,7 @@ from db.connection import prioritized_get_db_connection
 from response_models.response_models import PostResponseModel, CarCategoryResponseModel
 from response_models.commonTypes import CreateCarCategory, CarCategory
 import service.auth as auth
+from service.result_cache import cached, invalidate_tags
 
 router = APIRouter()
 
@@ -14,71 +15,75 @@ async def create_car_category(data: CreateCarCategory, api_key: APIKey = Depends
     """
         Vytvoří novou kategorii aut.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """INSERT INTO car_category (name, description) VALUES (%s, %s);"""
-        cursor.execute(command, (data.name, data.description))
-        db_connection.commit()
+        await cursor.execute(command, (data.name, data.description))
+        await db_connection.commit()
+        invalidate_tags("car_categories")
         return JSONResponse(content={"status": "success", "message": "Car category created successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/car/categories", response_model=List[CarCategoryResponseModel])
+@cached(tags=lambda **_: ("car_categories",))
 async def get_car_categories(api_key: APIKey = Depends(auth.get_api_key)):
     """
         Vrátí všechny kategorie aut.
     """
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car_category;")
-        result = cursor.fetchall()
+        await cursor.execute("SELECT * FROM car_category;")
+        result = await cursor.fetchall()
 
         return JSONResponse(content={"data": result})
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/car/category/{id}", response_model=PostResponseModel)
 async def update_car_category(id: int, data: CarCategory, api_key: APIKey = Depends(auth.get_api_key)):
     """
         Aktualizuje kategorii aut podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """UPDATE car_category SET name = %s, description = %s WHERE id = %s;"""
-        cursor.execute(command, (data.name, data.description, id))
-        db_connection.commit()
+        await cursor.execute(command, (data.name, data.description, id))
+        await db_connection.commit()
+        invalidate_tags("car_categories", "results", "rankings")
         return JSONResponse(content={"status": "success", "message": "Car category updated successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/car-categories/{car_category_id}", response_model=CarCategoryResponseModel)
+@cached(tags=lambda **_: ("car_categories",))
 async def get_car_category(car_category_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     """
         Vrátí kategorii auta podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car_category WHERE id = %s", (car_category_id,))
-        car_category = cursor.fetchone()
+        await cursor.execute("SELECT * FROM car_category WHERE id = %s", (car_category_id,))
+        car_category = await cursor.fetchone()
 
         if not car_category:
             raise HTTPException(status_code=404, detail="Car category not found")
@@ -87,5 +92,5 @@ async def get_car_category(car_category_id: int, api_key: APIKey = Depends(auth.
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
@@ -10,6 +10,7 @@ from response_models.response_models import CarResponseModel, CarConfigurationRe
     PostResponseReturnIdModel, CarModel, PutResponseModel, CarConfiguration, DeleteResponseModel
 from response_models.commonTypes import CreateCar, CreateCarConfiguration
 import service.auth as auth
+from service.result_cache import invalidate_tags
 
 router = APIRouter()
 
@@ -18,32 +19,32 @@ async def create_car(data: CreateCar, api_key: APIKey = Depends(auth.get_api_key
     """
     Vytvoří nové auto.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """INSERT INTO car (maker, type, note, default_driver_id) VALUES (%s, %s, %s, %s);"""
-        cursor.execute(command, (data.maker, data.type, data.note, data.default_driver_id))
+        await cursor.execute(command, (data.maker, data.type, data.note, data.default_driver_id))
 
         command = """SELECT LAST_INSERT_ID();"""
-        cursor.execute(command)
-        car_id = cursor.fetchone()[0]
+        await cursor.execute(command)
+        car_id = (await cursor.fetchone())[0]
 
-        db_connection.commit()
+        await db_connection.commit()
         return JSONResponse(content={"status": "success", "message": "Car created successfully", "car_id": car_id})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.post("/create/car/configuration", response_model=PostResponseReturnIdModel)
 async def create_car_configuration(data: CreateCarConfiguration, api_key: APIKey = Depends(auth.get_api_key)):
     """
     Vytvoří konfiguraci auta.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
@@ -54,7 +55,7 @@ async def create_car_configuration(data: CreateCarConfiguration, api_key: APIKey
             (note, power, weight, power_weight_ratio, aero_upgrade, excessive_modifications, excessive_chamber, liquid_leakage, rear_lights, safe, street_legal_tires, seat, seatbelt, widebody, wide_tires) 
             VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
         """
-        cursor.execute(command, (
+        await cursor.execute(command, (
             data.note, data.power, data.weight, data.power_weight_ratio,
             data.aero_upgrade, data.excessive_modifications,
             data.excessive_chamber, data.liquid_leakage, data.rear_lights,
@@ -63,33 +64,33 @@ async def create_car_configuration(data: CreateCarConfiguration, api_key: APIKey
         ))
 
         command = """SELECT LAST_INSERT_ID();"""
-        cursor.execute(command)
-        car_configuration_id = cursor.fetchone()[0]
+        await cursor.execute(command)
+        car_configuration_id = (await cursor.fetchone())[0]
 
-        db_connection.commit()
+        await db_connection.commit()
         return JSONResponse(content={
             "status": "success",
             "message": "Car configuration created successfully",
             "car_configuration_id": car_configuration_id
         })
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/car/configurations", response_model=List[CarConfigurationResponseModel])
 async def get_car_configurations(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny konfigurace aut.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car_configuration")
-        car_configurations = cursor.fetchall()
+        await cursor.execute("SELECT * FROM car_configuration")
+        car_configurations = await cursor.fetchall()
         formatted_car_configurations = [
             {key: float(value) if isinstance(value, decimal.Decimal) else value for key, value in row.items()}
             for row in car_configurations
@@ -98,20 +99,20 @@ async def get_car_configurations(api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching car configurations: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/car/configuration/{id}", response_model=CarConfigurationResponseModel)
 async def get_car_configuration(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací konfiguraci auta podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car_configuration WHERE id = %s", (id,))
-        car_configuration = cursor.fetchone()
+        await cursor.execute("SELECT * FROM car_configuration WHERE id = %s", (id,))
+        car_configuration = await cursor.fetchone()
         if car_configuration:
             formatted_car_configuration = {key: float(value) if isinstance(value, decimal.Decimal) else value for key, value in car_configuration.items()}
             return JSONResponse(content={"data": formatted_car_configuration})
@@ -120,53 +121,53 @@ async def get_car_configuration(id: int, api_key: APIKey = Depends(auth.get_api_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching car configuration: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/cars", response_model=List[CarResponseModel])
 async def get_cars(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechna auta.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car")
-        cars = cursor.fetchall()
+        await cursor.execute("SELECT * FROM car")
+        cars = await cursor.fetchall()
         return JSONResponse(content={"data": cars})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching cars: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/cars/{car_id}", response_model=CarResponseModel)
 async def get_car(car_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací auto podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM car WHERE id = %s", (car_id,))
-        car = cursor.fetchone()
+        await cursor.execute("SELECT * FROM car WHERE id = %s", (car_id,))
+        car = await cursor.fetchone()
         if not car:
             raise HTTPException(status_code=404, detail="Car not found")
         return JSONResponse(content={"data": car})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching car: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/cars/{car_id}", response_model=PutResponseModel)
 async def update_car(car_id: int, car_data: CarModel, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Aktualizuje auto podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
@@ -174,30 +175,31 @@ async def update_car(car_id: int, car_data: CarModel, api_key: APIKey = Depends(
                      SET maker = %s, type = %s, note = %s, default_driver_id = %s
                      WHERE id = %s
                   """
-        cursor.execute(command, (car_data.maker, car_data.type, car_data.note, car_data.default_driver_id, car_id))
-        db_connection.commit()
+        await cursor.execute(command, (car_data.maker, car_data.type, car_data.note, car_data.default_driver_id, car_id))
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
 
         return {"status": "success", "message": "Car updated successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/car-configurations/{car_configuration_id}", response_model=PostResponseModel)
 async def update_car_configuration(car_configuration_id: int, car_configuration_data: CarConfiguration, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Aktualizuje konfiguraci auta podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """UPDATE car_configuration 
                      set note = %s, power = %s, weight = %s, power_weight_ratio = %s, aero_upgrade = %s, excessive_modifications = %s, excessive_chamber = %s, liquid_leakage = %s, rear_lights = %s, safe = %s, street_legal_tires = %s, seat = %s, seatbelt = %s, widebody = %s, wide_tires = %s where id = %s"""
         values=(car_configuration_data.note, car_configuration_data.power, car_configuration_data.weight, car_configuration_data.power_weight_ratio, car_configuration_data.aero_upgrade, car_configuration_data.excessive_modifications, car_configuration_data.excessive_chamber, car_configuration_data.liquid_leakage, car_configuration_data.rear_lights, car_configuration_data.safe, car_configuration_data.street_legal_tires, car_configuration_data.seat, car_configuration_data.seatbelt, car_configuration_data.widebody, car_configuration_data.wide_tires, car_configuration_id)
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Car configuration not found or no changes made")
@@ -206,22 +208,23 @@ async def update_car_configuration(car_configuration_id: int, car_configuration_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.delete("/delete/car/{car_id}", response_model=DeleteResponseModel)
 async def delete_car(car_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low", read_only=False)
     cursor = db_connection.cursor()
 
     try:
         command = "CALL DeleteCar(%s);"
-        cursor.execute(command, (car_id,))
+        await cursor.execute(command, (car_id,))
 
-        db_connection.commit()
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
         return JSONResponse(content={"status": "success", "message": "Car and all associated data deleted successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting car: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
\ No newline at end of file
+        await cursor.close()
+        await db_connection.close()
\ No newline at end of file
@@ -1,14 +1,15 @@
 from typing import List
 
-from click import command
 from fastapi import APIRouter, Form, File, UploadFile, HTTPException, Depends, Body
 from fastapi.security.api_key import APIKey
 from fastapi.responses import JSONResponse
 from db.connection import get_db_connection, prioritized_get_db_connection
-from passlib.hash import sha256_crypt
 from response_models.response_models import DriverResponseModel, PostResponseModel, DriverRacesResponseModel, GroupedSeriesEventResponseModel, PostResponseReturnIdModel, DeleteResponseModel
 from response_models.commonTypes import DriverRegistration, DriverUpdate, DriverEventStateModel
 import service.auth as auth
+from service.result_cache import invalidate_tags
+from service.registration_resolver import registration_resolver
+from service.passwords import hash_password
 import re
 
 router = APIRouter()
@@ -19,34 +20,34 @@ async def create_driver(data: DriverRegistration, api_key: APIKey = Depends(auth
     '''
         Zaregistruje řidiče do databáze.
     '''
-    db_connection = get_db_connection()
+    db_connection = await get_db_connection()
     cursor = db_connection.cursor()
 
     try:
-        hashed_password = sha256_crypt.hash(data.web_password)
+        hashed_password = await hash_password(data.web_password)
         command = """insert into driver (name, surname, city, street, postcode, birth_date, phone, email, number, web_user, web_password, racebox_id) 
                     values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"""
         values = (
             data.name, data.surname, data.city, data.street, data.postcode, data.birth_date, data.phone, data.email,
             data.number, data.web_user, hashed_password, None)
 
-        cursor.execute(command, values)
+        await cursor.execute(command, values)
 
         command = """SELECT id FROM driver WHERE web_user = %s order by id desc limit 1;"""
-        cursor.execute(command, (data.web_user,))
-        driver_id = cursor.fetchone()[0]
+        await cursor.execute(command, (data.web_user,))
+        driver_id = (await cursor.fetchone())[0]
         if not driver_id:
             raise HTTPException(status_code=404, detail="Driver not found")
 
-        db_connection.commit()
+        await db_connection.commit()
 
         return JSONResponse(content={"status": "success", "message": "Driver created successfully", "id": driver_id})
         # return JSONResponse(content={"status": "success", "message": "Driver created successfully"})
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error while creating driver: " + str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/get/driver/{id}", response_model=DriverResponseModel)
@@ -54,13 +55,13 @@ async def get_driver(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrátí řidiče podle jeho ID.
     '''
-    db_connection = get_db_connection()
+    db_connection = await get_db_connection()
     cursor = db_connection.cursor(dictionary=True)
 
     try:
         command = """SELECT id, name, surname, city, street, postcode, birth_date, phone, email, number, web_user, racebox_id FROM driver WHERE id = %s;"""
-        cursor.execute(command, (id,))
-        result = cursor.fetchone()
+        await cursor.execute(command, (id,))
+        result = await cursor.fetchone()
 
         result['birth_date'] = result['birth_date'].strftime('%Y-%m-%d')
 
@@ -71,20 +72,20 @@ async def get_driver(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get("/get/driver/app/{web_user}", response_model=DriverResponseModel)
 async def get_driver(web_user: str, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrátí řidiče podle jeho ID.
     '''
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         command = """SELECT id, name, surname, city, street, postcode, birth_date, phone, email, number, web_user, racebox_id FROM driver WHERE web_user = %s;"""
-        cursor.execute(command, (web_user,))
-        result = cursor.fetchone()
+        await cursor.execute(command, (web_user,))
+        result = await cursor.fetchone()
 
         result['birth_date'] = result['birth_date'].strftime('%Y-%m-%d')
 
@@ -95,8 +96,8 @@ async def get_driver(web_user: str, api_key: APIKey = Depends(auth.get_api_key))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/get/drivers", response_model=List[DriverResponseModel])
@@ -104,21 +105,21 @@ async def get_drivers(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrátí všechny řidiče.
     '''
-    db_connection = get_db_connection()
+    db_connection = await get_db_connection()
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute(
+        await cursor.execute(
             """SELECT id, name, surname, city, street, postcode, birth_date, phone, email, number, web_user, racebox_id FROM driver""")
-        drivers = cursor.fetchall()
+        drivers = await cursor.fetchall()
         for birth_date in drivers:
             birth_date['birth_date'] = birth_date['birth_date'].strftime('%Y-%m-%d')
         return JSONResponse(content={"data": drivers})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching drivers: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/drivers/{web_user}/races", response_model=List[DriverRacesResponseModel])
@@ -126,8 +127,8 @@ async def get_races_for_driver(web_user: str, api_key: APIKey = Depends(auth.get
     '''
         Vrací závody spojené s řidičem na základě jeho uživatelského jména.
     '''
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -137,8 +138,8 @@ async def get_races_for_driver(web_user: str, api_key: APIKey = Depends(auth.get
             JOIN driver d ON er.driver_id = d.id
             WHERE d.web_user = %s AND e.event_phase_id NOT IN (4, 5)
         """
-        cursor.execute(query, (web_user,))
-        result = cursor.fetchall()
+        await cursor.execute(query, (web_user,))
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="No races found for the driver")
@@ -147,16 +148,16 @@ async def get_races_for_driver(web_user: str, api_key: APIKey = Depends(auth.get
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"General error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/all/{web_user}/races", response_model=List[DriverRacesResponseModel])
 async def get_all_races_for_driver(web_user: str, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací závody spojené s řidičem na základě jeho uživatelského jména.
     '''
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -166,8 +167,8 @@ async def get_all_races_for_driver(web_user: str, api_key: APIKey = Depends(auth
             JOIN driver d ON er.driver_id = d.id
             WHERE d.web_user = %s AND e.event_phase_id NOT IN (4)
         """
-        cursor.execute(query, (web_user,))
-        result = cursor.fetchall()
+        await cursor.execute(query, (web_user,))
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="No races found for the driver")
@@ -176,12 +177,12 @@ async def get_all_races_for_driver(web_user: str, api_key: APIKey = Depends(auth
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"General error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/grouped/series/events", response_model=List[GroupedSeriesEventResponseModel])
 async def get_grouped_series_events(api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = get_db_connection()
+    db_connection = await get_db_connection()
     cursor = db_connection.cursor(dictionary=True)
 
     try:
@@ -194,8 +195,8 @@ async def get_grouped_series_events(api_key: APIKey = Depends(auth.get_api_key))
             GROUP BY s.id, e.id
             ORDER BY s.id DESC, e.date DESC;
         """
-        cursor.execute(command)
-        result = cursor.fetchall()
+        await cursor.execute(command)
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="No events found for the series")
@@ -204,16 +205,16 @@ async def get_grouped_series_events(api_key: APIKey = Depends(auth.get_api_key))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching events: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/grouped/series/events/driver", response_model=List[GroupedSeriesEventResponseModel])
 async def get_grouped_series_events_event(
     web_user: str,
     api_key: APIKey = Depends(auth.get_api_key)
 ):
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         command = """
@@ -236,8 +237,8 @@ async def get_grouped_series_events_event(
             GROUP BY s.id, e.id
             ORDER BY s.id DESC, e.date DESC;
         """
-        cursor.execute(command, (web_user,))
-        result = cursor.fetchall()
+        await cursor.execute(command, (web_user,))
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(
@@ -253,8 +254,8 @@ async def get_grouped_series_events_event(
             detail=f"Nastala chyba při načítání: {e}"
         )
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/all/{web_user}/races/series", response_model=List[DriverRacesResponseModel])
@@ -262,8 +263,8 @@ async def get_all_races_for_driver_in_series(web_user: str, series_id: int, api_
     '''
         Vrací závody spojené s řidičem na základě jeho uživatelského jména.
     '''
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -273,8 +274,8 @@ async def get_all_races_for_driver_in_series(web_user: str, series_id: int, api_
             JOIN driver d ON er.driver_id = d.id
             WHERE d.web_user = %s AND e.series_id = %s and e.event_phase_id NOT IN (4)
         """
-        cursor.execute(query, (web_user, series_id))
-        result = cursor.fetchall()
+        await cursor.execute(query, (web_user, series_id))
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="No races found for the driver")
@@ -283,8 +284,8 @@ async def get_all_races_for_driver_in_series(web_user: str, series_id: int, api_
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"General error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.put("/update/drivers/{driver_id}", response_model=PostResponseModel)
@@ -292,7 +293,7 @@ async def update_driver(driver_id: int, driver_data: DriverUpdate, api_key: APIK
     '''
         Aktualizuje řidiče podle jeho ID.
     '''
-    db_connection = get_db_connection()
+    db_connection = await get_db_connection()
     cursor = db_connection.cursor()
 
     try:
@@ -323,8 +324,10 @@ async def update_driver(driver_id: int, driver_data: DriverUpdate, api_key: APIK
                 driver_id
             )
 
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
+        registration_resolver.invalidate()
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Driver not found or no changes made")
@@ -333,8 +336,8 @@ async def update_driver(driver_id: int, driver_data: DriverUpdate, api_key: APIK
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.put("/event/driver/state/{web_user}", response_model=PostResponseModel)
@@ -347,11 +350,11 @@ async def set_driver_event_state(
     dnf = state.dnf
     finished = state.finished
 
-    db_connection = get_db_connection()
-    cursor = db_connection.cursor()
+    db_connection = await get_db_connection()
+    cursor = db_connection.cursor(prepared=True)
 
     try:
-        cursor.execute(
+        await cursor.execute(
             """
             UPDATE event_registration
             SET dnf = %s, finished = %s
@@ -366,7 +369,8 @@ async def set_driver_event_state(
                 status_code=404,
                 detail="No matching record found for the given web_user and event_id."
             )
-        db_connection.commit()
+        await db_connection.commit()
+        invalidate_tags(f"event:{event_id}", "rankings")
         return {"status": "success", "message": "Změna stavu závodu pro uživatele byla úspěšná."}
 
     except ValueError as e:
@@ -374,24 +378,26 @@ async def set_driver_event_state(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.delete("/delete/driver/{driver_id}", response_model=DeleteResponseModel)
 async def delete_driver(driver_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low", read_only=False)
     cursor = db_connection.cursor()
 
     try:
         command = "CALL DeleteDriver(%s);"
-        cursor.execute(command, (driver_id,))
+        await cursor.execute(command, (driver_id,))
 
-        db_connection.commit()
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
+        registration_resolver.invalidate()
 
         return JSONResponse(content={"status": "success", "message": "Driver and all associated data deleted successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting driver: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
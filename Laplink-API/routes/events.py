@@ -6,11 +6,18 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 from db.connection import prioritized_get_db_connection
+from db.session import DbSession, db_session
 from response_models.response_models import RaceResponseModel, PostResponseModel, RaceDetailResponseModel, DeleteResponseModel
 import service.auth as auth
+from service.result_cache import invalidate_tags
+from service.registration_resolver import registration_resolver, on_event_phase_change
+from service.standings import standings_engine, on_event_phase_change as on_standings_phase_change
+from service.results_recompute import (RESULTS_LEADER_INTERVAL, RESULTS_REFRESH_SECONDS, RESULTS_RESTORE_CONCURRENCY,
+                                       results_recompute)
+from service.leader import results_leader
+from service.scheduler import scheduler_service
+from service.standings import ACTIVE_PHASES
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 import logging
 
 router = APIRouter()
@@ -20,7 +27,118 @@ job_last_update = {}
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-scheduler = BackgroundScheduler()
+def interim_job_id(event_id, event_phase_id):
+    return f"interim_results_event_{event_id}_phase_{event_phase_id}"
+
+
+# Stáří posledního kola se počítá v databázi, created_at je v časové zóně databázové relace
+LATEST_LAP_QUERY = """SELECT MAX(el.id), TIMESTAMPDIFF(SECOND, MAX(el.created_at), NOW())
+    FROM event_lap el
+    INNER JOIN event_registration reg ON el.event_registration_id = reg.id
+    WHERE reg.event_id = %s
+        AND el.event_phase_id = %s;"""
+
+_restore_semaphore = asyncio.Semaphore(RESULTS_RESTORE_CONCURRENCY)
+
+
+async def restore_interim_job(event_id, event_phase_id):
+    """
+    Obnoví stav jobu fáze, kterou worker právě převzal: načte průběžné pořadí
+    a čas nečinnosti vezme z posledního uloženého kola, ne z času převzetí.
+    Při startu s více živými závody běží nejvýše RESULTS_RESTORE_CONCURRENCY obnov najednou.
+    """
+    job_id = interim_job_id(event_id, event_phase_id)
+    job_last_update.pop(job_id, None)
+    async with _restore_semaphore:
+        try:
+            await results_recompute.restore(event_id, event_phase_id)
+            db_connection = await prioritized_get_db_connection(priority="high")
+            cursor = db_connection.cursor()
+            try:
+                await cursor.execute(LATEST_LAP_QUERY, (event_id, event_phase_id))
+                row = await cursor.fetchone()
+            finally:
+                await cursor.close()
+                await db_connection.close()
+        except Exception as e:
+            # Job poběží i tak, pořadí se načte při jeho prvním běhu
+            logger.error(f"Error restoring interim results for event_id={event_id}, event_phase_id={event_phase_id}: {e}")
+            return
+    if row is not None and row[1] is not None:
+        job_last_update[job_id] = datetime.now() - timedelta(seconds=max(row[1], 0))
+        logger.info(f"Job {job_id} restored, last lap id={row[0]} {row[1]} s ago")
+
+
+async def elect_result_leaders():
+    """
+    Volba vedoucího workeru průběžných výsledků (service/leader.py). Běží ve všech workerech
+    v intervalu RESULTS_LEADER_INTERVAL a po změně fáze závodu. Worker, který získá vedení
+    aktivní fáze, obnoví její stav a spustí job, fáze, o jejichž vedení přišel, job zastaví.
+    Každou fázi tak přepočítává právě jeden worker, po pádu vedoucího ji do jednoho intervalu
+    převezme jiný. Při startu workeru se tak obnoví joby všech rozběhnutých závodů.
+    """
+    try:
+        db_connection = await prioritized_get_db_connection(priority="high")
+        cursor = db_connection.cursor()
+        try:
+            await cursor.execute(
+                f"SELECT id, event_phase_id FROM event WHERE event_phase_id IN ({', '.join(['%s'] * len(ACTIVE_PHASES))});",
+                ACTIVE_PHASES)
+            wanted = {(event_id, event_phase_id) for event_id, event_phase_id in await cursor.fetchall()}
+        finally:
+            await cursor.close()
+            await db_connection.close()
+    except Exception as e:
+        logger.error(f"Error loading active event phases for leader election: {e}")
+        return
+
+    # Průběžné ukládání fází, které worker pustí, se zastaví ještě před puštěním vedení,
+    # aby po něm nepřepsalo konečné výsledky (finalize_ended_phase v jiném workeru)
+    for event_id, event_phase_id in results_leader.held - wanted - results_leader.pinned:
+        await stop_interim_job(event_id, event_phase_id)
+    acquired, released = await results_leader.elect(wanted)
+    for event_id, event_phase_id in released:
+        await stop_interim_job(event_id, event_phase_id)
+    if acquired:
+        await asyncio.gather(*(start_interim_job(event_id, event_phase_id) for event_id, event_phase_id in acquired))
+
+
+async def stop_interim_job(event_id, event_phase_id):
+    job_id = interim_job_id(event_id, event_phase_id)
+    if scheduler_service.remove_job(job_id):
+        logger.info(f"Odstraněn job {job_id}, worker už fázi nevede")
+    job_last_update.pop(job_id, None)
+    await results_recompute.release(event_id, event_phase_id)
+
+
+async def start_interim_job(event_id, event_phase_id):
+    job_id = interim_job_id(event_id, event_phase_id)
+    await restore_interim_job(event_id, event_phase_id)
+    scheduler_service.add_job(job_id, update_interim_results, RESULTS_REFRESH_SECONDS, args=(event_id, event_phase_id),
+                              name=f"Interim results for event {event_id} phase {event_phase_id}", run_now=True)
+    logger.info(f"Spuštěn job {job_id}, worker fázi vede")
+
+
+async def finalize_ended_phase(event_id, event_phase_id):
+    """
+    Uloží konečné výsledky fáze, která právě skončila (dříve trigger after_event_phase_id_update).
+    Volá se po volbě vedoucího v tomto workeru. Výsledky se uloží pod vedením staré fáze,
+    případně až ji při své volbě pustí worker, který ji vede (ResultsRecompute.finalize).
+    Chyba změnu fáze nevrací, výsledky jde uložit znovu přes POST /finalize-event-results.
+    """
+    try:
+        return await results_recompute.finalize(event_id, event_phase_id)
+    except Exception as e:
+        logger.error(f"Error saving final results for event_id={event_id}, event_phase_id={event_phase_id}: {e}")
+        return 0
+
+
+def start_result_leadership():
+    """
+    Naplánuje volbu vedoucího workeru. Volá se při startu aplikace po spuštění plánovače.
+    """
+    scheduler_service.add_job("results_leader_election", elect_result_leaders, RESULTS_LEADER_INTERVAL,
+                              name="Results leader election", run_now=True)
 
 class EventUpdateRequest(BaseModel):
     name: str
@@ -38,7 +156,7 @@ async def all_races(api_key: APIKey = Depends(auth.get_api_key)):
     Vrátí všechny závody.
     """
     try:
-        db_connection = prioritized_get_db_connection(priority="low")
+        db_connection = await prioritized_get_db_connection(priority="low")
         cursor = db_connection.cursor(dictionary=True)
 
         command = """
@@ -48,8 +166,8 @@ async def all_races(api_key: APIKey = Depends(auth.get_api_key)):
             JOIN series s ON e.series_id = s.id
             ORDER BY date DESC;
         """
-        cursor.execute(command)
-        races = cursor.fetchall()
+        await cursor.execute(command)
+        races = await cursor.fetchall()
 
         for race in races:
             if race['date']:
@@ -59,15 +177,15 @@ async def all_races(api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching races: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event/detail/{id}/", response_model=RaceDetailResponseModel)
 async def get_event_detail(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací detail závodu podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
@@ -76,8 +194,8 @@ async def get_event_detail(id: int, api_key: APIKey = Depends(auth.get_api_key))
             FROM event e
             WHERE e.id = %s;
         """
-        cursor.execute(command, (id,))
-        race = cursor.fetchone()
+        await cursor.execute(command, (id,))
+        race = await cursor.fetchone()
 
         if not race:
             raise HTTPException(status_code=404, detail="Závod nenalezen")
@@ -88,8 +206,8 @@ async def get_event_detail(id: int, api_key: APIKey = Depends(auth.get_api_key))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event detail: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.post("/create/event", response_model=PostResponseModel)
 async def create_event(
@@ -106,7 +224,7 @@ async def create_event(
     """
     Vytvoří nový závod.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
@@ -117,38 +235,35 @@ async def create_event(
             name, number_of_laps, date, location, start_coordinates, end_coordinates, None, event_phase_id, series_id
         )
 
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
         return JSONResponse(content={"status": "success", "message": "Event created successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating event: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/event/{id}", response_model=PostResponseModel)
 async def update_event(
     id: int,
     event_data: EventUpdateRequest,
-    api_key: APIKey = Depends(auth.get_api_key)
+    api_key: APIKey = Depends(auth.get_api_key),
+    db: DbSession = Depends(db_session("high"))
 ):
     """
     Aktualizuje event v databázi podle jeho ID.
-    Pokud se změní event_phase_id a nová hodnota je v aktivních závodních fázích (1,2,3),
-    starý job se odstraní a vytvoří se nový, který volá update_interim_results.
+    Pokud se změní event_phase_id, proběhne hned volba vedoucího workeru: job staré fáze
+    se odstraní a pro aktivní závodní fázi (1,2,3) se spustí nový, který volá update_interim_results.
+    Stará fáze pak dostane konečné výsledky s body (finalize_ended_phase).
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor(dictionary=True)
-
     try:
-        print("Id 1:", id)
-        cursor.execute("SELECT event_phase_id FROM event WHERE id = %s", (id,))
-        current_event = cursor.fetchone()
+        await db.execute("SELECT event_phase_id FROM event WHERE id = %s", (id,))
+        current_event = await db.fetchone()
         if not current_event:
             raise HTTPException(status_code=404, detail="Závod nenalezen")
         old_phase_id = current_event["event_phase_id"]
-        print("Id 2:", id)
         try:
             command = """
                         UPDATE event
@@ -168,110 +283,97 @@ async def update_event(
                 event_data.start_coordinates, event_data.end_coordinates, None,
                 event_data.event_phase_id, event_data.series_id, id
             )
-            for x in values:
-                print("Typ", x, ":", type(x))
-            print(command, values)
-            cursor.execute(command, values)
-
-            print("Id 3:", id)
-            db_connection.commit()
+            await db.execute(command, values)
+            await db.commit()
+            invalidate_tags(f"event:{id}", "rankings")
         except Exception as e:
-            db_connection.rollback()
+            await db.rollback()
             raise HTTPException(status_code=533, detail=f"Error updating event -asfdjasdashd: {e}")
+        # Zbytek handleru už databázi nepotřebuje
+        await db.release()
 
         if old_phase_id != event_data.event_phase_id:
-            old_job_id = f"interim_results_event_{id}_phase_{old_phase_id}"
-            if scheduler.get_job(old_job_id):
-                scheduler.remove_job(old_job_id)
-                logger.info(f"Odstraněn starý job: {old_job_id}")
-
-            if event_data.event_phase_id in [1, 2, 3]:
-                new_job_id = f"interim_results_event_{id}_phase_{event_data.event_phase_id}"
-                if not scheduler.running:
-                    scheduler.start()
-                scheduler.add_job(
-                    update_interim_results,
-                    trigger=IntervalTrigger(seconds=15),
-                    args=[id, event_data.event_phase_id],
-                    id=new_job_id,
-                    name=f"Interim results for event {id} phase {event_data.event_phase_id}",
-                    replace_existing=True,
-                )
-                logger.info(f"Spuštěn nový job: {new_job_id}")
-            else:
-                logger.info(f"Job pro event_phase_id {event_data.event_phase_id} se nespouští, protože není aktivní závodní fází.")
+            on_event_phase_change(id, event_data.event_phase_id)
+            on_standings_phase_change(id, event_data.event_phase_id)
+            # Joby průběžných výsledků spouští a zastavuje volba vedoucího workeru
+            await elect_result_leaders()
+            await finalize_ended_phase(id, old_phase_id)
 
         return JSONResponse(content={"status": "success", "message": "Event updated successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating event: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.delete("/delete/event/{id}", response_model=DeleteResponseModel)
 async def delete_event(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
     Smaže závod podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = "Call DeleteEvent(%s);"
-        cursor.execute(command, (id,))
+        await cursor.execute(command, (id,))
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Event not found")
 
-        db_connection.commit()
+        await db_connection.commit()
+        invalidate_tags(f"event:{id}", "rankings")
+        registration_resolver.invalidate(id)
+        standings_engine.invalidate(id)
+        results_recompute.forget(id)
         return JSONResponse(content={"status": "success", "message": "Event deleted successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting event: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
-def update_interim_results(event_id: int, event_phase_id: int):
+async def update_interim_results(event_id: int, event_phase_id: int):
     """
-    Aktualizuje průběžné výsledky a kontroluje, zda nedošlo k nečinnosti.
-    Pokud se výsledky nezmění 1,5 hodiny, odstraní job a nastaví event do fáze 5.
+    Job vedoucího workeru fáze. Dočte kola uložená jinými workery (výsledky pak uloží
+    service/results_recompute.py) a kontroluje, zda nedošlo k nečinnosti.
+    Pokud 1,5 hodiny nepřibude žádné kolo, odstraní job a nastaví event do fáze 5.
+    Vrátí počet řádků event_result změněných od minulého běhu (GET /admin/jobs).
     """
-    job_id = f"interim_results_event_{event_id}_phase_{event_phase_id}"
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
+    job_id = interim_job_id(event_id, event_phase_id)
     try:
-        cursor.callproc("UpdateActiveEventPhaseResults", (event_id, event_phase_id))
-        db_connection.commit()
-
-        rows_updated = cursor.rowcount
-        logger.info(f"Interim results updated for event_id={event_id}, event_phase_id={event_phase_id}, rows_updated={rows_updated}")
+        changed = await results_recompute.refresh(event_id, event_phase_id)
 
         now = datetime.now()
-        if rows_updated > 0:
+        if changed:
             job_last_update[job_id] = now
         else:
-            last_update = job_last_update.get(job_id, now)
+            last_update = job_last_update.setdefault(job_id, now)
             if now - last_update > timedelta(hours=1, minutes=30):
-                if scheduler.get_job(job_id):
-                    scheduler.remove_job(job_id)
+                if scheduler_service.remove_job(job_id):
                     logger.info(f"Job {job_id} removed due to 1.5 hours of inactivity")
+                await results_recompute.release(event_id, event_phase_id)
+                await results_leader.release((event_id, event_phase_id))
 
                 try:
-                    upd_conn = prioritized_get_db_connection(priority="high")
+                    upd_conn = await prioritized_get_db_connection(priority="high")
                     upd_cursor = upd_conn.cursor()
-                    upd_cursor.execute("UPDATE event SET event_phase_id = %s WHERE id = %s", (5, event_id))
-                    upd_conn.commit()
-                    logger.info(f"Event {event_id} switched to phase 5 due to inactivity in results update")
+                    # Fázi mezitím mohl změnit někdo jiný, pak výsledky uložil on
+                    await upd_cursor.execute("UPDATE event SET event_phase_id = %s WHERE id = %s AND event_phase_id = %s",
+                                             (5, event_id, event_phase_id))
+                    switched = upd_cursor.rowcount > 0
+                    await upd_conn.commit()
+                    if switched:
+                        invalidate_tags(f"event:{event_id}", "rankings")
+                        on_event_phase_change(event_id, 5)
+                        on_standings_phase_change(event_id, 5)
+                        await finalize_ended_phase(event_id, event_phase_id)
+                        logger.info(f"Event {event_id} switched to phase 5 due to inactivity in results update")
                 except Exception as upd_e:
                     logger.error(f"Error updating event phase to 5 for event_id={event_id}: {upd_e}")
                 finally:
-                    upd_cursor.close()
-                    upd_conn.close()
+                    await upd_cursor.close()
+                    await upd_conn.close()
     except Exception as e:
-        db_connection.rollback()
         logger.error(f"Error updating interim results for event_id={event_id}, event_phase_id={event_phase_id}: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
\ No newline at end of file
+        raise
+    return results_recompute.take_rows_changed(event_id, event_phase_id)
\ No newline at end of file
@@ -1,41 +1,34 @@
-from fastapi import WebSocket, WebSocketDisconnect, APIRouter, HTTPException, Depends
-from typing import List, Dict
-from db.connection import prioritized_get_db_connection
+from fastapi import WebSocket, APIRouter, HTTPException, Depends
+from typing import List
+from db.session import DbSession, db_session
 from response_models.response_models import FlagCreate, PostResponseModel, PutResponseModel, FlagsResponseModel, DeleteResponseModel
 import service.auth as auth
+from service.flag_hub import flag_hub
 
 router = APIRouter()
-active_connections: Dict[int, List[WebSocket]] = {}
 
 @router.post("/create", response_model=PostResponseModel)
-async def create_flag(flag: FlagCreate, api_key: str = Depends(auth.get_api_key)):
+async def create_flag(flag: FlagCreate, api_key: str = Depends(auth.get_api_key),
+                      db: DbSession = Depends(db_session("high"))):
     """
     Vytvoří novou vlajku.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
-
     try:
         command = """INSERT INTO flags (name, note) VALUES (%s, %s);"""
         values = (flag.name, flag.note)
-        cursor.execute(command, values)
-        db_connection.commit()
+        await db.execute(command, values)
+        await db.commit()
         return {"status": "success", "message": "Flag created successfully"}
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.put("/update/{id}", response_model=PutResponseModel)
-async def update_flag(id: int, flag: FlagCreate, api_key: str = Depends(auth.get_api_key)):
+async def update_flag(id: int, flag: FlagCreate, api_key: str = Depends(auth.get_api_key),
+                      db: DbSession = Depends(db_session("high"))):
     """
     Aktualizuje vlajku v databázi podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
-
     try:
         command = """
         UPDATE flags
@@ -43,191 +36,141 @@ async def update_flag(id: int, flag: FlagCreate, api_key: str = Depends(auth.get
         WHERE id = %s;
         """
         values = (flag.name, flag.note, id)
-        cursor.execute(command, values)
-        db_connection.commit()
+        await db.execute(command, values)
+        await db.commit()
         return {"status": "success", "message": "Flag updated successfully"}
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.get("/get/all", response_model=List[FlagsResponseModel])
-async def get_all_flags(api_key: str = Depends(auth.get_api_key)):
+async def get_all_flags(api_key: str = Depends(auth.get_api_key),
+                        db: DbSession = Depends(db_session("high"))):
     """
     Vrátí všechny vlajky.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor(dictionary=True)
-
     try:
-        cursor.execute("SELECT * FROM flags;")
-        flags = cursor.fetchall()
+        await db.execute("SELECT * FROM flags;")
+        flags = await db.fetchall()
+        await db.release()
         return flags
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting flags: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.get("/get/{id}", response_model=FlagsResponseModel)
-async def get_flag(id: int, api_key: str = Depends(auth.get_api_key)):
+async def get_flag(id: int, api_key: str = Depends(auth.get_api_key),
+                   db: DbSession = Depends(db_session("high"))):
     """
     Vrátí vlajku podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor(dictionary=True)
-
     try:
-        cursor.execute("SELECT * FROM flags WHERE id = %s;", (id,))
-        flag = cursor.fetchone()
+        await db.execute("SELECT * FROM flags WHERE id = %s;", (id,))
+        flag = await db.fetchone()
+        await db.release()
         return flag
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.delete("/delete/{id}", response_model=DeleteResponseModel)
-async def delete_flag(id: int, api_key: str = Depends(auth.get_api_key)):
+async def delete_flag(id: int, api_key: str = Depends(auth.get_api_key),
+                      db: DbSession = Depends(db_session("high"))):
     """
     Smaže vlajku podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
-
     try:
-        cursor.execute("DELETE FROM flags WHERE id = %s;", (id,))
-        db_connection.commit()
+        await db.execute("DELETE FROM flags WHERE id = %s;", (id,))
+        await db.commit()
         return {"status": "success", "message": "Flag deleted successfully"}
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 @router.put("/deactivate/{assignment_id}", response_model=PutResponseModel)
-async def deactivate_flag(assignment_id: int, api_key: str = Depends(auth.get_api_key)):
+async def deactivate_flag(assignment_id: int, api_key: str = Depends(auth.get_api_key),
+                          db: DbSession = Depends(db_session("high"))):
     """
     Deaktivuje vlajku (nastaví ji jako neaktivní).
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
-
     try:
         command = """
             UPDATE flag_assignments
             SET is_active = FALSE
             WHERE id = %s;
         """
-        cursor.execute(command, (assignment_id,))
-        db_connection.commit()
+        await db.execute(command, (assignment_id,))
+        await db.commit()
         return {"status": "success", "message": "Flag deactivated successfully"}
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deactivating flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.post("/assign", response_model=PostResponseModel)
 async def assign_flag(
     flag_id: int,
     event_id: int,
     driver_id: int = None,
-    api_key: str = Depends(auth.get_api_key)
+    api_key: str = Depends(auth.get_api_key),
+    db: DbSession = Depends(db_session("high"))
 ):
     """
     Přiřadí vlajku k závodu (a případně konkrétnímu jezdci).
+    Připojení se vrací do poolu ještě před rozesláním vlajky přes WebSocket.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor(dictionary=True)
-
     try:
-        cursor.execute("SELECT id FROM flags WHERE id = %s;", (flag_id,))
-        if not cursor.fetchone():
+        await db.execute("SELECT id, name, note FROM flags WHERE id = %s;", (flag_id,))
+        flag_info = await db.fetchone()
+        if not flag_info:
             raise HTTPException(status_code=404, detail="Flag not found")
 
-        cursor.execute("SELECT id FROM event WHERE id = %s;", (event_id,))
-        if not cursor.fetchone():
+        await db.execute("SELECT id FROM event WHERE id = %s;", (event_id,))
+        if not await db.fetchone():
             raise HTTPException(status_code=404, detail="Event not found")
 
         if driver_id:
-            cursor.execute("SELECT id FROM driver WHERE id = %s;", (driver_id,))
-            if not cursor.fetchone():
+            await db.execute("SELECT id FROM driver WHERE id = %s;", (driver_id,))
+            if not await db.fetchone():
                 raise HTTPException(status_code=404, detail="Driver not found")
 
         command = """
             INSERT INTO flag_assignments (flag_id, event_id, driver_id)
             VALUES (%s, %s, %s);
         """
-        cursor.execute(command, (flag_id, event_id, driver_id))
-        db_connection.commit()
-
-        cursor.execute("SELECT * FROM flags WHERE id = %s;", (flag_id,))
-        flag_info = cursor.fetchone()
-        flag_data = {
-            "flag_id": flag_id,
-            "event_id": event_id,
-            "driver_id": driver_id,
-            "flag_name": flag_info["name"],
-            "flag_note": flag_info["note"],
-        }
-
-        if driver_id is None:
-            await notify_all(event_id, flag_data)
-        else:
-            await notify_driver(driver_id, flag_data)
-
-        return {"status": "success", "message": "Flag assigned successfully"}
+        await db.execute(command, (flag_id, event_id, driver_id))
+        await db.commit()
+        await db.release()
     except Exception as e:
-        db_connection.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error assigning flag: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
+
+    flag_data = {
+        "flag_id": flag_id,
+        "event_id": event_id,
+        "driver_id": driver_id,
+        "flag_name": flag_info["name"],
+        "flag_note": flag_info["note"],
+    }
+
+    # Vlajka se jen zařadí do front připojení (service/flag_hub.py), odpověď nečeká na zařízení
+    if driver_id is None:
+        notify_all(event_id, flag_data)
+    else:
+        notify_driver(event_id, driver_id, flag_data)
+
+    return {"status": "success", "message": "Flag assigned successfully"}
 
 @router.websocket("/flags/{event_id}/{driver_id}")
 async def websocket_flags(websocket: WebSocket, event_id: int, driver_id: int = None):
     """
     WebSocket pro zasílání vlajek konkrétnímu řidiči nebo všem účastníkům závodu.
+    Zařízení jezdce dostává vlajky jezdce i vlajky celého závodu, driver_id 0 odebírá jen
+    vlajky závodu. Spojení zůstává otevřené do odpojení zařízení, pomalá zařízení hub odpojí.
     """
     await websocket.accept()
+    await flag_hub.serve(websocket, event_id, driver_id or None)
 
-    if driver_id:
-        if driver_id not in active_connections:
-            active_connections[driver_id] = []
-        active_connections[driver_id].append(websocket)
-    else:
-        if event_id not in active_connections:
-            active_connections[event_id] = []
-        active_connections[event_id].append(websocket)
+def notify_driver(event_id: int, driver_id: int, flag_data: dict):
+    """Odesílá vlajku konkrétnímu řidiči v závodě."""
+    return flag_hub.send_to_driver(event_id, driver_id, flag_data)
 
-    try:
-        message = await websocket.receive_text()
-        print(f"Přijatá zpráva: {message}")
-        await websocket.send_text(f"Odpověď: {message}")
-    except WebSocketDisconnect:
-        print(f"Odpojeno: event_id={event_id}, driver_id={driver_id}")
-    finally:
-        if driver_id:
-            active_connections[driver_id].remove(websocket)
-            if not active_connections[driver_id]:
-                del active_connections[driver_id]
-        else:
-            active_connections[event_id].remove(websocket)
-            if not active_connections[event_id]:
-                del active_connections[event_id]
-
-async def notify_driver(driver_id: int, flag_data: dict):
-    """Odesílá vlajku konkrétnímu řidiči."""
-    if driver_id in active_connections and active_connections[driver_id]:
-        for connection in active_connections[driver_id]:
-            await connection.send_json(flag_data)
-
-async def notify_all(event_id: int, flag_data: dict):
+def notify_all(event_id: int, flag_data: dict):
     """Odesílá vlajku všem účastníkům závodu."""
-    if event_id in active_connections and active_connections[event_id]:
-        for connection in active_connections[event_id]:
-            await connection.send_json(flag_data)
+    return flag_hub.broadcast(event_id, flag_data)
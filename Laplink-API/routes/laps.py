@@ -1,11 +1,22 @@
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends, Query
+import json
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect, WebSocketException
 from fastapi.security.api_key import APIKey
 from fastapi.responses import JSONResponse
+from starlette.status import WS_1008_POLICY_VIOLATION, WS_1011_INTERNAL_ERROR
 from db.connection import prioritized_get_db_connection
-from response_models.response_models import PostResponseModel, EventResultResponseModel, EventDriverEventResultsResponseModel
-from response_models.commonTypes import PostLapData
+from db.session import DbSession, db_session
+from response_models.response_models import PostLapResponseModel, EventResultResponseModel, EventDriverEventResultsResponseModel, LapBatchResponseModel
+from response_models.commonTypes import PostLapData, PostLapDataBatch
 import service.auth as auth
+from utilities.formatting import laptime_to_ms, format_time_ms, format_time_columns
+from service.result_cache import invalidate_tags
+from service.lap_journal import LAP_WRITE_BEHIND, lap_journal
+from service.lap_dedup import INSERT_LAP_IDEMPOTENT, LAP_DUPLICATES, lap_dedup_index
+from service.registration_resolver import registration_resolver
+from service.standings import standings_engine, apply_live_standings
+from service.results_recompute import results_recompute
+from service.lap_stream import LAP_STREAM_MESSAGES, active_sessions, get_driver_position, get_phase_result_type
 import re
 
 router = APIRouter()
@@ -17,33 +28,314 @@ def validate_time(time_str: str) -> str:
         raise ValueError("Invalid time format. Expected format is HH:MM:SS.mm")
     return time_str
 
-@router.post("/event/lap/data", response_model=PostResponseModel)
+def lap_result_response(result, duplicate):
+    return {
+        "status": "success",
+        "message": "Duplicate lap, original result returned" if duplicate
+            # Kolo zapsané jen do žurnálu (LAP_WRITE_BEHIND) ještě nemá id
+            else "Lap data accepted" if result["lap_id"] is None else "Lap data saved successfully",
+        "lap_id": result["lap_id"],
+        "laptime": result["laptime"],
+        "event_phase_id": result["event_phase_id"],
+        "duplicate": duplicate,
+    }
+
+async def resolve_registration(event_id, web_user):
+    try:
+        registration_id = await registration_resolver.resolve(event_id, web_user)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error resolving registration: {e}")
+    if registration_id is None:
+        raise HTTPException(status_code=404, detail="Driver is not registered for this event")
+    return registration_id
+
+async def save_lap(data: PostLapData):
+    """
+        Společná cesta uložení kola pro POST /event/lap/data a WebSocket relaci.
+        Vrací (výsledek, duplicita), chyby hlásí jako HTTPException.
+    """
+    if data.client_lap_id is not None:
+        original = lap_dedup_index.get(data.event_id, data.web_user, data.event_phase_id, data.client_lap_id)
+        if original is not None:
+            LAP_DUPLICATES.inc(source="memory")
+            return original, True
+
+    try:
+        laptime = validate_time(data.laptime)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Error saving lap data: {e}")
+    registration_id = await resolve_registration(data.event_id, data.web_user)
+
+    if LAP_WRITE_BEHIND:
+        lap = {"web_user": data.web_user, "event_id": int(data.event_id), "event_registration_id": registration_id,
+               "laptime": laptime, "event_phase_id": int(data.event_phase_id), "client_lap_id": data.client_lap_id}
+        result = {"lap_id": None, "laptime": laptime, "event_phase_id": lap["event_phase_id"]}
+        if data.client_lap_id is not None:
+            # Do indexu hned, aby souběžné opakování stejného kola nešlo do žurnálu podruhé
+            lap_dedup_index.put(data.event_id, data.web_user, data.event_phase_id, data.client_lap_id, result)
+        try:
+            await lap_journal.append(lap)
+        except Exception as e:
+            if data.client_lap_id is not None:
+                lap_dedup_index.discard(data.event_id, data.web_user, data.event_phase_id, data.client_lap_id)
+            if isinstance(e, HTTPException):
+                raise e
+            raise HTTPException(status_code=500, detail=f"Error saving lap data: {e}")
+        return result, False
+
+    db_connection = await prioritized_get_db_connection(priority="high")
+    cursor = db_connection.cursor(prepared=True)
+    try:
+        result = {"lap_id": None, "laptime": laptime, "event_phase_id": int(data.event_phase_id)}
+        if data.client_lap_id is None:
+            command = """INSERT INTO event_lap (event_registration_id, laptime, laptime_ms, event_phase_id) VALUES (%s, %s, %s, %s);"""
+            await cursor.execute(command, (registration_id, laptime, laptime_to_ms(laptime), int(data.event_phase_id)))
+            result["lap_id"] = cursor.lastrowid
+            await db_connection.commit()
+            standings_engine.record_lap(data.event_id, data.event_phase_id, result["lap_id"], registration_id,
+                                        laptime_to_ms(laptime))
+            results_recompute.mark_dirty(data.event_id, data.event_phase_id)
+            invalidate_tags(f"event:{data.event_id}")
+            return result, False
+
+        await cursor.execute(INSERT_LAP_IDEMPOTENT, (registration_id, laptime, laptime_to_ms(laptime),
+                                                     int(data.event_phase_id), data.client_lap_id))
+        # Nové kolo má rowcount 1, u duplicity se řádek nezmění
+        duplicate = cursor.rowcount != 1
+        result["lap_id"] = cursor.lastrowid
+        if duplicate:
+            await cursor.execute("SELECT laptime_ms, event_phase_id FROM event_lap WHERE id = %s;", (cursor.lastrowid,))
+            row = await cursor.fetchone()
+            result.update(laptime=format_time_ms(row[0]), event_phase_id=row[1])
+        await db_connection.commit()
+        lap_dedup_index.put(data.event_id, data.web_user, data.event_phase_id, data.client_lap_id, result)
+        if duplicate:
+            LAP_DUPLICATES.inc(source="database")
+        else:
+            standings_engine.record_lap(data.event_id, data.event_phase_id, result["lap_id"], registration_id,
+                                        laptime_to_ms(laptime))
+            results_recompute.mark_dirty(data.event_id, data.event_phase_id)
+            invalidate_tags(f"event:{data.event_id}")
+        return result, duplicate
+    except Exception as e:
+        await db_connection.rollback()
+        # Registrace mohla být mezitím smazána v jiném workeru
+        registration_resolver.invalidate(data.event_id)
+        raise HTTPException(status_code=400, detail=f"Error saving lap data: {e}")
+    finally:
+        await cursor.close()
+        await db_connection.close()
+
+@router.post("/event/lap/data", response_model=PostLapResponseModel)
 async def post_lap_data(data: PostLapData, api_key: APIKey = Depends(auth.get_api_key)):
     '''
-        Uloží data o kole.
+        Uloží data o kole. Registrace jezdce se dohledá v paměti (service/registration_resolver.py),
+        neregistrovaný jezdec dostane 404.
+        Při zapnutém LAP_WRITE_BEHIND se kolo potvrdí po zápisu do žurnálu
+        a do databáze se uloží na pozadí (viz service/lap_journal.py).
+        Kolo s client_lap_id se uloží nejvýše jednou, opakovaný požadavek vrátí výsledek původního.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
-    cursor = db_connection.cursor()
+    result, duplicate = await save_lap(data)
+    return JSONResponse(content=lap_result_response(result, duplicate))
+
+async def handle_stream_message(event_id, event_phase_id, result_type, message):
+    """
+        Zpracuje jednu zprávu WebSocket relace a vrátí potvrzení. Chyba jedné zprávy relaci neukončí.
+    """
+    seq = None
     try:
-        command = """CALL InsertLapTime(%s, %s, %s, %s);"""
-        values = (data.web_user, int(data.event_id), validate_time(data.laptime), int(data.event_phase_id))
-        cursor.execute(command, values)
-        db_connection.commit()
-        return JSONResponse(content={"status": "success", "message": "Lap data saved successfully"})
-    except Exception as e:
-        db_connection.rollback()
-        raise HTTPException(status_code=400, detail=f"Error saving lap data: {e}")
+        payload = json.loads(message)
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a JSON object")
+        seq = payload.get("seq")
+        data = PostLapData(event_id=event_id, event_phase_id=event_phase_id, web_user=payload.get("web_user"),
+                           laptime=payload.get("laptime"), client_lap_id=payload.get("client_lap_id"))
+    except ValueError as e:
+        LAP_STREAM_MESSAGES.inc(result="invalid")
+        return {"status": "error", "seq": seq, "code": 422, "detail": f"Invalid lap message: {e}"}
+
+    try:
+        result, duplicate = await save_lap(data)
+    except HTTPException as e:
+        LAP_STREAM_MESSAGES.inc(result="rejected")
+        return {"status": "error", "seq": seq, "code": e.status_code, "detail": e.detail}
+
+    try:
+        registration_id = await registration_resolver.resolve(event_id, data.web_user)
+        position = await get_driver_position(event_id, event_phase_id, registration_id, result_type)
+    except Exception:
+        # Kolo je uložené, bez pořadí se potvrzení pošle i tak
+        position = None
+    LAP_STREAM_MESSAGES.inc(result="duplicate" if duplicate else "accepted")
+    return {**lap_result_response(result, duplicate), "seq": seq, "position": position}
+
+@router.websocket("/event/lap/stream/{event_id}/{event_phase_id}")
+async def lap_stream(websocket: WebSocket, event_id: int, event_phase_id: int,
+                     api_key: str = Depends(auth.get_websocket_api_key)):
+    '''
+        Dlouhodobá relace pro odesílání kol jednoho závodu a fáze z měřicího zařízení.
+        Zpráva: {"web_user": "dominik", "laptime": "00:01:30.00", "client_lap_id": "...", "seq": 1},
+        client_lap_id a seq jsou nepovinné. Každá zpráva se uloží stejně jako POST /event/lap/data
+        a potvrdí se v pořadí příchodu: status, lap_id, laptime, duplicate, position (pořadí jezdce
+        v kategorii) a seq ze zprávy. Při chybě přijde status "error" s kódem a důvodem.
+    '''
+    try:
+        exists, result_type = await get_phase_result_type(event_phase_id)
+    except Exception:
+        raise WebSocketException(code=WS_1011_INTERNAL_ERROR, reason="Database unavailable")
+    if not exists:
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason="Event phase not found")
+
+    await websocket.accept()
+    active_sessions.add(websocket)
+    try:
+        while True:
+            message = await websocket.receive_text()
+            # Zprávy se zpracují postupně, potvrzení tak odcházejí ve stejném pořadí
+            await websocket.send_json(await handle_stream_message(event_id, event_phase_id, result_type, message))
+    except WebSocketDisconnect:
+        pass
     finally:
-        cursor.close()
-        db_connection.close()
+        active_sessions.discard(websocket)
+
+async def find_client_laps(db, keys):
+    """
+        Vrátí už uložená kola pro trojice (event_registration_id, event_phase_id, client_lap_id).
+    """
+    if not keys:
+        return {}
+    registration_ids = sorted({registration_id for registration_id, _, _ in keys})
+    client_lap_ids = sorted({client_lap_id for _, _, client_lap_id in keys})
+    command = f"""SELECT id, event_registration_id, client_lap_id, laptime_ms, event_phase_id
+        FROM event_lap
+        WHERE event_registration_id IN ({", ".join(["%s"] * len(registration_ids))})
+            AND client_lap_id IN ({", ".join(["%s"] * len(client_lap_ids))});"""
+    await db.execute(command, tuple(registration_ids) + tuple(client_lap_ids))
+    wanted = set(keys)
+    return {
+        (row["event_registration_id"], row["event_phase_id"], row["client_lap_id"]): {
+            "lap_id": row["id"], "laptime": format_time_ms(row["laptime_ms"]), "event_phase_id": row["event_phase_id"]}
+        for row in await db.fetchall()
+        if (row["event_registration_id"], row["event_phase_id"], row["client_lap_id"]) in wanted
+    }
+
+@router.post("/event/lap/data/batch", response_model=LapBatchResponseModel)
+async def post_lap_data_batch(data: PostLapDataBatch, api_key: APIKey = Depends(auth.get_api_key),
+                              db: DbSession = Depends(db_session("high", read_only=False))):
+    '''
+        Uloží více kol najednou (jeden i více jezdců) v jedné transakci. Kola bez client_lap_id
+        jedním víceřádkovým INSERTem, kola s client_lap_id po jednom.
+        Kola s chybným časem nebo bez registrace jezdce na závod se neuloží a vrátí se u nich důvod.
+        Kola s už uloženým client_lap_id (i souběžným požadavkem) se vrátí jako duplicate s id původního kola.
+    '''
+    results = []
+    valid = []
+    for index, lap in enumerate(data.laps):
+        try:
+            validate_time(lap.laptime)
+        except ValueError as e:
+            results.append({"index": index, "status": "invalid", "detail": str(e)})
+            continue
+        results.append({"index": index, "status": "pending", "detail": None})
+        valid.append((index, lap))
+
+    try:
+        new_laps = []
+        duplicates = 0
+        if valid:
+            accepted = []
+            for index, lap in valid:
+                registration_id = await registration_resolver.resolve(lap.event_id, lap.web_user, db)
+                if registration_id is None:
+                    results[index].update(status="not_registered", detail="Driver is not registered for this event")
+                    continue
+                accepted.append((index, lap, registration_id))
+
+            existing = await find_client_laps(db, [(registration_id, int(lap.event_phase_id), lap.client_lap_id)
+                                                   for _, lap, registration_id in accepted if lap.client_lap_id is not None])
+            seen = {}
+            for index, lap, registration_id in accepted:
+                if lap.client_lap_id is not None:
+                    key = (registration_id, int(lap.event_phase_id), lap.client_lap_id)
+                    original = lap_dedup_index.get(lap.event_id, lap.web_user, lap.event_phase_id, lap.client_lap_id)
+                    if original is None and key in existing:
+                        original = existing[key]
+                        lap_dedup_index.put(lap.event_id, lap.web_user, lap.event_phase_id, lap.client_lap_id, original)
+                    if original is not None:
+                        results[index].update(status="duplicate", detail="Duplicate lap, original result returned",
+                                              lap_id=original["lap_id"])
+                        duplicates += 1
+                        continue
+                    if key in seen:
+                        results[index].update(status="duplicate", detail=f"Duplicate of item {seen[key]}")
+                        duplicates += 1
+                        continue
+                    seen[key] = index
+                new_laps.append((index, lap, registration_id))
+
+        # Kola bez client_lap_id nemohou být duplicitní, uloží se jedním víceřádkovým INSERTem
+        plain = [(registration_id, lap.laptime, laptime_to_ms(lap.laptime), int(lap.event_phase_id))
+                 for _, lap, registration_id in new_laps if lap.client_lap_id is None]
+        if plain:
+            command = f"""INSERT INTO event_lap (event_registration_id, laptime, laptime_ms, event_phase_id)
+                VALUES {", ".join(["(%s, %s, %s, %s)"] * len(plain))};"""
+            await db.execute(command, tuple(value for row in plain for value in row))
+        # Kola s client_lap_id po jednom jako v save_lap, rowcount a LAST_INSERT_ID() rozliší
+        # kolo uložené mezitím souběžným požadavkem
+        stored = []
+        for index, lap, registration_id in new_laps:
+            if lap.client_lap_id is None:
+                results[index]["status"] = "inserted"
+                continue
+            await db.execute(INSERT_LAP_IDEMPOTENT, (registration_id, lap.laptime, laptime_to_ms(lap.laptime),
+                                                     int(lap.event_phase_id), lap.client_lap_id))
+            if db.rowcount == 1:
+                results[index].update(status="inserted", lap_id=db.lastrowid)
+                stored.append((lap, registration_id, db.lastrowid))
+            else:
+                results[index].update(status="duplicate", detail="Duplicate lap, original result returned",
+                                      lap_id=db.lastrowid)
+                duplicates += 1
+                LAP_DUPLICATES.inc(source="database")
+
+        inserted_laps = [lap for index, lap, _ in new_laps if results[index]["status"] == "inserted"]
+        if inserted_laps:
+            await db.commit()
+            for lap, registration_id, lap_id in stored:
+                lap_dedup_index.put(lap.event_id, lap.web_user, lap.event_phase_id, lap.client_lap_id,
+                                    {"lap_id": lap_id, "laptime": lap.laptime, "event_phase_id": int(lap.event_phase_id)})
+                standings_engine.record_lap(lap.event_id, lap.event_phase_id, lap_id, registration_id,
+                                            laptime_to_ms(lap.laptime))
+            # Id kol z víceřádkového INSERTu se nevrací, do průběžného pořadí je dočte StandingsEngine.sync()
+            invalidate_tags(*(f"event:{event_id}" for event_id in sorted({int(lap.event_id) for lap in inserted_laps})))
+            for event_id, event_phase_id in {(int(lap.event_id), int(lap.event_phase_id)) for lap in inserted_laps}:
+                results_recompute.mark_dirty(event_id, event_phase_id)
+        await db.release()
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error saving lap data batch: {e}")
+
+    inserted = len(inserted_laps)
+    rejected = len(results) - inserted - duplicates
+    return {
+        "status": "success" if not rejected else ("partial" if inserted or duplicates else "failed"),
+        "message": f"{inserted} laps saved, {duplicates} duplicates, {rejected} rejected",
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "results": results,
+    }
 
 @router.get("/get/event/results", response_model=List[EventResultResponseModel])
-async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
+async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key),
+                            db: DbSession = Depends(db_session("low", prepared=True))):
     '''
         Vrcí výsledky celého závodu se všemi kategoriemi, seřazené podle car_category.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
     try:
         command ="""SELECT 
             reg.car_category_id, 
@@ -51,7 +343,7 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.id AS result_id, 
             er.event_phase_id, 
             er.event_registration_id, 
-            er.total_time, 
+            er.total_time_ms, 
             er.points, 
             er.position, 
             reg.dnf, 
@@ -78,21 +370,21 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.position;
 """
         values = (event_phase_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await db.execute(command, values)
+        result = await db.fetchall()
+        # Připojení se vrátí do poolu ještě před serializací odpovědi
+        await db.release()
 
         if not result or len(result) == 0:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: (row["car_category_id"], row["position"]))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.get("/get/event/results/{event_phase_id}", response_model=List[EventResultResponseModel])
 async def get_event_results_for_category(event_phase_id: int, event_id: int, car_category_id,api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
     try:
         command = """SELECT 
@@ -101,7 +393,7 @@ async def get_event_results_for_category(event_phase_id: int, event_id: int, car
             er.event_registration_id,
             reg.car_category_id,
             cc.name AS category_name,
-            er.total_time,
+            er.total_time_ms,
             er.points,
             er.position,
             reg.dnf,
@@ -128,25 +420,26 @@ async def get_event_results_for_category(event_phase_id: int, event_id: int, car
                 er.position;
     """
         values = (event_phase_id, car_category_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: row["position"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get("/get/dnf/{event_id}", response_model=List[EventResultResponseModel])
 async def get_dnf(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
     try:
         command = """
             SELECT er.id AS result_id, er.event_phase_id, er.event_registration_id, reg.car_category_id, 
-            cc.name AS category_name, er.total_time, er.points, er.position, reg.dnf, 
+            cc.name AS category_name, er.total_time_ms, er.points, er.position, reg.dnf, 
             drv.name AS driver_name, drv.email AS driver_email, drv.number, ep.phase_name, 
             drv.surname AS driver_surname, drv.email AS driver_email FROM event_result er 
             INNER JOIN event_registration reg ON er.event_registration_id = reg.id 
@@ -157,17 +450,18 @@ async def get_dnf(event_id: int, event_phase_id: int, api_key: APIKey = Depends(
             ORDER BY reg.car_category_id, er.position;
         """
         values = (event_phase_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: (row["car_category_id"], row["position"]))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get("/get/event/phase/driver/results", response_model=List[EventDriverEventResultsResponseModel])
 async def get_user_phase_results(
     web_user: str = Query(..., description="Web user of the driver", example="dominik"),
@@ -178,14 +472,14 @@ async def get_user_phase_results(
     '''
     Vrátí výsledky závodu pro daného řidiče, fázi a závod.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
         command = """
         SELECT 
             el.id, 
-            el.laptime AS time
+            el.laptime_ms AS time_ms
         FROM event_lap el
         JOIN event_registration er ON el.event_registration_id = er.id
         JOIN driver d ON er.driver_id = d.id
@@ -196,15 +490,15 @@ async def get_user_phase_results(
         ORDER BY el.id;
         """
         values = (web_user, event_id, event_phase_id)
-        cursor.execute(command, values)
-        results = cursor.fetchall()
+        await cursor.execute(command, values)
+        results = await cursor.fetchall()
 
         if not results:
             return []
 
-        return [EventDriverEventResultsResponseModel(lap=index + 1, time=result['time']) for index, result in enumerate(results)]
+        return [EventDriverEventResultsResponseModel(lap=index + 1, time=format_time_ms(result['time_ms'])) for index, result in enumerate(results)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        cursor.close()
-        db_connection.close()
\ No newline at end of file
+        await cursor.close()
+        await db_connection.close()
\ No newline at end of file
@@ -1,35 +1,43 @@
-from fastapi import FastAPI, APIRouter, Depends
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security.api_key import APIKey
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from db.connection import prioritized_get_db_connection
 import logging
+from db.connection import prioritized_get_db_connection
 import service.auth as auth
+from service.leader import results_leader
+from service.results_recompute import results_recompute
+from service.standings import ACTIVE_PHASES
+from routes.events import elect_result_leaders
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-scheduler = BackgroundScheduler()
-
-app = FastAPI()
-
 router = APIRouter()
 
-# Funkce pro aktualizaci průběžných výsledků
-def update_interim_results(event_id: int, event_phase_id: int):
-    db_connection = prioritized_get_db_connection(priority="high")
+# Funkce pro ruční aktualizaci výsledků fáze
+async def update_interim_results(event_id: int, event_phase_id: int):
+    """
+    Aktuální fázi závodu (a ručně spuštěnou) uloží z průběžného pořadí pod vedením fáze,
+    skončená fáze dostane konečné výsledky s dnf a body (finalize_phase_results).
+    """
+    key = (event_id, event_phase_id)
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
     try:
-        # Volání uložené procedury pro průběžné výsledky
-        cursor.callproc("UpdateActiveEventPhaseResults", (event_id, event_phase_id))
-        db_connection.commit()
-        logger.info(f"Interim results updated for event_id={event_id}, event_phase_id={event_phase_id}")
-    except Exception as e:
-        db_connection.rollback()
-        logger.error(f"Error updating interim results for event_id={event_id}, event_phase_id={event_phase_id}: {e}")
+        await cursor.execute("SELECT event_phase_id FROM event WHERE id = %s;", (event_id,))
+        row = await cursor.fetchone()
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    ended = row[0] != event_phase_id or event_phase_id not in ACTIVE_PHASES
+    if ended and key not in results_leader.pinned:
+        return await results_recompute.finalize(event_id, event_phase_id)
+    try:
+        return await results_recompute.update(event_id, event_phase_id)
+    except TimeoutError:
+        raise HTTPException(status_code=409, detail="Phase is led by another worker, its interim results are saved there")
 
 # Endpoint pro spuštění plánovače pro konkrétní závod a fázi
 @router.post("/start-event-update", response_model=dict)
@@ -38,19 +46,20 @@ async def start_event_update(
     event_phase_id: int,
     api_key: APIKey = Depends(auth.get_api_key)
 ):
-    scheduler.start()
-    job_id = f"interim_results_event_{event_id}_phase_{event_phase_id}"
-    if scheduler.get_job(job_id):
+    """
+    Spustí průběžné výsledky i pro fázi, která není aktuální fází závodu. Fázi povede
+    tento worker (service/leader.py), ruční spuštění platí do restartu workeru.
+    """
+    key = (event_id, event_phase_id)
+    if key in results_leader.pinned:
         return {"status": "error", "message": f"Update already running for event_id={event_id}, event_phase_id={event_phase_id}"}
 
-    scheduler.add_job(
-        update_interim_results,
-        trigger=IntervalTrigger(seconds=15),
-        args=[event_id, event_phase_id],
-        id=job_id,
-        name=f"Interim results for event {event_id} phase {event_phase_id}",
-        replace_existing=True,
-    )
+    results_leader.pinned.add(key)
+    await elect_result_leaders()
+    if not results_leader.holds(key):
+        # Fázi už vede jiný worker
+        results_leader.pinned.discard(key)
+        return {"status": "error", "message": f"Update already running for event_id={event_id}, event_phase_id={event_phase_id}"}
     logger.info(f"Scheduled job for event_id={event_id}, event_phase_id={event_phase_id}")
     return {"status": "success", "message": f"Update started for event_id={event_id}, event_phase_id={event_phase_id}"}
 
@@ -61,12 +70,16 @@ async def stop_event_update(
     event_phase_id: int,
     api_key: APIKey = Depends(auth.get_api_key)
 ):
-    job_id = f"interim_results_event_{event_id}_phase_{event_phase_id}"
-    if not scheduler.get_job(job_id):
+    """
+    Zastaví ručně spuštěné průběžné výsledky. Aktuální fázi závodu vede volba vedoucího
+    workeru dál, zastaví se změnou fáze závodu.
+    """
+    key = (event_id, event_phase_id)
+    if key not in results_leader.pinned:
         return {"status": "error", "message": f"No running update for event_id={event_id}, event_phase_id={event_phase_id}"}
 
-    scheduler.remove_job(job_id)
-    scheduler.shutdown()
+    results_leader.pinned.discard(key)
+    await elect_result_leaders()
     logger.info(f"Stopped job for event_id={event_id}, event_phase_id={event_phase_id}")
     return {"status": "success", "message": f"Update stopped for event_id={event_id}, event_phase_id={event_phase_id}"}
 
@@ -78,9 +91,24 @@ async def manual_update_event_results(
     api_key: APIKey = Depends(auth.get_api_key)
 ):
     try:
-        update_interim_results(event_id, event_phase_id)
-        return {"status": "success", "message": f"Results updated manually for event_id={event_id}, event_phase_id={event_phase_id}"}
+        rows_updated = await update_interim_results(event_id, event_phase_id)
+        return {"status": "success", "message": f"Results updated manually for event_id={event_id}, event_phase_id={event_phase_id}",
+                "rows_updated": rows_updated}
+    except HTTPException as e:
+        return {"status": "error", "message": e.detail}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-app.include_router(router)
+# Endpoint pro ruční uložení konečných výsledků fáze s body -> ukládají se samy po změně fáze závodu
+@router.post("/finalize-event-results", response_model=dict)
+async def finalize_event_results(
+    event_id: int,
+    event_phase_id: int,
+    api_key: APIKey = Depends(auth.get_api_key)
+):
+    try:
+        rows_updated = await results_recompute.finalize(event_id, event_phase_id)
+        return {"status": "success", "message": f"Final results saved for event_id={event_id}, event_phase_id={event_phase_id}",
+                "rows_updated": rows_updated}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
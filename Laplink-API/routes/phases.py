@@ -6,6 +6,10 @@ from db.connection import prioritized_get_db_connection
 from response_models.response_models import PhaseNameResponseModel, EventPhaseResponseModel, PostResponseModel
 from response_models.commonTypes import CreateEventPhase, UpdateEventPhase
 import service.auth as auth
+from service.result_cache import invalidate_tags
+from service.registration_resolver import on_event_phase_change
+from service.standings import on_event_phase_change as on_standings_phase_change
+from routes.events import elect_result_leaders, finalize_ended_phase
 
 router = APIRouter()
 
@@ -14,13 +18,13 @@ async def get_phase_name(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací název fáze podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
         command = """SELECT phase_name FROM event_phase WHERE id = %s;"""
-        cursor.execute(command, (id,))
-        result = cursor.fetchone()
+        await cursor.execute(command, (id,))
+        result = await cursor.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="Phase not found")
@@ -29,41 +33,41 @@ async def get_phase_name(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error fetching phase name: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/phases/", response_model=List[EventPhaseResponseModel])
 async def get_phases(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny fáze.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
         command = """SELECT * FROM event_phase;"""
-        cursor.execute(command)
-        result = cursor.fetchall()
+        await cursor.execute(command)
+        result = await cursor.fetchall()
 
         return JSONResponse(content={"data": result})
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error fetching phases: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event/phase/{id}", response_model=PhaseNameResponseModel)
 async def get_event_phase(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací fázi závodu podle ID závodu.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
         command = """SELECT phase_name FROM event_phase WHERE id = (SELECT event_phase_id FROM event WHERE id = %s);"""
-        cursor.execute(command, (id,))
-        result = cursor.fetchone()
+        await cursor.execute(command, (id,))
+        result = await cursor.fetchone()
 
         if not result:
             raise HTTPException(status_code=404, detail="Event phase not found")
@@ -72,29 +76,43 @@ async def get_event_phase(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error fetching event phase: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/event/phase/{id}", response_model=PostResponseModel)
 async def update_event_phase(data: UpdateEventPhase, api_key: APIKey = Depends(auth.get_api_key)):
     '''
-        Aktualizuje fázi závodu podle ID závodu.
+        Aktualizuje fázi závodu podle ID závodu. Skončená fáze dostane konečné výsledky s body.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
+        await cursor.execute("""SELECT event_phase_id FROM event WHERE id = %s FOR UPDATE;""", (data.id,))
+        current_event = await cursor.fetchone()
         command = """UPDATE event SET event_phase_id = %s WHERE id = %s;"""
-        cursor.execute(command, (data.phase_id, data.id))
-        db_connection.commit()
+        await cursor.execute(command, (data.phase_id, data.id))
+        await db_connection.commit()
+    except Exception as e:
+        await db_connection.rollback()
+        raise HTTPException(status_code=400, detail=f"Error updating event phase: {e}")
+    finally:
+        # Volba vedoucího a konečné výsledky (čekání na GET_LOCK) připojení z poolu nedrží
+        await cursor.close()
+        await db_connection.close()
+
+    try:
+        invalidate_tags(f"event:{data.id}", "rankings")
+        on_event_phase_change(data.id, data.phase_id)
+        on_standings_phase_change(data.id, data.phase_id)
+        if current_event is not None and current_event[0] != data.phase_id:
+            # Konečné výsledky skončené fáze, až když její průběžné výsledky nikdo nevede
+            await elect_result_leaders()
+            await finalize_ended_phase(data.id, current_event[0])
 
         return JSONResponse(content={"status": "success", "message": "Event phase updated successfully"})
     except Exception as e:
-        db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating event phase: {e}")
-    finally:
-        cursor.close()
-        db_connection.close()
 
 @router.post("/create/event/phase", response_model=PostResponseModel)
 async def create_event_phase(
@@ -103,18 +121,18 @@ async def create_event_phase(
     '''
         Vytvoří novou fázi závodu.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """INSERT INTO event_phase (phase_name, result_type) VALUES (%s, %s);"""
-        cursor.execute(command, (data.phase_name, data.result_type))
-        db_connection.commit()
+        await cursor.execute(command, (data.phase_name, data.result_type))
+        await db_connection.commit()
 
         return JSONResponse(content={"status": "success", "message": "Event phase created successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error creating event phase: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
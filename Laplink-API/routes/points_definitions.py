@@ -13,12 +13,12 @@ async def get_all_points_definitions(api_key: APIKey = Depends(auth.get_api_key)
     """
         Vrací všechny definice bodů.
     """
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM points_definition")
-        points_definitions = cursor.fetchall()
+        await cursor.execute("SELECT * FROM points_definition")
+        points_definitions = await cursor.fetchall()
 
         if not points_definitions:
             raise HTTPException(status_code=404, detail="No points definitions found")
@@ -27,20 +27,20 @@ async def get_all_points_definitions(api_key: APIKey = Depends(auth.get_api_key)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/points-definitions/{points_definition_id}", response_model=PointsDefinitionResponseModel)
 async def get_points_definition(points_definition_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     """
         Vrací definici bodů podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM points_definition WHERE id = %s", (points_definition_id,))
-        points_definition = cursor.fetchone()
+        await cursor.execute("SELECT * FROM points_definition WHERE id = %s", (points_definition_id,))
+        points_definition = await cursor.fetchone()
 
         if not points_definition:
             raise HTTPException(status_code=404, detail="Points definition not found")
@@ -49,15 +49,15 @@ async def get_points_definition(points_definition_id: int, api_key: APIKey = Dep
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/points-definitions/{points_definition_id}", response_model=PostResponseModel)
 async def update_points_definition(points_definition_id: int, points_definition_data: PointsDefinition, api_key: APIKey = Depends(auth.get_api_key)):
     """
         Aktualizuje definici bodů podle jejího ID.
     """
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
@@ -66,19 +66,19 @@ async def update_points_definition(points_definition_id: int, points_definition_
             SET position = %s, points = %s
             WHERE id = %s;
         """
-        cursor.execute(command, (
+        await cursor.execute(command, (
             points_definition_data.position, points_definition_data.points, points_definition_id
         ))
 
-        db_connection.commit()
+        await db_connection.commit()
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Points definition not found or no changes made")
 
         return JSONResponse(content={"status": "success", "message": "Points definition updated successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
@@ -6,6 +6,9 @@ from db.connection import prioritized_get_db_connection
 from response_models.response_models import GetAllEventRegistrations, DeleteResponseModel,PostResponseModel, EventRegistrationFillData, EventRegistrationResponseModel, EventRegistrationsResponseModel, GetAllEventRegistrationsWithIds
 from response_models.commonTypes import RegisterDriverToEvent
 import service.auth as auth
+from service.result_cache import invalidate_tags
+from service.registration_resolver import registration_resolver
+from service.standings import standings_engine
 from decimal import Decimal
 
 router = APIRouter()
@@ -15,65 +18,67 @@ async def register_driver_to_event(data: RegisterDriverToEvent, api_key: APIKey
     '''
         Zaregistruje řidiče na závod v tabulce event_registration.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """INSERT INTO event_registration (driver_id, car_id, car_category_id, car_configuration_id, event_id) 
                      VALUES (%s, %s, %s, %s, %s);"""
-        cursor.execute(command, (data.driver_id, data.car_id, data.car_category_id, data.car_configuration_id, data.event_id))
-        db_connection.commit()
+        await cursor.execute(command, (data.driver_id, data.car_id, data.car_category_id, data.car_configuration_id, data.event_id))
+        await db_connection.commit()
+        invalidate_tags(f"event:{data.event_id}", "rankings")
+        registration_resolver.invalidate(data.event_id)
         return JSONResponse(content={"status": "success", "message": "Driver registered to event successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error registering driver: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event/registrations", response_model=List[EventRegistrationResponseModel])
 async def get_event_registrations(event_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny registrace na závod podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM event_registration WHERE event_id = %s", (event_id,))
-        event_registrations = cursor.fetchall()
+        await cursor.execute("SELECT * FROM event_registration WHERE event_id = %s", (event_id,))
+        event_registrations = await cursor.fetchall()
         formatted_event_registrations = event_registrations
         return JSONResponse(content={"data": formatted_event_registrations})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event registrations: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/registrations", response_model=List[GetAllEventRegistrations])
 async def get_registrations(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny závodní registrace.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM event_registration")
-        event_registrations = cursor.fetchall()
+        await cursor.execute("SELECT * FROM event_registration")
+        event_registrations = await cursor.fetchall()
         return JSONResponse(content={"data": event_registrations})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching registrations: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event-registrations/{event_id}", response_model=List[EventRegistrationsResponseModel])
 async def get_event_registrations(event_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny registrace na závod podle jeho ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
@@ -105,8 +110,8 @@ async def get_event_registrations(event_id: int, api_key: APIKey = Depends(auth.
              group by er.id;
         """
 
-        cursor.execute(query, (event_id,))
-        event_registrations = cursor.fetchall()
+        await cursor.execute(query, (event_id,))
+        event_registrations = await cursor.fetchall()
 
         for reg in event_registrations:
             if isinstance(reg.get("power_weight_ratio"), Decimal):
@@ -118,15 +123,15 @@ async def get_event_registrations(event_id: int, api_key: APIKey = Depends(auth.
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event registrations: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/event-registrations/{event_registration_id}", response_model=PostResponseModel)
 async def update_event_registration(event_registration_id: int, event_registration_data: EventRegistrationFillData, api_key: APIKey = Depends(auth.get_api_key)):
     '''
     Aktualizuje registraci na závod podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
@@ -139,28 +144,33 @@ async def update_event_registration(event_registration_id: int, event_registrati
             event_registration_data.event_id, event_registration_data.dnf, event_registration_data.finished, event_registration_id
         )
 
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
+        # Registrace mohla přejít na jiný závod, původní event_id neznáme
+        registration_resolver.invalidate()
+        # Změna kategorie nebo závodu mění průběžné pořadí
+        standings_engine.invalidate()
 
         return JSONResponse(content={"status": "success", "message": "Event registration updated successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating registration: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event-registration/{event_registration_id}", response_model=GetAllEventRegistrations)
 async def get_event_registration(event_registration_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací registraci na závod podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM event_registration WHERE id = %s", (event_registration_id,))
-        event_registration = cursor.fetchone()
+        await cursor.execute("SELECT * FROM event_registration WHERE id = %s", (event_registration_id,))
+        event_registration = await cursor.fetchone()
 
         if not event_registration:
             raise HTTPException(status_code=404, detail="Event registration not found.")
@@ -169,41 +179,44 @@ async def get_event_registration(event_registration_id: int, api_key: APIKey = D
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event registration: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get("/get/event-registrations/return_ids/{event_id}", response_model=List[GetAllEventRegistrationsWithIds])
 async def get_event_registrations_with_ids(event_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací všechny registrace na závod podle jeho ID.
     '''
 
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("""SELECT * FROM event_registration WHERE event_id = %s""", (event_id,))
-        event_registrations = cursor.fetchall()
+        await cursor.execute("""SELECT * FROM event_registration WHERE event_id = %s""", (event_id,))
+        event_registrations = await cursor.fetchall()
         return event_registrations
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event registrations: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.delete("/delete/event-registration/{registration_id}", response_model=DeleteResponseModel)
 async def delete_event_registration(registration_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low", read_only=False)
     cursor = db_connection.cursor()
 
     try:
         command = "CALL DeleteEventRegistration(%s);"
-        cursor.execute(command, (registration_id,))
+        await cursor.execute(command, (registration_id,))
 
-        db_connection.commit()
+        await db_connection.commit()
+        invalidate_tags("results", "rankings")
+        registration_resolver.invalidate()
+        standings_engine.invalidate()
         return JSONResponse(content={"status": "success", "message": "Event registration deleted successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting event registration: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
\ No newline at end of file
+        await cursor.close()
+        await db_connection.close()
\ No newline at end of file
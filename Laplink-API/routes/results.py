@@ -1,26 +1,30 @@
 from collections import defaultdict
-from datetime import timedelta
 from decimal import Decimal
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from fastapi.security.api_key import APIKey
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from db.connection import prioritized_get_db_connection
 from response_models.response_models import EventResultResponseModel, DriverRankingModelApp, \
     EventResultsGroupedResponseModel, DetailedDriverRankingsResponseModel, EventResultsResponseModel, \
     EventResultsByCategoryResponseModel, TrainingQualificationResultResponseModel
 import service.auth as auth
+from service.result_cache import cached
+from service.standings import apply_live_standings
+from service.standings_feed import standings_feeds
+from utilities.formatting import format_time_ms, format_time_columns
 
 router = APIRouter()
 
 @router.get("/get/event/results", response_model=List[EventResultResponseModel])
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrcí výsledky celého závodu se všemi kategoriemi, seřazené podle car_category.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
     try:
         command ="""SELECT 
             reg.car_category_id, 
@@ -28,7 +32,7 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.id AS result_id, 
             er.event_phase_id, 
             er.event_registration_id, 
-            er.total_time, 
+            er.total_time_ms, 
             er.points, 
             er.position, 
             reg.dnf, 
@@ -55,22 +59,24 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.position;
 """
         values = (event_phase_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result or len(result) == 0:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: (row["car_category_id"], row["position"]))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/event/results/{event_phase_id}", response_model=List[EventResultResponseModel])
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_event_results_for_category(event_phase_id: int, event_id: int, car_category_id,api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
     try:
         command = """SELECT 
             er.id AS result_id,
@@ -78,7 +84,7 @@ async def get_event_results_for_category(event_phase_id: int, event_id: int, car
             er.event_registration_id,
             reg.car_category_id,
             cc.name AS category_name,
-            er.total_time,
+            er.total_time_ms,
             er.points,
             er.position,
             reg.dnf,
@@ -105,31 +111,34 @@ async def get_event_results_for_category(event_phase_id: int, event_id: int, car
                 er.position;
     """
         values = (event_phase_id, car_category_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: row["position"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get(
     "/get/app/event/results",
     response_model=EventResultsGroupedResponseModel
 )
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_app_event_results(event_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
     try:
         command = """
             SELECT 
                 reg.car_category_id, 
                 cc.name AS category_name, 
+                er.event_registration_id, 
                 er.position, 
-                er.total_time, 
+                er.total_time_ms, 
                 CONCAT(drv.name, ' ', drv.surname) AS full_name, 
                 drv.web_user,
                 er.event_phase_id,
@@ -152,12 +161,14 @@ async def get_app_event_results(event_id: int, api_key: APIKey = Depends(auth.ge
                 er.position ASC;
         """
         values = (event_id,)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result:
             return []
 
+        apply_live_standings(format_time_columns(result, "total_time"), event_id,
+                             sort_key=lambda row: (row["car_category_id"], row["event_phase_id"], row["position"]))
         grouped_results = {}
         for row in result:
             car_category = row["car_category_id"]
@@ -207,17 +218,18 @@ async def get_app_event_results(event_id: int, api_key: APIKey = Depends(auth.ge
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/dnf/{event_id}", response_model=List[EventResultResponseModel])
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_dnf(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
     try:
         command = """
             SELECT er.id AS result_id, er.event_phase_id, er.event_registration_id, reg.car_category_id, 
-            cc.name AS category_name, er.total_time, er.points, er.position, reg.dnf, 
+            cc.name AS category_name, er.total_time_ms, er.points, er.position, reg.dnf, 
             drv.name AS driver_name, drv.email AS driver_email, drv.number, ep.phase_name, 
             drv.surname AS driver_surname, drv.email AS driver_email FROM event_result er 
             INNER JOIN event_registration reg ON er.event_registration_id = reg.id 
@@ -228,26 +240,28 @@ async def get_dnf(event_id: int, event_phase_id: int, api_key: APIKey = Depends(
             ORDER BY reg.car_category_id, er.position;
         """
         values = (event_phase_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "total_time"), event_id, event_phase_id,
+                                    sort_key=lambda row: (row["car_category_id"], row["position"]))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/get/series/driver-rankings")
+@cached(tags=lambda series_id, **_: ("results", "rankings", f"series:{series_id}"))
 async def get_driver_rankings(series_id: int, car_category_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     """
     Vrací seznam řidičů s body v dané sérii, seřazené podle bodů.
     """
-    db_connection = prioritized_get_db_connection("low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection("low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -268,8 +282,8 @@ async def get_driver_rankings(series_id: int, car_category_id: int, api_key: API
                     GROUP BY d.id, d.name, d.surname, d.email, d.number, cc.name
                     ORDER BY points DESC;
                 """
-        cursor.execute(query, (series_id,car_category_id))
-        driver_rankings = cursor.fetchall()
+        await cursor.execute(query, (series_id,car_category_id))
+        driver_rankings = await cursor.fetchall()
 
         if not driver_rankings:
             raise HTTPException(status_code=404, detail="No driver rankings found for this series")
@@ -280,18 +294,19 @@ async def get_driver_rankings(series_id: int, car_category_id: int, api_key: API
         raise HTTPException(status_code=500, detail=f"Error fetching driver rankings: {e}")
 
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/get/series/detailed/driver-rankings")
+@cached(tags=lambda series_id, **_: ("results", "rankings", f"series:{series_id}"))
 async def get_detailed_driver_rankings(series_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     """
     Vrací seznam řidičů s body v dané sérii, seskupených podle kategorie vozidel, seřazené podle bodů,
     včetně zobrazení všech závodů série a kolik bodů v každém z nich dostal (součet bodů z kvalifikace a závodu).
     """
-    db_connection = prioritized_get_db_connection("low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection("low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -310,8 +325,8 @@ async def get_detailed_driver_rankings(series_id: int, api_key: APIKey = Depends
             WHERE e.series_id = %s 
             GROUP BY d.id, d.name, d.surname, d.number, car, cc.id, cc.name;
         """
-        cursor.execute(query, (series_id,))
-        drivers = cursor.fetchall()
+        await cursor.execute(query, (series_id,))
+        drivers = await cursor.fetchall()
 
         if not drivers:
             raise HTTPException(status_code=404, detail="No driver rankings found for this series")
@@ -333,8 +348,8 @@ async def get_detailed_driver_rankings(series_id: int, api_key: APIKey = Depends
                 GROUP BY e.id, e.name
                 ORDER BY e.id;
             """
-            cursor.execute(query_race_results, (driver_id, series_id))
-            race_results = cursor.fetchall()
+            await cursor.execute(query_race_results, (driver_id, series_id))
+            race_results = await cursor.fetchall()
 
             driver["races"] = {race["event_name"]: int(race["points"]) for race in race_results}
 
@@ -362,15 +377,16 @@ async def get_detailed_driver_rankings(series_id: int, api_key: APIKey = Depends
         raise HTTPException(status_code=500, detail=f"Error fetching detailed driver rankings: {e}")
 
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 @router.get("/get/series/all-rankings", response_model=List[DriverRankingModelApp])
+@cached(tags=lambda series_id, **_: ("results", "rankings", f"series:{series_id}"))
 async def get_all_driver_rankings(series_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     """
     Vrací seznam řidičů v dané sérii, seskupený podle kategorií vozidel a seřazený podle bodů.
     """
-    db_connection = prioritized_get_db_connection("low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection("low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -392,8 +408,8 @@ async def get_all_driver_rankings(series_id: int, api_key: APIKey = Depends(auth
             GROUP BY d.id, d.name, d.surname, d.email, d.number, cc.name
             ORDER BY cc.id, points DESC;
         """
-        cursor.execute(query, (series_id,))
-        results = cursor.fetchall()
+        await cursor.execute(query, (series_id,))
+        results = await cursor.fetchall()
 
         if not results:
             raise HTTPException(status_code=404, detail="No results found for this series")
@@ -404,17 +420,18 @@ async def get_all_driver_rankings(series_id: int, api_key: APIKey = Depends(auth
         raise HTTPException(status_code=500, detail=f"Error fetching all driver rankings: {e}")
 
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 
 @router.get("/get/phase/race/results/{event_id}/{phase_id}", response_model=List[EventResultsByCategoryResponseModel])
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_event_results(event_id: int, phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací výsledky závodu podle event_id a phase_id, seskupené podle kategorií aut.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
 
     try:
         query = """
@@ -428,8 +445,8 @@ async def get_event_results(event_id: int, phase_id: int, api_key: APIKey = Depe
                 reg.finished,
                 CONCAT(d.name, ' ', d.surname) AS driver_name,
                 CONCAT(c.maker, ' ', c.type) AS car,
-                SEC_TO_TIME(SUM(TIME_TO_SEC(el.laptime))) AS total_time,
-                GROUP_CONCAT(el.laptime ORDER BY el.id SEPARATOR ', ') AS lap_times
+                SUM(el.laptime_ms) AS total_time_ms,
+                GROUP_CONCAT(el.laptime_ms ORDER BY el.id SEPARATOR ',') AS lap_times_ms
             FROM 
                 event_result er
             JOIN event_registration reg ON er.event_registration_id = reg.id
@@ -443,19 +460,18 @@ async def get_event_results(event_id: int, phase_id: int, api_key: APIKey = Depe
             GROUP BY 
                 cat.id, cat.name, d.id, d.number, d.name, d.surname, c.maker, c.type, er.points
             ORDER BY 
-                cat.id ASC, total_time ASC;
+                cat.id ASC, total_time_ms ASC;
         """
 
-        cursor.execute(query, (event_id, phase_id))
-        event_results = cursor.fetchall()
+        await cursor.execute(query, (event_id, phase_id))
+        event_results = await cursor.fetchall()
 
         categories = defaultdict(list)
 
         for index, result in enumerate(event_results, start=1):
             result["position"] = len(categories[result["category_id"]]) + 1
-            if isinstance(result["total_time"], timedelta):
-                result["total_time"] = str(result["total_time"])
-            result["lap_times"] = result["lap_times"].split(", ")
+            result["total_time"] = format_time_ms(result.pop("total_time_ms"))
+            result["lap_times"] = [format_time_ms(int(ms)) for ms in result.pop("lap_times_ms").split(",")]
 
             categories[result["category_id"]].append(result)
 
@@ -469,18 +485,21 @@ async def get_event_results(event_id: int, phase_id: int, api_key: APIKey = Depe
         print(f"SQL Error: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/get/training/qualification/results", response_model=List[TrainingQualificationResultResponseModel])
+@cached(tags=lambda event_id, **_: ("results", f"event:{event_id}"))
 async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrací výsledky celého závodu se všemi kategoriemi, seřazené podle car_category.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
-    cursor = db_connection.cursor(dictionary=True)
+    db_connection = await prioritized_get_db_connection(priority="low")
+    cursor = db_connection.cursor(dictionary=True, prepared=True)
     try:
         command = """SELECT 
+            er.event_registration_id, 
+            reg.car_category_id, 
             er.position, 
             er.points, 
             drv.number, 
@@ -488,7 +507,7 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             drv.surname AS surname, 
             concat(c.maker, ' ', c.type) AS car, 
             cc.name AS car_class, 
-            min(el.laptime) AS best_lap
+            min(el.laptime_ms) AS best_lap_ms
         FROM 
             event_result er
         INNER JOIN event_registration reg ON er.event_registration_id = reg.id
@@ -500,6 +519,8 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.event_phase_id = %s 
             AND reg.event_id = %s
         GROUP BY 
+            er.event_registration_id, 
+            reg.car_category_id, 
             er.position, 
             er.points, 
             drv.number, 
@@ -513,14 +534,53 @@ async def get_event_results(event_id: int, event_phase_id: int, api_key: APIKey
             er.position;
         """
         values = (event_phase_id, event_id)
-        cursor.execute(command, values)
-        result = cursor.fetchall()
+        await cursor.execute(command, values)
+        result = await cursor.fetchall()
 
         if not result or len(result) == 0:
             raise HTTPException(status_code=404, detail="Event results not found")
-        return result
+        return apply_live_standings(format_time_columns(result, "best_lap"), event_id, event_phase_id, time_column=None,
+                                    sort_key=lambda row: (row["car_category_id"], row["position"]))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching event results: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
+
+@router.get("/stream/event/{event_id}")
+async def stream_event_results(
+    request: Request,
+    event_id: int,
+    event_phase_id: Optional[int] = None,
+    car_category_id: Optional[int] = None,
+    api_key: APIKey = Depends(auth.get_stream_api_key)
+):
+    '''
+        Živé průběžné pořadí závodu jako Server-Sent Events (text/event-stream), náhrada
+        opakovaného dotazování výsledkových endpointů. Bez event_phase_id se sleduje aktuální
+        fáze závodu, car_category_id omezí zprávy na jednu kategorii.
+        Po připojení přijde událost "snapshot" s celým pořadím (results), potom události "diff"
+        se změněnými řádky (changed) a id registrací, které z pořadí vypadly (removed).
+        Po obnovení spojení s hlavičkou Last-Event-ID přijdou jen zmeškané změny.
+    '''
+    if event_phase_id is None:
+        db_connection = await prioritized_get_db_connection(priority="low")
+        cursor = db_connection.cursor()
+        try:
+            await cursor.execute("SELECT event_phase_id FROM event WHERE id = %s;", (event_id,))
+            row = await cursor.fetchone()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error fetching event phase: {e}")
+        finally:
+            await cursor.close()
+            await db_connection.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Event not found")
+        event_phase_id = row[0]
+
+    return StreamingResponse(
+        standings_feeds.subscribe(event_id, event_phase_id, car_category_id, request.headers.get("Last-Event-ID")),
+        media_type="text/event-stream",
+        # Proxy (nginx) nesmí odpověď bufferovat, zprávy mají odcházet hned
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
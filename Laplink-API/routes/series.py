@@ -6,6 +6,7 @@ from db.connection import prioritized_get_db_connection
 from response_models.response_models import SeriesResponseModel, PostResponseModel, DeleteResponseModel
 from response_models.commonTypes import CreateSeries, UpdateSerie
 import service.auth as auth
+from service.result_cache import cached, invalidate_tags
 
 router = APIRouter()
 
@@ -16,96 +17,101 @@ async def create_series(
     '''
         Vytvoří novou sérii.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
     try:
         convert_year = int(data.year)
         command = """INSERT INTO series (name, year) VALUES (%s, %s);"""
         values = (data.name, convert_year)
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
+        invalidate_tags("series", "rankings")
         return JSONResponse(content={"status": "success", "message": "Series created successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error creating series: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.delete("/delete/series/{id}", response_model=DeleteResponseModel)
 async def delete_series(id: int, api_key: APIKey = Depends(auth.get_api_key)):
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
-        cursor.execute("""CALL DeleteSeries(%s)""", (id,))
-        db_connection.commit()
+        await cursor.execute("""CALL DeleteSeries(%s)""", (id,))
+        await db_connection.commit()
+        invalidate_tags("series", "rankings")
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Series not found")
 
         return JSONResponse(content={"status": "success", "message": "Series and related events deleted successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting series: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.put("/update/series/{id}", response_model=PostResponseModel)
 async def update_series(id: int, data: UpdateSerie, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Aktualizuje sérii podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="high")
+    db_connection = await prioritized_get_db_connection(priority="high")
     cursor = db_connection.cursor()
 
     try:
         command = """UPDATE series SET name = %s, year = %s WHERE id = %s;"""
         values = (data.name, data.year, id)
-        cursor.execute(command, values)
-        db_connection.commit()
+        await cursor.execute(command, values)
+        await db_connection.commit()
+        invalidate_tags("series", "rankings")
 
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Series not found or no changes made")
 
         return JSONResponse(content={"status": "success", "message": "Series updated successfully"})
     except Exception as e:
-        db_connection.rollback()
+        await db_connection.rollback()
         raise HTTPException(status_code=400, detail=f"Error updating series: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/series", response_model=List[SeriesResponseModel])
+@cached(tags=lambda **_: ("series",))
 async def get_series(api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrátí všechny série.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM series")
-        series = cursor.fetchall()
+        await cursor.execute("SELECT * FROM series")
+        series = await cursor.fetchall()
         return JSONResponse(content={"data": series})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching series: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
 
 @router.get("/series/{id}", response_model=SeriesResponseModel)
+@cached(tags=lambda **_: ("series",))
 async def get_series(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     '''
         Vrátí sérii podle jejího ID.
     '''
-    db_connection = prioritized_get_db_connection(priority="low")
+    db_connection = await prioritized_get_db_connection(priority="low")
     cursor = db_connection.cursor(dictionary=True)
 
     try:
-        cursor.execute("SELECT * FROM series WHERE id = %s", (id,))
-        series = cursor.fetchone()
+        await cursor.execute("SELECT * FROM series WHERE id = %s", (id,))
+        series = await cursor.fetchone()
 
         if not series:
             raise HTTPException(status_code=404, detail="Series not found")
@@ -114,5 +120,5 @@ async def get_series(id: int, api_key: APIKey = Depends(auth.get_api_key)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching series: {e}")
     finally:
-        cursor.close()
-        db_connection.close()
+        await cursor.close()
+        await db_connection.close()
@@ -1,13 +1,31 @@
-from fastapi.security.api_key import APIKeyHeader
-from fastapi import Security, HTTPException
-from starlette.status import HTTP_401_UNAUTHORIZED
+from fastapi.security.api_key import APIKeyHeader, APIKeyQuery
+from fastapi import Security, HTTPException, WebSocket, WebSocketException
+from starlette.status import HTTP_401_UNAUTHORIZED, WS_1008_POLICY_VIOLATION
 import os
 
 api_key_header = APIKeyHeader(name="X-API-KEY", auto_error=False)
+api_key_query = APIKeyQuery(name="api_key", auto_error=False)
 
 async def get_api_key(api_key_header: str = Security(api_key_header)):
     if api_key_header is None:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Access token is missing")
     if api_key_header != os.getenv("API_KEY"):
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Invalid API Key")
-    return api_key_header
\ No newline at end of file
+    return api_key_header
+
+async def get_stream_api_key(api_key_header: str = Security(api_key_header), api_key_query: str = Security(api_key_query)):
+    """
+    Ověření API klíče pro Server-Sent Events. EventSource v prohlížeči neumí posílat vlastní
+    hlavičky, klíč proto může přijít i v parametru api_key.
+    """
+    return await get_api_key(api_key_header or api_key_query)
+
+async def get_websocket_api_key(websocket: WebSocket):
+    """
+    Ověření API klíče při otevření WebSocketu. Klíč se posílá v hlavičce X-API-KEY
+    handshaku, zařízení bez podpory vlastních hlaviček ho mohou poslat v parametru api_key.
+    """
+    api_key = websocket.headers.get("X-API-KEY") or websocket.query_params.get("api_key")
+    if api_key is None or api_key != os.getenv("API_KEY"):
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason="Invalid API Key")
+    return api_key
@@ -0,0 +1,25 @@
+"""
+Sdílený omezený threadpool pro blokující práci (hashování hesel, CPU náročné výpočty),
+aby nebrzdila event loop, který obsluhuje ostatní požadavky.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("WORKER_THREADS", 10)),
+    thread_name_prefix="laplink-worker",
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Spustí blokující funkci v threadpoolu a počká na výsledek bez blokování event loopu.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,227 @@
+"""
+Rozesílání vlajek zařízením připojeným přes WebSocket (routes/flags.py).
+
+Každé připojení má vlastní omezenou frontu zpráv a vlastní zapisovací task. Rozeslání
+vlajky zprávu jednou serializuje a jen ji vloží do front příjemců, na síť nečeká. Zápisy
+do jednotlivých socketů tak běží souběžně a zaseknuté zařízení nezdrží vlajku ostatním.
+
+Pomalé zařízení se odpojí: když je jeho fronta plná (FLAG_QUEUE_SIZE zpráv), nebo když
+odeslání jedné zprávy trvá déle než FLAG_SEND_TIMEOUT_MS. Odpojí se kódem 1013 (zkusit
+znovu později), zařízení se připojí znovu. Doba od rozeslání do odeslání zprávy se měří
+(laplink_flag_send_seconds).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from fastapi import WebSocketDisconnect
+from starlette.status import WS_1000_NORMAL_CLOSURE, WS_1013_TRY_AGAIN_LATER
+
+from service.metrics import Counter, Gauge, Histogram
+
+# Kolik neodeslaných zpráv smí čekat ve frontě jednoho připojení
+FLAG_QUEUE_SIZE = int(os.getenv("FLAG_QUEUE_SIZE", 32))
+# Nejdelší doba odeslání jedné zprávy, pomalejší zařízení se odpojí
+FLAG_SEND_TIMEOUT_MS = float(os.getenv("FLAG_SEND_TIMEOUT_MS", 2000))
+
+logger = logging.getLogger(__name__)
+
+FLAG_MESSAGES = Counter(
+    "laplink_flag_messages_total", "Zprávy vlajek podle výsledku (queued, sent, error, dropped).", ("result",))
+FLAG_EVICTIONS = Counter(
+    "laplink_flag_evictions_total", "Odpojená pomalá zařízení podle důvodu (queue_full, timeout).", ("reason",))
+FLAG_SEND_SECONDS = Histogram(
+    "laplink_flag_send_seconds", "Doba od rozeslání vlajky do jejího odeslání jednomu zařízení.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+
+
+class FlagConnection:
+    def __init__(self, hub, websocket, event_id, driver_id=None):
+        self.hub = hub
+        self.websocket = websocket
+        self.event_id = event_id
+        self.driver_id = driver_id
+        # Důvod odpojení hubem (pomalé zařízení), None u běžného odpojení
+        self.evicted = None
+        self._queue = asyncio.Queue(maxsize=FLAG_QUEUE_SIZE)
+        self._closed = asyncio.Event()
+        self._writer = None
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write())
+
+    def offer(self, text):
+        """
+        Vloží zprávu do fronty bez čekání. Plná fronta znamená pomalé zařízení, odpojí se.
+        """
+        if self.closed:
+            FLAG_MESSAGES.inc(result="dropped")
+            return False
+        try:
+            self._queue.put_nowait((time.monotonic(), text))
+        except asyncio.QueueFull:
+            FLAG_MESSAGES.inc(result="dropped")
+            self.evict("queue_full")
+            return False
+        FLAG_MESSAGES.inc(result="queued")
+        return True
+
+    async def _write(self):
+        """
+        Jediný zapisovač do socketu, zprávy odcházejí v pořadí rozeslání.
+        """
+        while True:
+            enqueued_at, text = await self._queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), FLAG_SEND_TIMEOUT_MS / 1000)
+            except asyncio.TimeoutError:
+                FLAG_MESSAGES.inc(result="error")
+                self.evict("timeout")
+                return
+            except Exception:
+                # Zařízení se odpojilo, handler připojení skončí na receive
+                FLAG_MESSAGES.inc(result="error")
+                self._closed.set()
+                return
+            FLAG_MESSAGES.inc(result="sent")
+            FLAG_SEND_SECONDS.observe(time.monotonic() - enqueued_at)
+
+    def evict(self, reason):
+        if self.closed:
+            return
+        self.evicted = reason
+        FLAG_EVICTIONS.inc(reason=reason)
+        logger.warning(f"Pomalé zařízení odpojeno ({reason}): event_id={self.event_id}, driver_id={self.driver_id}")
+        self.hub.unregister(self)
+        self._closed.set()
+
+    async def receive_text(self):
+        """
+        Další zpráva od zařízení. Vrátí None, když se zařízení odpojilo nebo ho odpojil hub.
+        """
+        if self.closed:
+            return None
+        receive = asyncio.ensure_future(self.websocket.receive_text())
+        closed = asyncio.ensure_future(self._closed.wait())
+        try:
+            await asyncio.wait((receive, closed), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in (receive, closed):
+                if not task.done():
+                    task.cancel()
+        if receive.cancelled():
+            return None
+        try:
+            return receive.result()
+        except (WebSocketDisconnect, RuntimeError):
+            self._closed.set()
+            return None
+
+    async def close(self):
+        """
+        Ukončí zapisovač a zavře socket. Zavření zaseknutého socketu se nečeká déle
+        než FLAG_SEND_TIMEOUT_MS.
+        """
+        self._closed.set()
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        code = WS_1013_TRY_AGAIN_LATER if self.evicted else WS_1000_NORMAL_CLOSURE
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), FLAG_SEND_TIMEOUT_MS / 1000)
+        except Exception:
+            # Socket už je zavřený nebo nereaguje
+            pass
+
+
+class FlagHub:
+    def __init__(self):
+        # event_id -> připojení všech zařízení závodu
+        self._events = {}
+        # (event_id, driver_id) -> připojení zařízení jezdce
+        self._drivers = {}
+
+    def __len__(self):
+        return sum(len(connections) for connections in self._events.values())
+
+    def pending(self):
+        return sum(connection.pending() for connections in self._events.values() for connection in connections)
+
+    def register(self, websocket, event_id, driver_id=None):
+        connection = FlagConnection(self, websocket, event_id, driver_id)
+        self._events.setdefault(event_id, set()).add(connection)
+        if driver_id is not None:
+            self._drivers.setdefault((event_id, driver_id), set()).add(connection)
+        connection.start()
+        return connection
+
+    def unregister(self, connection):
+        for index, key in ((self._events, connection.event_id), (self._drivers, (connection.event_id, connection.driver_id))):
+            connections = index.get(key)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    del index[key]
+
+    async def serve(self, websocket, event_id, driver_id=None):
+        """
+        Obslouží přijaté (accept) WebSocket připojení do jeho odpojení. Zprávy od zařízení
+        se potvrzují odpovědí, stejnou frontou jako vlajky.
+        """
+        connection = self.register(websocket, event_id, driver_id)
+        try:
+            while True:
+                message = await connection.receive_text()
+                if message is None:
+                    break
+                logger.debug(f"Přijatá zpráva: {message}")
+                connection.offer(f"Odpověď: {message}")
+        finally:
+            self.unregister(connection)
+            await connection.close()
+            logger.info(f"Odpojeno: event_id={event_id}, driver_id={driver_id}")
+
+    def _send(self, connections, message):
+        # Serializace jednou pro všechny příjemce, stejný tvar jako WebSocket.send_json
+        text = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        return sum(1 for connection in list(connections) if connection.offer(text))
+
+    def broadcast(self, event_id, message):
+        """
+        Rozešle zprávu všem zařízením závodu. Vrátí počet zařízení, kterým se zpráva zařadila.
+        """
+        return self._send(self._events.get(event_id, ()), message)
+
+    def send_to_driver(self, event_id, driver_id, message):
+        """
+        Pošle zprávu zařízením jednoho jezdce v závodě.
+        """
+        return self._send(self._drivers.get((event_id, driver_id), ()), message)
+
+    async def close(self):
+        """
+        Odpojí všechna zařízení (při vypínání workeru).
+        """
+        connections = [connection for connections in self._events.values() for connection in connections]
+        self._events.clear()
+        self._drivers.clear()
+        if connections:
+            await asyncio.gather(*(connection.close() for connection in connections), return_exceptions=True)
+
+
+flag_hub = FlagHub()
+
+FLAG_CONNECTIONS = Gauge(
+    "laplink_flag_connections", "Zařízení připojená pro příjem vlajek.", collect=lambda: {(): len(flag_hub)})
+FLAG_QUEUED = Gauge(
+    "laplink_flag_queued_messages", "Neodeslané zprávy vlajek ve frontách připojení.",
+    collect=lambda: {(): flag_hub.pending()})
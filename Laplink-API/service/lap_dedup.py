@@ -0,0 +1,68 @@
+"""
+Deduplikace opakovaně odeslaných kol podle klientského identifikátoru (client_lap_id).
+
+Zařízení na trati při výpadku spojení odeslání kola opakuje. Pokud kolo nese
+client_lap_id, server si pamatuje výsledek prvního uložení a na opakovaný požadavek
+ho vrátí bez dalšího zápisu. Index v paměti je rozdělený podle registrace
+(event_id, web_user), drží se jen pro naposledy aktivní registrace a v každé jen
+posledních LAP_DEDUP_PER_REGISTRATION kol. Za ním stojí unikátní klíč
+(event_registration_id, event_phase_id, client_lap_id) v tabulce event_lap, který
+zachytí duplicity po restartu nebo mezi workery.
+
+Registrace platí pro všechny fáze závodu a zařízení smí číslovat kola v každé fázi
+znovu od 1, kolo se proto hledá podle (event_phase_id, client_lap_id).
+"""
+import os
+from collections import OrderedDict
+
+from cachetools import LRUCache
+
+from service.metrics import Counter
+from service.registration_resolver import normalize_web_user
+
+LAP_DEDUP_REGISTRATIONS = int(os.getenv("LAP_DEDUP_REGISTRATIONS", 2000))
+LAP_DEDUP_PER_REGISTRATION = int(os.getenv("LAP_DEDUP_PER_REGISTRATION", 1000))
+
+# Uloží kolo s client_lap_id. Při duplicitě se nic nezmění a LAST_INSERT_ID() vrátí id původního kola.
+INSERT_LAP_IDEMPOTENT = """INSERT INTO event_lap (event_registration_id, laptime, laptime_ms, event_phase_id, client_lap_id)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id);"""
+
+LAP_DUPLICATES = Counter(
+    "laplink_lap_duplicates_total", "Opakovaně odeslaná kola podle místa zachycení (memory, database).", ("source",))
+
+
+class LapDedupIndex:
+    def __init__(self, registrations=LAP_DEDUP_REGISTRATIONS, per_registration=LAP_DEDUP_PER_REGISTRATION):
+        self._registrations = LRUCache(maxsize=registrations)
+        self._per_registration = per_registration
+
+    @staticmethod
+    def _key(event_id, web_user):
+        # Stejné porovnání web_user jako při dohledání registrace
+        return int(event_id), normalize_web_user(web_user)
+
+    def get(self, event_id, web_user, event_phase_id, client_lap_id):
+        laps = self._registrations.get(self._key(event_id, web_user))
+        if laps is None:
+            return None
+        return laps.get((int(event_phase_id), client_lap_id))
+
+    def put(self, event_id, web_user, event_phase_id, client_lap_id, result):
+        key = self._key(event_id, web_user)
+        laps = self._registrations.get(key)
+        if laps is None:
+            laps = self._registrations[key] = OrderedDict()
+        lap_key = (int(event_phase_id), client_lap_id)
+        laps[lap_key] = result
+        laps.move_to_end(lap_key)
+        while len(laps) > self._per_registration:
+            laps.popitem(last=False)
+
+    def discard(self, event_id, web_user, event_phase_id, client_lap_id):
+        laps = self._registrations.get(self._key(event_id, web_user))
+        if laps is not None:
+            laps.pop((int(event_phase_id), client_lap_id), None)
+
+
+lap_dedup_index = LapDedupIndex()
@@ -0,0 +1,313 @@
+"""
+Příjem kol s odloženým zápisem do databáze (write-behind).
+
+Při zapnutém LAP_WRITE_BEHIND se kolo z post_lap_data potvrdí, jakmile je zapsané
+v lokálním append-only žurnálu. Kola z fronty se na pozadí ukládají do event_lap
+po skupinách v jedné transakci (group commit): nejpozději po LAP_FLUSH_INTERVAL_MS
+milisekundách, nebo hned, jakmile se jich nasbírá LAP_FLUSH_MAX_LAPS.
+
+Žurnál má na každém řádku jeden JSON:
+    {"seq": 12, "lap": {...}}   přijaté kolo
+    {"flushed": 12}             kola do seq 12 včetně jsou v databázi
+Po restartu se znovu uloží kola za poslední značkou "flushed". Jakmile je fronta
+prázdná, žurnál se zkrátí na nulu. Zápisy do žurnálu se slučují, souběžné požadavky
+čekají na jeden společný write + fsync.
+
+Žurnál patří jednomu procesu. Při běhu s více workery musí mít každý worker
+vlastní LAP_JOURNAL_PATH, jinak by po restartu kola přehrálo více workerů.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from asyncmy.errors import DataError, IntegrityError
+from fastapi import HTTPException
+
+from db.connection import prioritized_get_db_connection
+from service.executor import run_blocking
+from service.lap_dedup import INSERT_LAP_IDEMPOTENT
+from service.registration_resolver import registration_resolver
+from service.metrics import Counter, Gauge, Histogram
+from service.result_cache import invalidate_tags
+from service.results_recompute import results_recompute
+from service.standings import standings_engine
+from utilities.formatting import laptime_to_ms
+
+LAP_WRITE_BEHIND = os.getenv("LAP_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+LAP_JOURNAL_PATH = os.getenv("LAP_JOURNAL_PATH", "lap_journal.log")
+# Bez fsync přežije potvrzené kolo pád procesu, ale ne pád stroje
+LAP_JOURNAL_FSYNC = os.getenv("LAP_JOURNAL_FSYNC", "1").lower() not in ("0", "false", "no")
+LAP_FLUSH_INTERVAL_MS = float(os.getenv("LAP_FLUSH_INTERVAL_MS", 50))
+LAP_FLUSH_MAX_LAPS = int(os.getenv("LAP_FLUSH_MAX_LAPS", 500))
+# Jak dlouho se při vypínání čeká na vyprázdnění fronty
+LAP_DRAIN_TIMEOUT = float(os.getenv("LAP_DRAIN_TIMEOUT", 30))
+
+INSERT_LAP = "INSERT INTO event_lap (event_registration_id, laptime, laptime_ms, event_phase_id) VALUES (%s, %s, %s, %s);"
+
+logger = logging.getLogger(__name__)
+
+LAP_FLUSHES = Counter(
+    "laplink_lap_journal_flushed_total", "Kola uložená z žurnálu do databáze (inserted, rejected).", ("result",))
+LAP_FLUSH_SECONDS = Histogram(
+    "laplink_lap_journal_flush_seconds", "Doba skupinového zápisu kol do databáze včetně commitu.")
+LAP_FLUSH_SIZE = Histogram(
+    "laplink_lap_journal_flush_laps", "Počet kol v jednom skupinovém zápisu.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+
+class LapJournal:
+    def __init__(self, path=LAP_JOURNAL_PATH):
+        self.path = path
+        self._file = None
+        self._lines = 0
+        self._seq = 0
+        self._flushed_seq = 0
+        # Počet kol, jejichž zápis do žurnálu ještě neskončil
+        self._pending = 0
+        # Kola zapsaná v žurnálu, která ještě nejsou v databázi: (seq, kolo)
+        self._buffer = deque()
+        # Řádky čekající na zápis do žurnálu: (řádek, kolo nebo None, future)
+        self._staged = []
+        self._writer = None
+        self._file_lock = asyncio.Lock()
+        self._flusher = None
+        self._wakeup = asyncio.Event()
+        self._accepting = False
+
+    @property
+    def depth(self):
+        return len(self._buffer)
+
+    def _read_unflushed(self):
+        """
+        Přečte žurnál a vrátí kola za poslední značkou "flushed". Poškozený poslední
+        řádek (pád během zápisu) se přeskočí, takové kolo nebylo potvrzeno.
+        """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Přeskakuji poškozený řádek žurnálu {self.path}: {line[:200]!r}")
+                    continue
+                if "flushed" in record:
+                    self._flushed_seq = max(self._flushed_seq, record["flushed"])
+                else:
+                    entries.append((record["seq"], record["lap"]))
+                    self._seq = max(self._seq, record["seq"])
+        self._seq = max(self._seq, self._flushed_seq)
+        return [entry for entry in entries if entry[0] > self._flushed_seq]
+
+    def _write_lines(self, lines):
+        self._file.write("".join(line + "\n" for line in lines))
+        self._file.flush()
+        if LAP_JOURNAL_FSYNC:
+            os.fsync(self._file.fileno())
+
+    def _truncate(self):
+        self._file.truncate(0)
+        self._file.flush()
+        if LAP_JOURNAL_FSYNC:
+            os.fsync(self._file.fileno())
+
+    async def start(self):
+        """
+        Otevře žurnál, zařadí do fronty nedokončená kola z minulého běhu a spustí zápis na pozadí.
+        """
+        entries = await run_blocking(self._read_unflushed)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lines = 1 if os.path.getsize(self.path) else 0
+        self._buffer.extend(entries)
+        if entries:
+            logger.warning(f"Z žurnálu {self.path} se znovu uloží {len(entries)} kol z minulého běhu")
+        self._accepting = True
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """
+        Přestane přijímat kola, počká na uložení fronty (nejvýše LAP_DRAIN_TIMEOUT) a zavře žurnál.
+        Co se nestihne uložit, zůstane v žurnálu pro příští start.
+        """
+        self._accepting = False
+        deadline = time.monotonic() + LAP_DRAIN_TIMEOUT
+        while (self._buffer or self._staged) and time.monotonic() < deadline:
+            self._wakeup.set()
+            await asyncio.sleep(0.05)
+        if self._buffer:
+            logger.warning(f"Při vypnutí zůstalo v žurnálu {self.path} {len(self._buffer)} neuložených kol")
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def append(self, lap):
+        """
+        Zapíše kolo do žurnálu. Vrátí se až po zápisu na disk, pak je kolo potvrzené.
+        """
+        if not self._accepting:
+            raise HTTPException(status_code=503, detail="Lap journal is not accepting laps")
+        self._seq += 1
+        seq = self._seq
+        self._pending += 1
+        try:
+            await self._write(json.dumps({"seq": seq, "lap": lap}, ensure_ascii=False), (seq, lap))
+        finally:
+            self._pending -= 1
+
+    async def _write(self, line, entry=None):
+        future = asyncio.get_running_loop().create_future()
+        self._staged.append((line, entry, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_staged())
+        # Zrušený požadavek nesmí zrušit společný zápis ostatních
+        await asyncio.shield(future)
+
+    async def _write_staged(self):
+        while self._staged:
+            batch, self._staged = self._staged, []
+            try:
+                async with self._file_lock:
+                    await run_blocking(self._write_lines, [line for line, _, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._lines += len(batch)
+            # Do fronty se kola řadí v pořadí zápisu, značka "flushed" pak pokrývá souvislý úsek seq
+            for _, entry, future in batch:
+                if entry is not None:
+                    self._buffer.append(entry)
+                future.set_result(None)
+            if len(self._buffer) >= LAP_FLUSH_MAX_LAPS:
+                self._wakeup.set()
+
+    async def _flush_loop(self):
+        retry_delay = LAP_FLUSH_INTERVAL_MS / 1000
+        while True:
+            if len(self._buffer) < LAP_FLUSH_MAX_LAPS:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), LAP_FLUSH_INTERVAL_MS / 1000)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                if self._buffer:
+                    await self._flush_batch()
+                elif self._lines and not self._pending:
+                    await self._compact()
+                retry_delay = LAP_FLUSH_INTERVAL_MS / 1000
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Zápis kol z žurnálu selhal, další pokus za {retry_delay:.2f} s: {e}")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 5.0)
+
+    async def _flush_batch(self):
+        batch = [self._buffer[index] for index in range(min(len(self._buffer), LAP_FLUSH_MAX_LAPS))]
+        started = time.perf_counter()
+        for _, lap in batch:
+            # Kola ze žurnálu starší verze nesou jen web_user
+            if "event_registration_id" not in lap:
+                lap["event_registration_id"] = await registration_resolver.resolve(lap["event_id"], lap["web_user"])
+        rejected = await self._insert([lap for _, lap in batch])
+        LAP_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        LAP_FLUSH_SIZE.observe(len(batch))
+        LAP_FLUSHES.inc(len(batch) - rejected, result="inserted")
+        if rejected:
+            LAP_FLUSHES.inc(rejected, result="rejected")
+
+        # Frontu zkracuje jen tento task, nová kola přibývají na konec
+        for _ in batch:
+            self._buffer.popleft()
+        self._flushed_seq = batch[-1][0]
+        invalidate_tags(*sorted({f"event:{lap['event_id']}" for _, lap in batch}))
+        await self._write(json.dumps({"flushed": self._flushed_seq}))
+
+    async def _insert_lap(self, cursor, lap):
+        """
+        Vrátí id nově uloženého kola, u duplicity None.
+        """
+        registration_id = lap["event_registration_id"]
+        if registration_id is None:
+            raise IntegrityError(1048, "Driver is not registered for this event")
+        if lap.get("client_lap_id") is None:
+            await cursor.execute(INSERT_LAP, (registration_id, lap["laptime"], laptime_to_ms(lap["laptime"]), lap["event_phase_id"]))
+        else:
+            # Kolo přehrané po pádu mezi commitem a značkou "flushed" se díky unikátnímu klíči neuloží dvakrát
+            await cursor.execute(INSERT_LAP_IDEMPOTENT, (registration_id, lap["laptime"], laptime_to_ms(lap["laptime"]),
+                                                         lap["event_phase_id"], lap["client_lap_id"]))
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    @staticmethod
+    def _record_standings(stored):
+        for lap, lap_id in stored:
+            if lap_id is not None:
+                standings_engine.record_lap(lap["event_id"], lap["event_phase_id"], lap_id,
+                                            lap["event_registration_id"], laptime_to_ms(lap["laptime"]))
+                results_recompute.mark_dirty(lap["event_id"], lap["event_phase_id"])
+
+    async def _insert(self, laps):
+        """
+        Uloží kola v jedné transakci. Když transakce spadne na datech (neexistující fáze,
+        neplatná hodnota), uloží kola po jednom a vadná zaloguje a zahodí, aby jedno kolo
+        nezablokovalo celou frontu. Ostatní chyby (výpadek databáze) se propagují a dávka
+        se zkusí znovu. Vrátí počet zahozených kol.
+        """
+        db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+        cursor = db_connection.cursor(prepared=True)
+        try:
+            try:
+                lap_ids = [await self._insert_lap(cursor, lap) for lap in laps]
+                await db_connection.commit()
+                self._record_standings(zip(laps, lap_ids))
+                return 0
+            except (IntegrityError, DataError) as e:
+                await db_connection.rollback()
+                logger.warning(f"Skupinový zápis {len(laps)} kol selhal, ukládám kola po jednom: {e}")
+
+            rejected = 0
+            for lap in laps:
+                try:
+                    lap_id = await self._insert_lap(cursor, lap)
+                    await db_connection.commit()
+                    self._record_standings([(lap, lap_id)])
+                except (IntegrityError, DataError) as e:
+                    await db_connection.rollback()
+                    rejected += 1
+                    logger.error(json.dumps({"event": "lap_rejected", "lap": lap, "error": str(e)}, ensure_ascii=False))
+            return rejected
+        except Exception:
+            await db_connection.rollback()
+            raise
+        finally:
+            await cursor.close()
+            await db_connection.close()
+
+    async def _compact(self):
+        async with self._file_lock:
+            # Kolo mohlo přijít během čekání na zámek
+            if self._buffer or self._pending:
+                return
+            await run_blocking(self._truncate)
+            self._lines = 0
+
+
+lap_journal = LapJournal()
+
+LAP_JOURNAL_DEPTH = Gauge(
+    "laplink_lap_journal_depth", "Počet potvrzených kol čekajících na zápis do databáze.",
+    collect=lambda: {(): lap_journal.depth})
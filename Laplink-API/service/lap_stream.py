@@ -0,0 +1,80 @@
+"""
+Podpora WebSocket relací pro průběžné odesílání kol z měřicích zařízení.
+
+Zařízení otevře jednu relaci pro závod a fázi a posílá v ní kola jako JSON zprávy.
+Každá zpráva se zpracuje stejnou cestou jako POST /laps/event/lap/data a potvrdí se
+v pořadí, v jakém přišla, včetně id kola a aktuálního pořadí jezdce v kategorii.
+Relace nedrží připojení z poolu, půjčuje si ho jen na uložení kola a dotaz na pořadí.
+"""
+from db.connection import prioritized_get_db_connection
+from service.metrics import Counter, Gauge
+from service.standings import standings_engine
+
+# Agregace času podle event_phase.result_type, stejně jako service/results_engine.py
+RESULT_AGGREGATES = {"MIN": "MIN(el.laptime_ms)", "SUM": "SUM(el.laptime_ms)"}
+
+DRIVER_POSITION_QUERY = """SELECT ranked.position
+    FROM (
+        SELECT reg.id,
+            ROW_NUMBER() OVER (ORDER BY {aggregate}) AS position
+        FROM event_registration reg
+        INNER JOIN event_lap el ON reg.id = el.event_registration_id
+        WHERE reg.event_id = %s
+            AND el.event_phase_id = %s
+            AND reg.car_category_id = (SELECT car_category_id FROM event_registration WHERE id = %s)
+        GROUP BY reg.id
+    ) ranked
+    WHERE ranked.id = %s;"""
+
+# Otevřené relace (WebSocket), jen pro metriky
+active_sessions = set()
+
+LAP_STREAM_MESSAGES = Counter(
+    "laplink_lap_stream_messages_total", "Zprávy přijaté WebSocket relacemi kol podle výsledku.", ("result",))
+LAP_STREAM_SESSIONS = Gauge(
+    "laplink_lap_stream_sessions", "Počet otevřených WebSocket relací pro odesílání kol.",
+    collect=lambda: {(): len(active_sessions)})
+
+
+async def get_phase_result_type(event_phase_id):
+    """
+    Vrátí (existuje, result_type) fáze. Fáze bez result_type (příprava, ukončen) nemají pořadí.
+    """
+    db_connection = await prioritized_get_db_connection(priority="high")
+    cursor = db_connection.cursor()
+    try:
+        await cursor.execute("SELECT result_type FROM event_phase WHERE id = %s;", (event_phase_id,))
+        row = await cursor.fetchone()
+        if row is None:
+            return False, None
+        return True, row[0]
+    finally:
+        await cursor.close()
+        await db_connection.close()
+
+
+async def get_driver_position(event_id, event_phase_id, registration_id, result_type):
+    """
+    Pořadí jezdce v jeho kategorii. Bere se z průběžného pořadí (service/standings.py),
+    pokud je fáze načtená a aktuální, jinak z kol uložených v databázi. Při zapnutém
+    LAP_WRITE_BEHIND v něm ještě nemusí být právě potvrzené kolo.
+    """
+    standings = standings_engine.live(event_id, event_phase_id)
+    if standings is not None and standings.knows(registration_id):
+        entry = standings.entry(registration_id)
+        return entry[0] if entry else None
+
+    aggregate = RESULT_AGGREGATES.get(result_type)
+    if aggregate is None:
+        return None
+    # Čte se z primární databáze, replika by právě uložené kolo ještě nemusela mít
+    db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+    cursor = db_connection.cursor()
+    try:
+        await cursor.execute(DRIVER_POSITION_QUERY.format(aggregate=aggregate),
+                             (event_id, event_phase_id, registration_id, registration_id))
+        row = await cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        await cursor.close()
+        await db_connection.close()
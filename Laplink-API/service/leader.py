@@ -0,0 +1,158 @@
+"""
+Volba vedoucího workeru pro úlohy, které mají běžet jen jednou (průběžné výsledky fáze).
+
+Vedení úlohy se drží pojmenovaným zámkem MariaDB (GET_LOCK) na vlastním připojení
+mimo pool. Zámek patří připojení, ne procesu: když worker spadne nebo se připojení
+přeruší, server zámek uvolní a při další volbě ho získá jiný worker. GET_LOCK se
+volá s nulovým timeoutem, volba tedy nikdy nečeká na cizí zámek.
+
+Jedno připojení drží zámky všech úloh workeru (MariaDB 10.0.2+ dovoluje víc zámků
+v jedné session), dotazy na něm se proto střídají pod asyncio zámkem. Jednorázová
+práce nad klíčem, o který volba neusiluje (exclusive), drží zámek na vlastním připojení.
+"""
+import asyncio
+import contextlib
+import logging
+
+import asyncmy
+from asyncmy.errors import MySQLError
+
+from db.connection import db_config
+from service.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Délka jména zámku je v MariaDB omezená na 64 znaků
+LOCK_NAME_MAX = 64
+
+LEADER_CHANGES = Counter(
+    "laplink_leader_changes_total", "Získaná a ztracená vedení úloh (acquired, released, lost).", ("lock", "change"))
+
+
+class LeaderElection:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._connection = None
+        self._held = set()
+        # Klíče spuštěné ručně v tomto workeru, o vedení se usiluje i mimo aktivní fáze
+        self.pinned = set()
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._held)
+
+    @property
+    def held(self):
+        return frozenset(self._held)
+
+    def holds(self, key):
+        return key in self._held
+
+    def lock_name(self, key):
+        name = ":".join(str(part) for part in (db_config["database"], self.prefix, *key))
+        return name[-LOCK_NAME_MAX:]
+
+    async def _query(self, operation, params=None):
+        if self._connection is None:
+            self._connection = await asyncmy.connect(autocommit=True, **db_config)
+        cursor = self._connection.cursor()
+        try:
+            await cursor.execute(operation, params)
+            return await cursor.fetchone()
+        finally:
+            await cursor.close()
+
+    def _drop_connection(self):
+        """
+        Po chybě připojení nelze zaručit, že zámky pořád drží, považují se za ztracené.
+        """
+        lost = set(self._held)
+        self._held.clear()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        LEADER_CHANGES.inc(len(lost), lock=self.prefix, change="lost")
+        return lost
+
+    async def elect(self, wanted):
+        """
+        Usiluje o vedení klíčů z wanted (a pinned), vedení ostatních klíčů pustí.
+        Vrátí (získané, ztracené nebo puštěné) klíče od minulé volby.
+        """
+        wanted = set(wanted) | self.pinned
+        released = set()
+        async with self._lock:
+            try:
+                # Ověření připojení, se ztraceným připojením jsou pryč i zámky
+                if self._held:
+                    await self._query("SELECT 1;")
+                for key in self._held - wanted:
+                    await self._query("SELECT RELEASE_LOCK(%s);", (self.lock_name(key),))
+                    self._held.discard(key)
+                    released.add(key)
+                    LEADER_CHANGES.inc(lock=self.prefix, change="released")
+                acquired = set()
+                for key in sorted(wanted - self._held):
+                    row = await self._query("SELECT GET_LOCK(%s, 0);", (self.lock_name(key),))
+                    if row and row[0] == 1:
+                        self._held.add(key)
+                        acquired.add(key)
+                        LEADER_CHANGES.inc(lock=self.prefix, change="acquired")
+                return acquired, released
+            except (MySQLError, OSError) as e:
+                logger.warning(f"Volba vedoucího workeru ({self.prefix}) selhala, vedení se pouští: {e}")
+                return set(), released | self._drop_connection()
+
+    async def release(self, key):
+        async with self._lock:
+            if key not in self._held:
+                return
+            self._held.discard(key)
+            LEADER_CHANGES.inc(lock=self.prefix, change="released")
+            try:
+                await self._query("SELECT RELEASE_LOCK(%s);", (self.lock_name(key),))
+            except (MySQLError, OSError):
+                self._drop_connection()
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self, key, timeout):
+        """
+        Drží vedení klíče po dobu bloku na vlastním připojení. Počká nejvýše timeout sekund,
+        než vedení pustí worker, který ho drží, jinak vyhodí TimeoutError. Klíč, který vede
+        tento worker (holds), se musí nejdřív pustit, jinak by čekal sám na sebe.
+        """
+        connection = await asyncmy.connect(autocommit=True, **db_config)
+        try:
+            cursor = connection.cursor()
+            try:
+                await cursor.execute("SELECT GET_LOCK(%s, %s);", (self.lock_name(key), timeout))
+                row = await cursor.fetchone()
+            finally:
+                await cursor.close()
+            if not row or row[0] != 1:
+                raise TimeoutError(f"Vedení {self.lock_name(key)} se nepodařilo získat do {timeout} s")
+            yield
+        finally:
+            # Zavřením připojení server zámek pustí
+            connection.close()
+
+    async def close(self):
+        """
+        Pustí všechna vedení (při vypínání workeru), ostatní workery je převezmou hned.
+        """
+        async with self._lock:
+            self._held.clear()
+            if self._connection is not None:
+                try:
+                    await self._query("SELECT RELEASE_ALL_LOCKS();")
+                except (MySQLError, OSError):
+                    pass
+                self._connection.close()
+                self._connection = None
+
+
+results_leader = LeaderElection("results")
+
+LEADER_HELD = Gauge(
+    "laplink_leader_held", "Počet úloh, které tento worker vede.", ("lock",),
+    collect=lambda: {(results_leader.prefix,): len(results_leader)})
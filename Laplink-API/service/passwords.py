@@ -0,0 +1,18 @@
+"""
+Hashování a ověřování hesel. passlib se načítá až při prvním použití, aby nezdržoval
+start workeru, a samotný výpočet běží ve sdíleném threadpoolu mimo event loop.
+"""
+from service.executor import run_blocking
+
+
+def _sha256_crypt():
+    from passlib.hash import sha256_crypt
+    return sha256_crypt
+
+
+async def hash_password(password):
+    return await run_blocking(_sha256_crypt().hash, password)
+
+
+async def verify_password(password, hashed_password):
+    return await run_blocking(_sha256_crypt().verify, password, hashed_password)
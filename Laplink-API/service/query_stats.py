@@ -0,0 +1,136 @@
+"""
+Měření SQL dotazů: otisk (fingerprint) dotazu, route, doba trvání a počet řádků.
+
+Každý dotaz se změří (dvě volání perf_counter). Dotazy nad DB_SLOW_QUERY_MS se vždy
+zapíšou do strukturovaného slow-query logu (logger "laplink.slow_query", JSON na řádek).
+Do agregací podle otisku se započítá jen vzorek dotazů daný DB_QUERY_SAMPLE_RATE,
+takže na produkci lze hook nechat zapnutý bez znatelné režie.
+"""
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from functools import lru_cache
+
+from service.metrics import Counter
+
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+# Podíl dotazů (0-1), které se započítají do agregací podle otisku
+QUERY_SAMPLE_RATE = float(os.getenv("DB_QUERY_SAMPLE_RATE", 1.0))
+# Kolik posledních měření se pro každý otisk drží kvůli výpočtu percentilů
+QUERY_STATS_WINDOW = int(os.getenv("DB_QUERY_STATS_WINDOW", 1000))
+# Horní mez počtu sledovaných otisků, aby dynamicky skládané dotazy nezaplnily paměť
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv("DB_QUERY_STATS_MAX_FINGERPRINTS", 500))
+
+slow_query_logger = logging.getLogger("laplink.slow_query")
+
+SLOW_QUERIES = Counter(
+    "laplink_db_slow_queries_total", "Počet dotazů delších než DB_SLOW_QUERY_MS.", ("route",))
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_VALUE_LIST = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)")
+_REPEATED_VALUE_LISTS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+
+_stats = {}
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(operation):
+    """
+    Vrátí normalizovaný tvar dotazu: literály a parametry nahrazené ?, jednotné mezery.
+    """
+    normalized = _STRING_LITERAL.sub("?", operation)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _VALUE_LIST.sub("(...)", normalized)
+    normalized = _REPEATED_VALUE_LISTS.sub("(...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip().rstrip(";")
+
+
+class _StatementStats:
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.samples = deque(maxlen=QUERY_STATS_WINDOW)
+        self.routes = {}
+
+    def add(self, route, duration, rowcount):
+        self.count += 1
+        self.rows += max(rowcount, 0)
+        self.total_seconds += duration
+        self.max_seconds = max(self.max_seconds, duration)
+        self.samples.append(duration)
+        self.routes[route] = self.routes.get(route, 0) + 1
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def record_query(operation, route, duration, rowcount):
+    """
+    Zaznamená provedený dotaz. Volá se z AsyncCursor po každém execute.
+    """
+    if duration * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(route=route)
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "fingerprint": fingerprint(operation),
+            "route": route,
+            "duration_ms": round(duration * 1000, 3),
+            "rows": rowcount,
+            "timestamp": time.time(),
+        }, ensure_ascii=False))
+
+    if QUERY_SAMPLE_RATE < 1.0 and random.random() >= QUERY_SAMPLE_RATE:
+        return
+
+    key = fingerprint(operation)
+    stats = _stats.get(key)
+    if stats is None:
+        if len(_stats) >= QUERY_STATS_MAX_FINGERPRINTS:
+            return
+        stats = _stats[key] = _StatementStats()
+    stats.add(route, duration, rowcount)
+
+
+def get_query_stats(limit=50, order_by="total"):
+    """
+    Vrátí agregace podle otisku dotazu seřazené podle celkového času, p95, max nebo počtu.
+    Při vzorkování zahrnují count a total jen navzorkované dotazy.
+    """
+    result = []
+    for key, stats in _stats.items():
+        ordered = sorted(stats.samples)
+        result.append({
+            "fingerprint": key,
+            "count": stats.count,
+            "rows": stats.rows,
+            "total_ms": round(stats.total_seconds * 1000, 3),
+            "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+            "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+            "max_ms": round(stats.max_seconds * 1000, 3),
+            "routes": dict(sorted(stats.routes.items(), key=lambda item: -item[1])),
+        })
+    sort_key = {"total": "total_ms", "p95": "p95_ms", "max": "max_ms", "count": "count"}.get(order_by, "total_ms")
+    result.sort(key=lambda item: item[sort_key], reverse=True)
+    return {
+        "sample_rate": QUERY_SAMPLE_RATE,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "statements": result[:limit],
+    }
+
+
+def reset_query_stats():
+    _stats.clear()
@@ -0,0 +1,180 @@
+"""
+Převod (web_user, event_id) na event_registration.id v paměti procesu.
+
+Uložení kola dřív v InsertLapTime hledalo jezdce a jeho registraci dvěma SELECTy,
+porovnání s COLLATE navíc nemohlo využít index na driver.web_user. Resolver načte
+všechny registrace závodu jedním dotazem, když závod přejde do fáze 1, 2 nebo 3
+(případně při prvním kole závodu) a dál odpovídá z paměti.
+
+Zápisové endpointy registrací a jezdců volají invalidate(). Invalidace platí jen
+v procesu, který zápis obsloužil. Proto se při nenalezeném jezdci závod znovu načte,
+pokud jsou data starší než REGISTRATION_RESOLVER_MISS_RELOAD sekund, a nová
+registrace se v ostatních workerech projeví nejpozději po této době.
+"""
+import asyncio
+import logging
+import os
+import time
+import unicodedata
+
+from db.connection import prioritized_get_db_connection
+from service.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_RESOLVER_MISS_RELOAD = float(os.getenv("REGISTRATION_RESOLVER_MISS_RELOAD", 5))
+
+REGISTRATION_QUERY = """SELECT d.web_user, reg.id
+    FROM event_registration reg
+    INNER JOIN driver d ON reg.driver_id = d.id
+    WHERE reg.event_id = %s
+    ORDER BY reg.id;"""
+
+REGISTRATION_LOOKUPS = Counter(
+    "laplink_registration_resolver_lookups_total", "Dotazy na resolver registrací (hit, miss).", ("result",))
+REGISTRATION_LOADS = Counter(
+    "laplink_registration_resolver_loads_total", "Načtení registrací závodu z databáze.")
+
+
+def normalize_web_user(web_user):
+    """
+    Přiblíží porovnání utf8mb4_unicode_ci: bez ohledu na velikost písmen, diakritiku
+    a mezery na konci.
+    """
+    decomposed = unicodedata.normalize("NFKD", web_user)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold().rstrip(" ")
+
+
+class RegistrationResolver:
+    def __init__(self):
+        # event_id -> (čas načtení, {normalizovaný web_user: event_registration_id})
+        self._events = {}
+        self._loading = {}
+        self._generation = 0
+        self._event_generations = {}
+
+    def __len__(self):
+        return len(self._events)
+
+    def _generation_of(self, event_id):
+        return self._generation, self._event_generations.get(event_id, 0)
+
+    async def _fetch(self, event_id, db=None):
+        # Čte se z primární databáze, na replice by čerstvá registrace ještě nemusela být
+        if db is not None:
+            await db.execute(REGISTRATION_QUERY, (event_id,))
+            rows = await db.fetchall()
+        else:
+            db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+            cursor = db_connection.cursor(dictionary=True)
+            try:
+                await cursor.execute(REGISTRATION_QUERY, (event_id,))
+                rows = await cursor.fetchall()
+            finally:
+                await cursor.close()
+                await db_connection.close()
+
+        registrations = {}
+        for row in rows:
+            # Stejně jako InsertLapTime bere při více registracích první
+            registrations.setdefault(normalize_web_user(row["web_user"]), row["id"])
+        return registrations
+
+    async def load(self, event_id, db=None):
+        """
+        Načte registrace závodu. Souběžná volání pro stejný závod čekají na jeden dotaz.
+        `db` je volitelná DbSession, jinak si resolver půjčí vlastní připojení.
+        """
+        event_id = int(event_id)
+        pending = self._loading.get(event_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        generation = self._generation_of(event_id)
+        future = asyncio.get_running_loop().create_future()
+        self._loading[event_id] = future
+        try:
+            registrations = await self._fetch(event_id, db)
+            REGISTRATION_LOADS.inc()
+            # Invalidace během dotazu: výsledek se vrátí, ale neuloží
+            if self._generation_of(event_id) == generation:
+                self._events[event_id] = (time.monotonic(), registrations)
+            future.set_result(registrations)
+            return registrations
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Výjimku si převezmou čekající volání, jinak by asyncio hlásilo nepřevzatou výjimku
+            future.exception()
+            raise
+        finally:
+            del self._loading[event_id]
+
+    async def resolve(self, event_id, web_user, db=None):
+        """
+        Vrátí id registrace jezdce na závod, nebo None, pokud jezdec na závod registrovaný není.
+        """
+        event_id = int(event_id)
+        key = normalize_web_user(web_user)
+        entry = self._events.get(event_id)
+        if entry is None:
+            registrations = await self.load(event_id, db)
+        else:
+            loaded_at, registrations = entry
+            if key not in registrations and time.monotonic() - loaded_at >= REGISTRATION_RESOLVER_MISS_RELOAD:
+                registrations = await self.load(event_id, db)
+
+        registration_id = registrations.get(key)
+        REGISTRATION_LOOKUPS.inc(result="hit" if registration_id is not None else "miss")
+        return registration_id
+
+    def invalidate(self, event_id=None):
+        """
+        Zahodí registrace jednoho závodu, bez event_id všech závodů.
+        """
+        if event_id is None:
+            self._generation += 1
+            self._events.clear()
+        else:
+            event_id = int(event_id)
+            self._event_generations[event_id] = self._event_generations.get(event_id, 0) + 1
+            self._events.pop(event_id, None)
+
+    def forget(self, event_id):
+        """
+        Uvolní registrace závodu, který skončil. Při dalším kole by se načetly znovu.
+        """
+        self._events.pop(int(event_id), None)
+
+
+registration_resolver = RegistrationResolver()
+
+REGISTRATION_RESOLVER_EVENTS = Gauge(
+    "laplink_registration_resolver_events", "Počet závodů s registracemi načtenými v paměti.",
+    collect=lambda: {(): len(registration_resolver)})
+
+
+_preload_tasks = set()
+
+
+async def _preload(event_id):
+    try:
+        await registration_resolver.load(event_id)
+    except Exception as e:
+        logger.warning(f"Registrace závodu {event_id} se nepodařilo načíst dopředu: {e}")
+
+
+def on_event_phase_change(event_id, event_phase_id):
+    """
+    Volá se po změně fáze závodu. Při přechodu do fáze 1, 2 nebo 3 načte registrace
+    na pozadí (chyba se jen zaloguje, registrace se pak načtou s prvním kolem),
+    v ostatních fázích je z paměti uvolní.
+    """
+    if event_phase_id in (1, 2, 3):
+        task = asyncio.create_task(_preload(event_id))
+        _preload_tasks.add(task)
+        task.add_done_callback(_preload_tasks.discard)
+    else:
+        registration_resolver.forget(event_id)
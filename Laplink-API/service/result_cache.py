@@ -0,0 +1,157 @@
+"""
+Cache výsledků čtecích endpointů s invalidací podle tagů.
+
+Každý záznam nese tagy (např. "results", "event:56", "series:3") a verze těchto tagů
+v okamžiku, kdy se začal načítat. Zápisové endpointy volají invalidate_tags(), které
+verzi tagu zvýší, takže všechny záznamy s tímto tagem přestanou platit bez procházení cache.
+Záznamy navíc vyprší po RESULT_CACHE_TTL sekundách a při zaplnění se vyhazují
+nejdéle nepoužité (cachetools.TTLCache).
+
+Cache žije v paměti procesu. Při běhu s více workery má každý worker vlastní cache
+a invalidace platí jen v procesu, který zápis obsloužil; TTL proto drží nízké.
+"""
+import asyncio
+import functools
+import os
+
+from cachetools import TTLCache
+from starlette.responses import Response
+
+from service.metrics import Counter, Gauge, current_route
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 15))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))
+
+# Argumenty handleru, které nejsou součástí klíče
+_IGNORED_ARGUMENTS = {"api_key", "db"}
+_MISSING = object()
+
+CACHE_REQUESTS = Counter(
+    "laplink_result_cache_requests_total", "Požadavky na cache výsledků (hit, miss).", ("route", "result"))
+CACHE_INVALIDATIONS = Counter(
+    "laplink_result_cache_invalidations_total", "Invalidace cache výsledků podle typu tagu.", ("tag",))
+
+
+class _FrozenResponse:
+    """
+    Uložená odpověď. Instance Response se mezi požadavky sdílet nesmí
+    (middleware upravují její hlavičky), proto se při každém zásahu skládá nová.
+    """
+
+    def __init__(self, response):
+        self.body = response.body
+        self.status_code = response.status_code
+        self.media_type = response.media_type
+
+    def thaw(self):
+        return Response(content=self.body, status_code=self.status_code, media_type=self.media_type)
+
+
+class TaggedCache:
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._tag_versions = {}
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _versions(self, tags):
+        return tuple(self._tag_versions.get(tag, 0) for tag in tags)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        tags, versions, value = entry
+        if self._versions(tags) != versions:
+            self._entries.pop(key, None)
+            return _MISSING
+        return value
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._tag_versions[tag] = self._tag_versions.get(tag, 0) + 1
+            CACHE_INVALIDATIONS.inc(tag=tag.split(":", 1)[0])
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_load(self, key, tags, loader):
+        """
+        Vrátí (hit, hodnota). Souběžné požadavky na stejný klíč čekají na jedno načtení,
+        aby po invalidaci nešly do databáze všechny najednou.
+        """
+        value = self.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return True, value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            value = await asyncio.shield(pending)
+            if value is not _MISSING:
+                self.hits += 1
+                return True, value
+
+        self.misses += 1
+        # Verze se berou před načtením: invalidace během dotazu uložený záznam rovnou zneplatní
+        versions = self._versions(tags)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        value = _MISSING
+        try:
+            value = await loader()
+            self._entries[key] = (tags, versions, value)
+            return False, value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+            future.set_result(value)
+
+
+result_cache = TaggedCache()
+
+CACHE_ENTRIES = Gauge(
+    "laplink_result_cache_entries", "Počet záznamů v cache výsledků.",
+    collect=lambda: {(): len(result_cache)})
+
+
+def invalidate_tags(*tags):
+    """
+    Zneplatní všechny záznamy cache označené některým z tagů.
+    """
+    result_cache.invalidate(*tags)
+
+
+def cached(tags):
+    """
+    Dekorátor pro async handler, který cachuje jeho návratovou hodnotu.
+    `tags` je funkce, která z argumentů handleru vrátí seznam tagů záznamu.
+    Výjimky (např. 404) se necachují.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__name__}:{func.__code__.co_firstlineno}"
+
+        async def load(kwargs):
+            value = await func(**kwargs)
+            return _FrozenResponse(value) if isinstance(value, Response) else value
+
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            if not RESULT_CACHE_ENABLED:
+                return await func(**kwargs)
+
+            key = (name,) + tuple(sorted(
+                (argument, value) for argument, value in kwargs.items() if argument not in _IGNORED_ARGUMENTS
+            ))
+            hit, value = await result_cache.get_or_load(key, tuple(tags(**kwargs)), lambda: load(kwargs))
+            CACHE_REQUESTS.inc(route=current_route(), result="hit" if hit else "miss")
+            return value.thaw() if isinstance(value, _FrozenResponse) else value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,147 @@
+"""
+Výpočet konečných výsledků fáze závodu nad poli NumPy, bez přístupu k databázi.
+
+Vstupem jsou registrace (id, kategorie, dnf) a kola jako dvě stejně dlouhá pole
+(id registrace, čas kola v ms). Výstupem je pro každou registraci s aspoň jedním kolem
+čas, pořadí v kategorii a body. Pravidla odpovídají dřívější proceduře
+CreateActiveEventPhaseResult:
+
+- fáze MIN: čas je nejlepší kolo, fáze SUM: součet časů kol,
+- pořadí v kategorii podle času, ve fázi 3 (závod) jsou jezdci s dnf za ostatními,
+  shodné časy rozhoduje id registrace (stejně jako průběžné pořadí v service/standings.py),
+- body: kategorie bez bodů (S1+) nic, fáze SUM podle tabulky points_definition,
+  kvalifikace (fáze 2) 6/3/1 za první tři místa, ostatní fáze nic.
+
+Data z databáze načítá a výsledky ukládá service/results_store.py. Pravidla ověřuje
+tests/test_results_engine.py, výkon měří benchmarks/results_engine.py.
+"""
+import numpy as np
+
+# Fáze, ve které se jezdci s dnf řadí za ostatní
+RACE_PHASE = 3
+QUALIFICATION_PHASE = 2
+# Body za pořadí v kvalifikaci (fáze MIN)
+QUALIFICATION_POINTS = {1: 6, 2: 3, 3: 1}
+# Kategorie, které body nezískávají
+ZERO_POINT_CATEGORIES = ("S1+",)
+
+RESULT_COLUMNS = ("event_registration_id", "car_category_id", "total_time_ms", "position", "points")
+
+
+def _empty_results():
+    return {column: np.empty(0, dtype=np.int64) for column in RESULT_COLUMNS}
+
+
+def aggregate_laps(registration_ids, lap_registration_ids, laptimes_ms, result_type):
+    """
+    Vrátí (index registrace, čas v ms) pro registrace s aspoň jedním kolem. Index ukazuje
+    do registration_ids. Kola neznámých registrací se ignorují.
+    """
+    registration_ids = np.asarray(registration_ids, dtype=np.int64)
+    lap_registration_ids = np.asarray(lap_registration_ids, dtype=np.int64)
+    laptimes_ms = np.asarray(laptimes_ms, dtype=np.int64)
+    if not len(registration_ids) or not len(lap_registration_ids):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+
+    # Přiřazení kol k registracím binárním vyhledáváním v seřazených id
+    order = np.argsort(registration_ids, kind="stable")
+    sorted_ids = registration_ids[order]
+    found = np.searchsorted(sorted_ids, lap_registration_ids)
+    found_clipped = np.minimum(found, len(sorted_ids) - 1)
+    known = (found < len(sorted_ids)) & (sorted_ids[found_clipped] == lap_registration_ids)
+    lap_index = order[found_clipped[known]]
+    laptimes_ms = laptimes_ms[known]
+    if not len(lap_index):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+
+    # Kola seřazená podle registrace, redukce po souvislých úsecích
+    lap_order = np.argsort(lap_index, kind="stable")
+    lap_index = lap_index[lap_order]
+    laptimes_ms = laptimes_ms[lap_order]
+    starts = np.flatnonzero(np.diff(lap_index, prepend=-1))
+    reducer = np.minimum if result_type == "MIN" else np.add
+    return lap_index[starts], reducer.reduceat(laptimes_ms, starts)
+
+
+def rank_in_categories(category_ids, totals_ms, registration_ids, dnf_last=None):
+    """
+    Vrátí (pořadí řádků, pozice v kategorii). Řádky seřadí podle kategorie, dnf_last
+    (True za ostatními), času a id registrace, pozice počítá od 1 v každé kategorii.
+    """
+    category_ids = np.asarray(category_ids, dtype=np.int64)
+    if dnf_last is None:
+        dnf_last = np.zeros(len(category_ids), dtype=np.int8)
+    # lexsort řadí podle posledního klíče jako prvního
+    order = np.lexsort((registration_ids, totals_ms, dnf_last, category_ids))
+    sorted_categories = category_ids[order]
+    rows = np.arange(len(order))
+    category_start = np.diff(sorted_categories, prepend=sorted_categories[:1] - 1) != 0
+    first_row = np.maximum.accumulate(np.where(category_start, rows, 0))
+    return order, rows - first_row + 1
+
+
+def points_table(result_type, event_phase_id, points_definition=()):
+    """
+    Tabulka bodů podle pozice jako pole (index = pozice), pozice mimo tabulku mají 0.
+    """
+    if result_type == "SUM":
+        table = dict(points_definition)
+    elif event_phase_id == QUALIFICATION_PHASE:
+        table = QUALIFICATION_POINTS
+    else:
+        table = {}
+    lookup = np.zeros(max(table, default=0) + 1, dtype=np.int64)
+    for position, points in table.items():
+        lookup[int(position)] = points
+    return lookup
+
+
+def compute_phase_results(registration_ids, category_ids, lap_registration_ids, laptimes_ms, result_type,
+                          event_phase_id=None, dnf=None, zero_point_category_ids=(), points_definition=()):
+    """
+    Spočítá výsledky fáze. registration_ids, category_ids a dnf popisují registrace závodu
+    (stejně dlouhá pole), lap_registration_ids a laptimes_ms kola fáze. points_definition
+    jsou dvojice (pozice, body) pro fáze SUM.
+
+    Vrátí slovník polí podle RESULT_COLUMNS seřazený podle kategorie a pozice. Fáze bez
+    result_type (MIN/SUM) výsledky nemá.
+    """
+    if result_type not in ("MIN", "SUM"):
+        return _empty_results()
+    registration_ids = np.asarray(registration_ids, dtype=np.int64)
+    category_ids = np.asarray(category_ids, dtype=np.int64)
+
+    index, totals_ms = aggregate_laps(registration_ids, lap_registration_ids, laptimes_ms, result_type)
+    if not len(index):
+        return _empty_results()
+    result_registrations = registration_ids[index]
+    result_categories = category_ids[index]
+    dnf_last = None
+    if event_phase_id == RACE_PHASE and dnf is not None:
+        dnf_last = np.asarray(dnf, dtype=np.int8)[index] != 0
+
+    order, positions = rank_in_categories(result_categories, totals_ms, result_registrations, dnf_last)
+    result_registrations = result_registrations[order]
+    result_categories = result_categories[order]
+    totals_ms = totals_ms[order]
+
+    lookup = points_table(result_type, event_phase_id, points_definition)
+    points = np.where(positions < len(lookup), lookup[np.minimum(positions, len(lookup) - 1)], 0)
+    if len(zero_point_category_ids):
+        points[np.isin(result_categories, np.asarray(list(zero_point_category_ids), dtype=np.int64))] = 0
+
+    return {
+        "event_registration_id": result_registrations,
+        "car_category_id": result_categories,
+        "total_time_ms": totals_ms,
+        "position": positions.astype(np.int64),
+        "points": points.astype(np.int64),
+    }
+
+
+def result_rows(results):
+    """
+    Výsledky z compute_phase_results jako seznam slovníků s čísly Pythonu (pro zápis do databáze).
+    """
+    columns = [results[column].tolist() for column in RESULT_COLUMNS]
+    return [dict(zip(RESULT_COLUMNS, values)) for values in zip(*columns)]
@@ -0,0 +1,245 @@
+"""
+Přepočet průběžných výsledků (event_result) řízený zápisem kol.
+
+Každé uložené kolo označí dvojici (závod, fáze) jako změněnou (mark_dirty). Výsledky
+se uloží z průběžného pořadí (service/standings.py) až po RESULTS_DEBOUNCE_MS bez
+dalšího kola, nával kol tak vyvolá jeden zápis. Při nepřetržitém proudu kol se výsledky
+uloží nejpozději RESULTS_MAX_STALENESS_MS od prvního neuloženého kola. Závod, do kterého
+kola nechodí, nestojí nic.
+
+Pro jednu fázi běží nejvýše jeden zápis, kola, která přijdou během něj, naplánují další.
+Výsledky fáze ukládá jen worker, který fázi vede (service/leader.py). Kola uložená
+jinými workery si dočte v intervalu RESULTS_REFRESH_SECONDS (refresh), vlastní kola
+ukládá hned po debounce.
+
+Konečné výsledky skončené fáze (finalize) se ukládají také pod vedením fáze. Worker,
+který vedení pouští, nejdřív zastaví průběžné ukládání (release), průběžný zápis tak
+konečné výsledky nepřepíše.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from service.metrics import Counter, Gauge, Histogram
+from service.leader import results_leader
+from service.result_cache import invalidate_tags
+from service.results_store import finalize_phase_results
+from service.standings import ACTIVE_PHASES, standings_engine
+
+RESULTS_DEBOUNCE_MS = float(os.getenv("RESULTS_DEBOUNCE_MS", 500))
+RESULTS_MAX_STALENESS_MS = float(os.getenv("RESULTS_MAX_STALENESS_MS", 3000))
+# Za jak dlouho se zkusí znovu uložit výsledky po chybě (např. výpadek databáze)
+RESULTS_RETRY_MS = float(os.getenv("RESULTS_RETRY_MS", 5000))
+# Vedoucí worker fáze v tomto intervalu dočte kola ostatních workerů a hlídá nečinnost závodu
+RESULTS_REFRESH_SECONDS = float(os.getenv("RESULTS_REFRESH_SECONDS", 3))
+# Jak často se workery ucházejí o vedení aktivních fází (a zjistí pád vedoucího)
+RESULTS_LEADER_INTERVAL = float(os.getenv("RESULTS_LEADER_INTERVAL", 5))
+# Kolik převzatých fází se najednou načítá z databáze (start workeru s více živými závody)
+RESULTS_RESTORE_CONCURRENCY = int(os.getenv("RESULTS_RESTORE_CONCURRENCY", 4))
+# Jak dlouho konečné výsledky čekají, než vedení skončené fáze pustí jiný worker (při jeho další volbě)
+RESULTS_FINALIZE_TIMEOUT = float(os.getenv("RESULTS_FINALIZE_TIMEOUT", 3 * RESULTS_LEADER_INTERVAL))
+
+logger = logging.getLogger(__name__)
+
+RESULTS_RECOMPUTES = Counter(
+    "laplink_results_recompute_total", "Uložení průběžných výsledků do event_result (ok, error).", ("result",))
+RESULTS_RECOMPUTE_SECONDS = Histogram(
+    "laplink_results_recompute_seconds", "Doba uložení průběžných výsledků jedné fáze.")
+RESULTS_STALENESS_SECONDS = Histogram(
+    "laplink_results_staleness_seconds", "Doba od prvního neuloženého kola do uložení výsledků.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0))
+
+
+class ResultsRecompute:
+    def __init__(self, debounce_ms=RESULTS_DEBOUNCE_MS, max_staleness_ms=RESULTS_MAX_STALENESS_MS,
+                 retry_ms=RESULTS_RETRY_MS):
+        self.debounce = debounce_ms / 1000
+        self.max_staleness = max_staleness_ms / 1000
+        self.retry = retry_ms / 1000
+        # (závod, fáze) -> čas prvního neuloženého kola
+        self._dirty = {}
+        self._timers = {}
+        self._running = {}
+        # (závod, fáze) -> počet kol pořadí při poslední kontrole (refresh)
+        self._seen = {}
+        # (závod, fáze) -> řádky event_result změněné od posledního take_rows_changed
+        self._rows_changed = {}
+        # Fáze, jejichž vedení worker pouští nebo pustil, průběžně se už neukládají
+        self._released = set()
+
+    def pending(self):
+        return len(self._dirty)
+
+    def mark_dirty(self, event_id, event_phase_id):
+        """
+        Označí výsledky fáze k uložení. Volá se po commitu kola. Fázi, kterou vede
+        jiný worker, uloží on (kolo si dočte při refresh).
+        """
+        key = (int(event_id), int(event_phase_id))
+        if key[1] not in ACTIVE_PHASES or not results_leader.holds(key) or key in self._released:
+            return
+        now = time.monotonic()
+        dirty_since = self._dirty.setdefault(key, now)
+        if key in self._running:
+            # Po dokončení běžícího zápisu se naplánuje další
+            return
+        self._schedule(key, min(now + self.debounce, dirty_since + self.max_staleness) - now)
+
+    def _schedule(self, key, delay):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(max(delay, 0), self._start, key)
+
+    def _start(self, key):
+        self._timers.pop(key, None)
+        if key in self._running or key not in self._dirty or key in self._released:
+            return
+        task = asyncio.create_task(self._flush(key, self._dirty.pop(key)))
+        self._running[key] = task
+
+    async def _flush(self, key, dirty_since):
+        retry = False
+        try:
+            await self.flush(*key)
+            RESULTS_STALENESS_SECONDS.observe(time.monotonic() - dirty_since)
+        except Exception as e:
+            logger.error(f"Error updating interim results for event_id={key[0]}, event_phase_id={key[1]}: {e}")
+            # Značka zůstane i s původním časem, aby se neztratila
+            self._dirty[key] = min(self._dirty.get(key, dirty_since), dirty_since)
+            retry = True
+        finally:
+            del self._running[key]
+        if key in self._released:
+            self._dirty.pop(key, None)
+        elif retry:
+            self._schedule(key, self.retry)
+        elif key in self._dirty:
+            now = time.monotonic()
+            self._schedule(key, min(now + self.debounce, self._dirty[key] + self.max_staleness) - now)
+
+    async def flush(self, event_id, event_phase_id):
+        """
+        Hned uloží výsledky fáze z průběžného pořadí a vrátí počet změněných řádků.
+        """
+        started = time.perf_counter()
+        try:
+            rows_updated = await standings_engine.persist(event_id, event_phase_id)
+        except Exception:
+            RESULTS_RECOMPUTES.inc(result="error")
+            raise
+        key = (int(event_id), int(event_phase_id))
+        self._rows_changed[key] = self._rows_changed.get(key, 0) + rows_updated
+        if rows_updated:
+            # Beze změny pořadí zůstanou výsledky v cache platné
+            invalidate_tags(f"event:{event_id}", "rankings")
+        RESULTS_RECOMPUTES.inc(result="ok")
+        RESULTS_RECOMPUTE_SECONDS.observe(time.perf_counter() - started)
+        logger.info(f"Interim results updated for event_id={event_id}, event_phase_id={event_phase_id}, rows_updated={rows_updated}")
+        return rows_updated
+
+    def take_rows_changed(self, event_id, event_phase_id):
+        """
+        Vrátí počet řádků event_result změněných od minulého volání a čítač vynuluje.
+        """
+        return self._rows_changed.pop((int(event_id), int(event_phase_id)), 0)
+
+    async def refresh(self, event_id, event_phase_id):
+        """
+        Dočte kola uložená mimo tento worker a vrátí True, pokud od minulé kontroly přibyla.
+        Nová kola označí k uložení. Stojí jeden dotaz na event_lap podle id a created_at.
+        """
+        key = (int(event_id), int(event_phase_id))
+        standings = await standings_engine.sync(*key)
+        changed = standings.lap_count > self._seen.get(key, 0)
+        if changed:
+            self._seen[key] = standings.lap_count
+            self.mark_dirty(*key)
+        return changed
+
+    async def restore(self, event_id, event_phase_id):
+        """
+        Převzetí fáze (start workeru, pád předchozího vedoucího). Načte pořadí z databáze,
+        kola z doby bez vedoucího označí k uložení a kontrola nečinnosti pak počítá jen
+        kola, která přibudou od teď.
+        """
+        key = (int(event_id), int(event_phase_id))
+        self._released.discard(key)
+        standings = await standings_engine.sync(*key)
+        self._seen[key] = standings.lap_count
+        self.mark_dirty(*key)
+        return standings
+
+    async def release(self, event_id, event_phase_id):
+        """
+        Worker fázi přestává vést (fáze skončila, nebo ji převezme jiný worker). Volá se
+        před puštěním vedení: počká na běžící zápis a stav fáze zahodí i s neuloženými koly.
+        Skončenou fázi přepočte z event_lap finalize, převzatou nový vedoucí po restore.
+        """
+        key = (int(event_id), int(event_phase_id))
+        self._released.add(key)
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        running = self._running.get(key)
+        if running is not None:
+            await asyncio.gather(running, return_exceptions=True)
+        for state in (self._dirty, self._seen, self._rows_changed):
+            state.pop(key, None)
+
+    async def update(self, event_id, event_phase_id, timeout=0):
+        """
+        Ruční uložení průběžných výsledků fáze pod jejím vedením. Fázi vedenou tímto workerem
+        uloží hned, jinak jen když vedení do timeout sekund získá, fázi vedenou jiným workerem
+        (TimeoutError) ukládá ten. Vrátí počet změněných řádků.
+        """
+        key = (int(event_id), int(event_phase_id))
+        if results_leader.holds(key):
+            return await self.flush(*key)
+        async with results_leader.exclusive(key, timeout):
+            return await self.flush(*key)
+
+    async def finalize(self, event_id, event_phase_id, timeout=RESULTS_FINALIZE_TIMEOUT):
+        """
+        Uloží konečné výsledky fáze (finalize_phase_results) pod jejím vedením. Fázi vedenou
+        tímto workerem (ruční spuštění) uloží hned po zastavení průběžného zápisu, jinak počká
+        nejvýše timeout sekund, než vedení pustí jiný worker. Vrátí počet změněných řádků.
+        """
+        key = (int(event_id), int(event_phase_id))
+        if results_leader.holds(key):
+            await self.release(*key)
+            return await finalize_phase_results(*key)
+        async with results_leader.exclusive(key, timeout):
+            return await finalize_phase_results(*key)
+
+    def forget(self, event_id):
+        """
+        Zahodí plánované zápisy a stav kontroly všech fází závodu (např. po smazání závodu).
+        """
+        event_id = int(event_id)
+        for key in [key for key in self._timers if key[0] == event_id]:
+            self._timers.pop(key).cancel()
+        for state in (self._dirty, self._seen, self._rows_changed):
+            for key in [key for key in state if key[0] == event_id]:
+                del state[key]
+        self._released = {key for key in self._released if key[0] != event_id}
+
+    async def stop(self):
+        """
+        Uloží výsledky označených fází hned, bez čekání na debounce. Volá se při vypínání workeru.
+        """
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for key in list(self._dirty):
+            self._start(key)
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+
+results_recompute = ResultsRecompute()
+
+RESULTS_DIRTY = Gauge(
+    "laplink_results_dirty_phases", "Fáze závodů s koly, která ještě nejsou v event_result.",
+    collect=lambda: {(): results_recompute.pending()})
@@ -0,0 +1,155 @@
+"""
+Načítání dat pro výpočet výsledků fáze a zápis výsledků do event_result.
+
+Nahrazuje trigger after_event_phase_id_update a procedury CreateActiveEventPhaseResult
+a UpdateActiveEventPhaseResults (migrations/005_results_engine.sql). Databáze jen vydá
+registrace, kola a tabulku bodů, pořadí a body spočítá service/results_engine.py
+a výsledek se zapíše jako rozdíl proti uloženým řádkům (write_phase_results).
+
+Konečné výsledky fáze (s body) zapíše finalize_phase_results po změně fáze závodu,
+průběžné pořadí (bez bodů) ukládá StandingsEngine.persist přes stejný zápis.
+"""
+import logging
+import time
+
+from db.connection import prioritized_get_db_connection
+from service.executor import run_blocking
+from service.metrics import Counter, Histogram
+from service.result_cache import invalidate_tags
+from service.results_engine import ZERO_POINT_CATEGORIES, compute_phase_results, result_rows
+from utilities.formatting import format_time_ms
+
+logger = logging.getLogger(__name__)
+
+RESULT_TYPE_QUERY = "SELECT result_type FROM event_phase WHERE id = %s;"
+REGISTRATIONS_QUERY = """SELECT reg.id, reg.car_category_id, reg.dnf, cc.name
+    FROM event_registration reg
+    INNER JOIN car_category cc ON reg.car_category_id = cc.id
+    WHERE reg.event_id = %s;"""
+LAPS_QUERY = """SELECT el.event_registration_id, el.laptime_ms
+    FROM event_lap el
+    INNER JOIN event_registration reg ON el.event_registration_id = reg.id
+    WHERE reg.event_id = %s
+        AND el.event_phase_id = %s
+        AND el.laptime_ms IS NOT NULL;"""
+POINTS_DEFINITION_QUERY = "SELECT position, points FROM points_definition;"
+STORED_RESULTS_QUERY = """SELECT er.id, er.event_registration_id, er.total_time_ms, er.position, er.points
+    FROM event_result er
+    INNER JOIN event_registration reg ON er.event_registration_id = reg.id
+    WHERE reg.event_id = %s
+        AND er.event_phase_id = %s;"""
+
+RESULTS_FINALIZED = Counter(
+    "laplink_results_finalized_total", "Výpočty konečných výsledků fáze po změně fáze závodu (ok, error).",
+    ("result",))
+RESULTS_FINALIZE_SECONDS = Histogram(
+    "laplink_results_finalize_seconds", "Doba výpočtu a uložení konečných výsledků fáze.")
+
+
+async def write_phase_results(cursor, event_id, event_phase_id, rows, with_points=False):
+    """
+    Porovná výsledky fáze (řádky s event_registration_id, total_time_ms, position
+    a případně points) s event_result a zapíše jen nové, změněné a zaniklé řádky.
+    Bez with_points se body existujících řádků nemění a nové řádky mají 0.
+
+    Vrátí (vložené, změněné, smazané). Commit je na volajícím.
+    """
+    width = 3 if with_points else 2
+    rows = {row["event_registration_id"]: row for row in rows}
+    await cursor.execute(STORED_RESULTS_QUERY, (event_id, event_phase_id))
+    stored = {registration_id: (result_id, (total_time_ms, position, points))
+              for result_id, registration_id, total_time_ms, position, points in await cursor.fetchall()}
+
+    deleted = [result_id for registration_id, (result_id, _) in stored.items() if registration_id not in rows]
+    changed = [row for registration_id, row in rows.items()
+               if registration_id not in stored
+               or stored[registration_id][1][:width] != (row["total_time_ms"], row["position"], row.get("points", 0))[:width]]
+
+    if deleted:
+        await cursor.execute(
+            f"DELETE FROM event_result WHERE id IN ({', '.join(['%s'] * len(deleted))});", tuple(deleted))
+    if changed:
+        update_points = ", points = VALUES(points)" if with_points else ""
+        await cursor.execute(
+            f"""INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, points, position)
+                VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(changed))}
+                ON DUPLICATE KEY UPDATE total_time = VALUES(total_time), total_time_ms = VALUES(total_time_ms),
+                    position = VALUES(position){update_points};""",
+            tuple(value for row in changed for value in (
+                row["event_registration_id"], event_phase_id, format_time_ms(row["total_time_ms"]),
+                row["total_time_ms"], row.get("points", 0) if with_points else 0, row["position"])))
+    inserted = sum(1 for row in changed if row["event_registration_id"] not in stored)
+    return inserted, len(changed) - inserted, len(deleted)
+
+
+async def load_phase_data(cursor, event_id, event_phase_id):
+    """
+    Načte vstupy compute_phase_results pro fázi závodu jako slovník jeho argumentů.
+    """
+    await cursor.execute(RESULT_TYPE_QUERY, (event_phase_id,))
+    phase = await cursor.fetchone()
+    result_type = phase[0] if phase else None
+    data = {"result_type": result_type, "event_phase_id": int(event_phase_id)}
+    if result_type not in ("MIN", "SUM"):
+        return data
+
+    await cursor.execute(REGISTRATIONS_QUERY, (event_id,))
+    registrations = await cursor.fetchall()
+    await cursor.execute(LAPS_QUERY, (event_id, event_phase_id))
+    laps = await cursor.fetchall()
+    await cursor.execute(POINTS_DEFINITION_QUERY)
+    points_definition = await cursor.fetchall()
+
+    data.update(
+        registration_ids=[row[0] for row in registrations],
+        category_ids=[row[1] for row in registrations],
+        dnf=[row[2] for row in registrations],
+        zero_point_category_ids={row[1] for row in registrations if row[3] in ZERO_POINT_CATEGORIES},
+        lap_registration_ids=[row[0] for row in laps],
+        laptimes_ms=[row[1] for row in laps],
+        points_definition=[(row[0], row[1]) for row in points_definition],
+    )
+    return data
+
+
+def compute_phase_rows(data):
+    """
+    Spočítá výsledky z dat load_phase_data a vrátí řádky pro write_phase_results.
+    """
+    if data["result_type"] not in ("MIN", "SUM"):
+        return []
+    return result_rows(compute_phase_results(**data))
+
+
+async def finalize_phase_results(event_id, event_phase_id):
+    """
+    Spočítá a uloží konečné výsledky fáze včetně bodů. Volá se po změně fáze závodu
+    pro fázi, která právě skončila (dříve trigger after_event_phase_id_update), pod
+    vedením fáze přes ResultsRecompute.finalize (service/results_recompute.py).
+    Vrátí počet změněných řádků event_result, fáze bez result_type nemění nic.
+    """
+    started = time.perf_counter()
+    db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+    cursor = db_connection.cursor()
+    try:
+        data = await load_phase_data(cursor, event_id, event_phase_id)
+        if data["result_type"] not in ("MIN", "SUM"):
+            return 0
+        # Výpočet nad desítkami tisíc kol nemá brzdit event loop
+        rows = await run_blocking(compute_phase_rows, data)
+        inserted, updated, deleted = await write_phase_results(cursor, event_id, event_phase_id, rows, with_points=True)
+        await db_connection.commit()
+        RESULTS_FINALIZED.inc(result="ok")
+        RESULTS_FINALIZE_SECONDS.observe(time.perf_counter() - started)
+        rows_updated = inserted + updated + deleted
+        if rows_updated:
+            invalidate_tags(f"event:{event_id}", "rankings")
+        logger.info(f"Final results saved for event_id={event_id}, event_phase_id={event_phase_id}, rows_updated={rows_updated}")
+        return rows_updated
+    except Exception:
+        RESULTS_FINALIZED.inc(result="error")
+        await db_connection.rollback()
+        raise
+    finally:
+        await cursor.close()
+        await db_connection.close()
@@ -0,0 +1,161 @@
+"""
+Plánovač úloh na pozadí workeru (volba vedoucího, průběžné výsledky aktivních fází).
+
+Jeden AsyncIOScheduler (APScheduler) na worker, spouští ho a zastavuje lifespan aplikace,
+úlohy běží v event loopu workeru. Každá úloha má max_instances=1 (další běh se nespustí,
+dokud předchozí neskončí), zmeškané běhy se slijí do jednoho (coalesce) a interval
+se rozhodí o náhodný jitter, aby úlohy více závodů nebíhaly ve stejném okamžiku.
+
+U každé úlohy se eviduje poslední běh, jeho doba, chyba a počet změněných řádků
+(celé číslo, které úloha vrátí). Vypisuje je GET /admin/jobs.
+"""
+import logging
+import os
+import time
+from datetime import datetime
+
+from service.metrics import Counter, Gauge, Histogram
+
+# Horní mez náhodného posunu každého běhu úlohy v sekundách
+SCHEDULER_JITTER_SECONDS = float(os.getenv("SCHEDULER_JITTER_SECONDS", 0.5))
+# Běh zpožděný víc než tolik sekund (zablokovaný event loop) se přeskočí
+SCHEDULER_MISFIRE_GRACE_SECONDS = int(os.getenv("SCHEDULER_MISFIRE_GRACE_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_RUNS = Counter(
+    "laplink_scheduler_runs_total", "Běhy úloh plánovače podle druhu úlohy a výsledku (ok, error, skipped).",
+    ("job", "result"))
+SCHEDULER_RUN_SECONDS = Histogram(
+    "laplink_scheduler_run_seconds", "Doba běhu úlohy plánovače podle druhu úlohy.", ("job",))
+
+
+class SchedulerService:
+    def __init__(self):
+        self._scheduler = None
+        self._stats = {}
+
+    def __len__(self):
+        return len(self._stats)
+
+    @property
+    def running(self):
+        return self._scheduler is not None and self._scheduler.running
+
+    def _get(self):
+        """
+        APScheduler se importuje až při prvním použití, aby nezdržoval start workeru.
+        """
+        if self._scheduler is None:
+            from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
+            from apscheduler.schedulers.asyncio import AsyncIOScheduler
+            self._scheduler = AsyncIOScheduler(job_defaults={
+                "coalesce": True,
+                "max_instances": 1,
+                "misfire_grace_time": SCHEDULER_MISFIRE_GRACE_SECONDS,
+            })
+            self._scheduler.add_listener(self._on_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+        return self._scheduler
+
+    def start(self):
+        scheduler = self._get()
+        if not scheduler.running:
+            scheduler.start()
+
+    async def stop(self):
+        """
+        Zastaví plánovač. Rozběhnuté úlohy se nečekají, dokončí je event loop.
+        """
+        if self.running:
+            self._scheduler.shutdown(wait=False)
+        self._scheduler = None
+        self._stats.clear()
+
+    def add_job(self, job_id, func, seconds, args=(), name=None, run_now=False, jitter=SCHEDULER_JITTER_SECONDS):
+        """
+        Naplánuje asynchronní funkci func(*args) každých seconds sekund. Úloha se stejným id
+        se nahradí. S run_now=True poběží poprvé hned.
+        """
+        options = {"next_run_time": datetime.now()} if run_now else {}
+        self._get().add_job(
+            self._run,
+            trigger="interval",
+            seconds=seconds,
+            jitter=jitter or None,
+            args=[job_id, func, *args],
+            id=job_id,
+            name=name or job_id,
+            replace_existing=True,
+            **options,
+        )
+        self._stats[job_id] = {
+            "kind": func.__name__, "last_run": None, "duration_ms": None, "rows_changed": None,
+            "rows_changed_total": 0, "runs": 0, "errors": 0, "skipped": 0, "last_error": None,
+        }
+
+    def remove_job(self, job_id):
+        self._stats.pop(job_id, None)
+        if self._scheduler is not None and self._scheduler.get_job(job_id):
+            self._scheduler.remove_job(job_id)
+            return True
+        return False
+
+    def has_job(self, job_id):
+        return self._scheduler is not None and self._scheduler.get_job(job_id) is not None
+
+    async def _run(self, job_id, func, *args):
+        stats = self._stats.get(job_id)
+        kind = func.__name__
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await func(*args)
+            SCHEDULER_RUNS.inc(job=kind, result="ok")
+        except Exception as e:
+            SCHEDULER_RUNS.inc(job=kind, result="error")
+            logger.error(f"Job {job_id} failed: {e}")
+            if stats is not None:
+                stats["errors"] += 1
+                stats["last_error"] = str(e)
+        finally:
+            duration = time.perf_counter() - started
+            SCHEDULER_RUN_SECONDS.observe(duration, job=kind)
+            # Úlohu mohl během běhu někdo odebrat, statistiky se pak nevracejí
+            if stats is not None and self._stats.get(job_id) is stats:
+                stats["runs"] += 1
+                stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+                stats["duration_ms"] = round(duration * 1000, 2)
+                if isinstance(result, int):
+                    stats["rows_changed"] = result
+                    stats["rows_changed_total"] += result
+
+    def _on_skipped(self, event):
+        stats = self._stats.get(event.job_id)
+        if stats is not None:
+            stats["skipped"] += 1
+            SCHEDULER_RUNS.inc(job=stats["kind"], result="skipped")
+
+    def jobs(self):
+        """
+        Seznam naplánovaných úloh se statistikami posledního běhu.
+        """
+        if self._scheduler is None:
+            return []
+        jobs = []
+        for job in self._scheduler.get_jobs():
+            next_run = getattr(job, "next_run_time", None)
+            jobs.append({
+                "id": job.id,
+                "name": job.name,
+                "interval_seconds": job.trigger.interval.total_seconds(),
+                "next_run": next_run.isoformat(timespec="seconds") if next_run else None,
+                **self._stats.get(job.id, {}),
+            })
+        return sorted(jobs, key=lambda job: job["id"])
+
+
+scheduler_service = SchedulerService()
+
+SCHEDULER_JOBS = Gauge(
+    "laplink_scheduler_jobs", "Počet naplánovaných úloh plánovače ve workeru.",
+    collect=lambda: {(): len(scheduler_service)})
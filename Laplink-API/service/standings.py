@@ -0,0 +1,406 @@
+"""
+Průběžné pořadí aktivních fází závodů v paměti procesu.
+
+Pro každou načtenou dvojici (závod, fáze) drží engine pro každou kategorii seřazený
+seznam registrací podle nejlepšího kola (fáze MIN) nebo součtu časů (fáze SUM).
+Nové kolo upraví hodnotu jedné registrace a přesune ji v seznamu kategorie (SortedList,
+vložení i odebrání v O(log n)), pořadí se tedy nepočítá znovu pro celý závod. Řazení odpovídá konečným výsledkům
+(service/results_engine.py) bez dnf, shodné časy rozhoduje id registrace.
+
+Fáze se načte z event_lap při přechodu závodu do fáze 1, 2 nebo 3, případně při prvním
+uložení výsledků. Uložená kola se do ní promítají z lap endpointů a ze žurnálu kol.
+Každé kolo se započítá nejvýše jednou (podle event_lap.id). Kola uložená jiným workerem
+se dočtou při sync() před uložením do event_result. Id kol nepřibývají v pořadí commitů
+(souběžné zápisy jiných workerů, skupinový commit žurnálu), sync() proto kromě kol nad
+nejvyšším načteným id dočítá i kola uložená v posledních STANDINGS_SYNC_WINDOW sekundách.
+
+Tabulka event_result se plní z enginu (persist, zapisuje jen změněné řádky přes
+service/results_store.py), výsledkové endpointy přes
+apply_live_standings() přebírají z enginu aktuální pořadí a čas.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from sortedcontainers import SortedList
+
+from db.connection import prioritized_get_db_connection
+from service.metrics import Counter, Gauge
+from service.results_store import write_phase_results
+from utilities.formatting import format_time_ms
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_PHASES = (1, 2, 3)
+# Pořadí dočtené z databáze před více než tolika sekundami se nepoužije pro čtecí endpointy.
+# Vedoucí worker fáze ho dočítá v intervalu RESULTS_REFRESH_SECONDS, ostatní workery
+# by v něm neměly kola uložená jinde a čte se uložený event_result.
+STANDINGS_LIVE_MAX_AGE = float(os.getenv("STANDINGS_LIVE_MAX_AGE", 10))
+# Kola s nižším id, než je už načtené, se mohou commitnout později. Sync je dočítá
+# podle created_at tolik sekund zpět, už započítaná kola se přeskočí podle id.
+STANDINGS_SYNC_WINDOW = int(os.getenv("STANDINGS_SYNC_WINDOW", 60))
+
+PHASE_QUERY = "SELECT result_type FROM event_phase WHERE id = %s;"
+REGISTRATIONS_QUERY = "SELECT id, car_category_id FROM event_registration WHERE event_id = %s;"
+LAPS_QUERY = """SELECT el.id, el.event_registration_id, el.laptime_ms
+    FROM event_lap el
+    INNER JOIN event_registration reg ON el.event_registration_id = reg.id
+    WHERE reg.event_id = %s
+        AND el.event_phase_id = %s
+        AND (el.id > %s OR el.created_at >= NOW(3) - INTERVAL %s SECOND)
+    ORDER BY el.id;"""
+
+STANDINGS_LAPS = Counter(
+    "laplink_standings_laps_total", "Kola promítnutá do průběžného pořadí podle zdroje (write, sync, load).",
+    ("source",))
+STANDINGS_LOADS = Counter(
+    "laplink_standings_loads_total", "Načtení fáze závodu do průběžného pořadí z databáze.")
+STANDINGS_PERSISTED = Counter(
+    "laplink_standings_persisted_rows_total", "Řádky event_result zapsané z průběžného pořadí (insert, update, delete).",
+    ("operation",))
+
+
+class CategoryStandings:
+    """
+    Registrace jedné kategorie seřazené podle (čas v ms, id registrace).
+    """
+
+    def __init__(self):
+        self._keys = SortedList()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def add(self, key):
+        self._keys.add(key)
+
+    def remove(self, key):
+        self._keys.discard(key)
+
+    def position(self, key):
+        return self._keys.bisect_left(key) + 1
+
+
+class PhaseStandings:
+    def __init__(self, event_id, event_phase_id, result_type, categories):
+        self.event_id = event_id
+        self.event_phase_id = event_phase_id
+        self.result_type = result_type
+        # event_registration_id -> car_category_id
+        self._category_of = categories
+        self._values = {}
+        self._categories = {}
+        self._lap_ids = set()
+        # Nejvyšší id kola načtené z databáze, od něj pokračuje sync()
+        self.watermark = 0
+        self.version = 0
+        # Kdy se naposledy dočetla kola z databáze (time.monotonic)
+        self.synced_at = 0.0
+
+    def __len__(self):
+        return len(self._values)
+
+    def knows(self, registration_id):
+        return registration_id in self._category_of
+
+    def has_lap(self, lap_id):
+        return lap_id in self._lap_ids
+
+    @property
+    def lap_count(self):
+        """
+        Počet započítaných kol. Na rozdíl od watermark roste i s kolem dočteným pod ním.
+        """
+        return len(self._lap_ids)
+
+    def add_lap(self, lap_id, registration_id, laptime_ms):
+        """
+        Promítne kolo do pořadí. Vrátí True, pokud se čas registrace změnil.
+        """
+        if self.result_type not in ("MIN", "SUM"):
+            return False
+        if lap_id is not None:
+            if lap_id in self._lap_ids:
+                return False
+            self._lap_ids.add(lap_id)
+
+        old = self._values.get(registration_id)
+        if old is None:
+            new = laptime_ms
+        elif self.result_type == "MIN":
+            new = min(old, laptime_ms)
+        else:
+            new = old + laptime_ms
+        if new == old:
+            return False
+
+        category_id = self._category_of[registration_id]
+        category = self._categories.get(category_id)
+        if category is None:
+            category = self._categories[category_id] = CategoryStandings()
+        if old is not None:
+            category.remove((old, registration_id))
+        category.add((new, registration_id))
+        self._values[registration_id] = new
+        self.version += 1
+        return True
+
+    def entry(self, registration_id):
+        """
+        Vrátí (pořadí v kategorii, čas v ms), nebo None pro registraci bez kola.
+        """
+        value = self._values.get(registration_id)
+        if value is None:
+            return None
+        category = self._categories[self._category_of[registration_id]]
+        return category.position((value, registration_id)), value
+
+    def rows(self):
+        """
+        Řádky event_result seřazené podle kategorie a pořadí.
+        """
+        for category_id in sorted(self._categories):
+            for position, (value, registration_id) in enumerate(self._categories[category_id], start=1):
+                yield {"event_registration_id": registration_id, "car_category_id": category_id,
+                       "position": position, "total_time_ms": value}
+
+
+class StandingsEngine:
+    def __init__(self):
+        self._phases = {}
+        self._loading = {}
+        # Kola uložená během načítání fáze, promítnou se po jeho dokončení
+        self._pending = {}
+        self._generation = 0
+        self._event_generations = {}
+        # Funkce volané s (závod, fáze) po změně pořadí kolem uloženým v tomto workeru
+        self.listeners = []
+
+    def __len__(self):
+        return len(self._phases)
+
+    def _generation_of(self, event_id):
+        return self._generation, self._event_generations.get(event_id, 0)
+
+    def get(self, event_id, event_phase_id):
+        """
+        Vrátí načtené pořadí fáze, nebo None. Nic nenačítá, hodí se pro čtecí endpointy.
+        """
+        return self._phases.get((int(event_id), int(event_phase_id)))
+
+    def live(self, event_id, event_phase_id):
+        """
+        Vrátí pořadí fáze, pokud je načtené a nedávno dočtené z databáze, jinak None.
+        """
+        standings = self.get(event_id, event_phase_id)
+        if standings is None or time.monotonic() - standings.synced_at > STANDINGS_LIVE_MAX_AGE:
+            return None
+        return standings
+
+    async def _fetch_laps(self, cursor, standings):
+        await cursor.execute(LAPS_QUERY, (standings.event_id, standings.event_phase_id, standings.watermark,
+                                          STANDINGS_SYNC_WINDOW))
+        fetched = 0
+        for lap_id, registration_id, laptime_ms in await cursor.fetchall():
+            # Okno created_at vrací i už započítaná kola
+            if standings.has_lap(lap_id):
+                continue
+            if standings.knows(registration_id):
+                standings.add_lap(lap_id, registration_id, laptime_ms)
+            standings.watermark = max(standings.watermark, lap_id)
+            fetched += 1
+        standings.synced_at = time.monotonic()
+        return fetched
+
+    async def _fetch(self, event_id, event_phase_id):
+        db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+        cursor = db_connection.cursor()
+        try:
+            await cursor.execute(PHASE_QUERY, (event_phase_id,))
+            row = await cursor.fetchone()
+            result_type = row[0] if row else None
+            await cursor.execute(REGISTRATIONS_QUERY, (event_id,))
+            categories = {registration_id: category_id for registration_id, category_id in await cursor.fetchall()}
+            standings = PhaseStandings(event_id, event_phase_id, result_type, categories)
+            if result_type in ("MIN", "SUM"):
+                STANDINGS_LAPS.inc(await self._fetch_laps(cursor, standings), source="load")
+            return standings
+        finally:
+            await cursor.close()
+            await db_connection.close()
+
+    async def load(self, event_id, event_phase_id):
+        """
+        Načte pořadí fáze z databáze. Souběžná volání pro stejnou fázi čekají na jedno načtení.
+        """
+        key = (int(event_id), int(event_phase_id))
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        generation = self._generation_of(key[0])
+        future = asyncio.get_running_loop().create_future()
+        self._loading[key] = future
+        self._pending[key] = []
+        try:
+            standings = await self._fetch(*key)
+            STANDINGS_LOADS.inc()
+            for lap in self._pending[key]:
+                if standings.knows(lap[1]):
+                    standings.add_lap(*lap)
+            # Invalidace během načítání: výsledek se vrátí, ale neuloží
+            if self._generation_of(key[0]) == generation:
+                self._phases[key] = standings
+            future.set_result(standings)
+            return standings
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._loading[key]
+            del self._pending[key]
+
+    async def ensure(self, event_id, event_phase_id):
+        return self.get(event_id, event_phase_id) or await self.load(event_id, event_phase_id)
+
+    async def sync(self, event_id, event_phase_id):
+        """
+        Dočte kola uložená od posledního načtení (např. jiným workerem) a vrátí pořadí fáze.
+        """
+        standings = await self.ensure(event_id, event_phase_id)
+        if standings.result_type not in ("MIN", "SUM"):
+            return standings
+        db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+        cursor = db_connection.cursor()
+        try:
+            STANDINGS_LAPS.inc(await self._fetch_laps(cursor, standings), source="sync")
+        finally:
+            await cursor.close()
+            await db_connection.close()
+        return standings
+
+    def record_lap(self, event_id, event_phase_id, lap_id, registration_id, laptime_ms):
+        """
+        Promítne právě uložené kolo. Volá se po commitu, fáze, která není načtená, se přeskočí.
+        """
+        key = (int(event_id), int(event_phase_id))
+        lap = (lap_id, registration_id, laptime_ms)
+        if key in self._loading:
+            self._pending[key].append(lap)
+            return
+        standings = self._phases.get(key)
+        if standings is None:
+            return
+        if not standings.knows(registration_id):
+            # Registrace vznikla po načtení fáze, pořadí se načte znovu
+            del self._phases[key]
+            return
+        if standings.add_lap(*lap):
+            STANDINGS_LAPS.inc(source="write")
+            for listener in self.listeners:
+                listener(*key)
+
+    def invalidate(self, event_id=None):
+        """
+        Zahodí pořadí všech fází závodu (např. po změně registrací), bez event_id všech závodů.
+        """
+        if event_id is None:
+            self._generation += 1
+            self._phases.clear()
+        else:
+            event_id = int(event_id)
+            self._event_generations[event_id] = self._event_generations.get(event_id, 0) + 1
+            for key in [key for key in self._phases if key[0] == event_id]:
+                del self._phases[key]
+
+    def forget(self, event_id, keep_phase=None):
+        for key in [key for key in self._phases if key[0] == int(event_id) and key[1] != keep_phase]:
+            del self._phases[key]
+
+    async def persist(self, event_id, event_phase_id):
+        """
+        Uloží pořadí fáze do event_result a vrátí počet změněných řádků. Porovná ho
+        s uloženými výsledky a zapíše jen nové, změněné a zaniklé řádky v jedné krátké
+        transakci. Body (points) existujících řádků se nemění.
+        """
+        standings = await self.sync(event_id, event_phase_id)
+        if standings.result_type not in ("MIN", "SUM"):
+            # Fáze bez pořadí (příprava, ukončen), uložené výsledky se nemění
+            return 0
+        db_connection = await prioritized_get_db_connection(priority="high", read_only=False)
+        cursor = db_connection.cursor()
+        try:
+            inserted, updated, deleted = await write_phase_results(
+                cursor, standings.event_id, standings.event_phase_id, standings.rows())
+            if not inserted + updated + deleted:
+                return 0
+            await db_connection.commit()
+            STANDINGS_PERSISTED.inc(inserted, operation="insert")
+            STANDINGS_PERSISTED.inc(updated, operation="update")
+            STANDINGS_PERSISTED.inc(deleted, operation="delete")
+            return inserted + updated + deleted
+        except Exception:
+            await db_connection.rollback()
+            raise
+        finally:
+            await cursor.close()
+            await db_connection.close()
+
+standings_engine = StandingsEngine()
+
+STANDINGS_PHASES = Gauge(
+    "laplink_standings_phases", "Počet fází závodů s průběžným pořadím v paměti.",
+    collect=lambda: {(): len(standings_engine)})
+
+
+_preload_tasks = set()
+
+
+async def _preload(event_id, event_phase_id):
+    try:
+        await standings_engine.load(event_id, event_phase_id)
+    except Exception as e:
+        logger.warning(f"Pořadí závodu {event_id} ve fázi {event_phase_id} se nepodařilo načíst dopředu: {e}")
+
+
+def on_event_phase_change(event_id, event_phase_id):
+    """
+    Volá se po změně fáze závodu. Pořadí ostatních fází uvolní, aktivní fázi načte na pozadí.
+    """
+    standings_engine.forget(event_id, keep_phase=event_phase_id)
+    if event_phase_id in ACTIVE_PHASES:
+        task = asyncio.create_task(_preload(event_id, event_phase_id))
+        _preload_tasks.add(task)
+        task.add_done_callback(_preload_tasks.discard)
+
+
+def apply_live_standings(rows, event_id, event_phase_id=None, time_column="total_time", sort_key=None):
+    """
+    V řádcích výsledků z event_result nahradí pořadí (a čas) hodnotami z enginu,
+    pokud je fáze načtená a aktuální (StandingsEngine.live). Řádky potřebují event_registration_id a, není-li zadaná
+    fáze, event_phase_id. Při změně je znovu seřadí podle sort_key.
+    """
+    changed = False
+    for row in rows:
+        standings = standings_engine.live(event_id, event_phase_id or row["event_phase_id"])
+        if standings is None:
+            continue
+        entry = standings.entry(row["event_registration_id"])
+        if entry is None:
+            continue
+        position, value = entry
+        row["position"] = position
+        if time_column is not None:
+            row[time_column] = format_time_ms(value)
+        changed = True
+    if changed and sort_key is not None:
+        rows.sort(key=sort_key)
+    return rows
@@ -0,0 +1,351 @@
+"""
+Živé průběžné pořadí přes Server-Sent Events (GET /results/stream/event/{event_id}).
+
+Pro každou sledovanou dvojici (závod, fáze) běží ve workeru jeden feed sdílený všemi
+odběrateli. Feed dočítá kola z databáze (StandingsEngine.sync) v intervalu
+STANDINGS_FEED_INTERVAL, kolo uložené v tomto workeru ho probudí hned. Při změně
+pořadí spočítá jednou rozdíl proti minulému stavu (změněné a zaniklé řádky) a přidá
+ho do kruhového bufferu zpráv. Odběratelé z bufferu jen čtou a zpráva se pro každý
+filtr kategorie serializuje jednou, tisíc diváků tak stojí jeden výpočet na změnu.
+
+Nový odběratel dostane nejdřív celé pořadí (snapshot), pak jen rozdíly. Odběratel, který
+nestíhá číst a vypadl z bufferu (STANDINGS_FEED_BUFFER zpráv), nebo se připojí znovu
+s Last-Event-ID mimo buffer, dostane znovu snapshot. Feed bez odběratelů skončí.
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+import uuid
+
+from db.connection import prioritized_get_db_connection
+from service.metrics import Counter, Gauge
+from service.standings import standings_engine
+from utilities.formatting import format_time_ms
+
+# Jak často feed dočítá kola uložená jinými workery
+STANDINGS_FEED_INTERVAL = float(os.getenv("STANDINGS_FEED_INTERVAL", 1))
+# Nejkratší odstup dvou přepočtů, nával kol se slije do jedné zprávy
+STANDINGS_FEED_MIN_INTERVAL_MS = float(os.getenv("STANDINGS_FEED_MIN_INTERVAL_MS", 200))
+# Kolik posledních zpráv feed drží pro pomalé a znovu připojené odběratele
+STANDINGS_FEED_BUFFER = int(os.getenv("STANDINGS_FEED_BUFFER", 256))
+# Komentář bez dat po tolika sekundách klidu, aby proxy nezavřely nečinné spojení
+STANDINGS_FEED_KEEPALIVE = float(os.getenv("STANDINGS_FEED_KEEPALIVE", 15))
+# Za kolik ms se má EventSource po výpadku spojení připojit znovu
+STANDINGS_FEED_RETRY_MS = int(os.getenv("STANDINGS_FEED_RETRY_MS", 3000))
+
+ROSTER_QUERY = """SELECT reg.id, cc.name, CONCAT(drv.name, ' ', drv.surname), drv.number
+    FROM event_registration reg
+    INNER JOIN car_category cc ON reg.car_category_id = cc.id
+    INNER JOIN driver drv ON reg.driver_id = drv.id
+    WHERE reg.event_id = %s;"""
+
+logger = logging.getLogger(__name__)
+
+STANDINGS_FEED_MESSAGES = Counter(
+    "laplink_standings_feed_messages_total", "Zprávy živého pořadí vytvořené feedy (snapshot, diff).", ("kind",))
+STANDINGS_FEED_SENT = Counter(
+    "laplink_standings_feed_sent_total", "Zprávy živého pořadí odeslané odběratelům (snapshot, diff, keepalive).",
+    ("kind",))
+
+
+def encode_event(kind, event_id, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {kind}\ndata: {payload}\n\n"
+
+
+class FeedMessage:
+    """
+    Zpráva feedu. Řádky se pro každý filtr kategorie serializují nejvýše jednou.
+    """
+
+    def __init__(self, epoch, seq, kind, event_id, event_phase_id, rows, removed=()):
+        self.epoch = epoch
+        self.seq = seq
+        self.kind = kind
+        self.event_id = event_id
+        self.event_phase_id = event_phase_id
+        self.rows = rows
+        # (event_registration_id, car_category_id) zaniklých řádků
+        self.removed = removed
+        self._encoded = {}
+
+    def encode(self, car_category_id=None):
+        """
+        Vrátí zprávu ve formátu SSE, nebo None, pokud se filtrované kategorie netýká.
+        """
+        if car_category_id in self._encoded:
+            return self._encoded[car_category_id]
+        rows, removed = self.rows, self.removed
+        if car_category_id is not None:
+            rows = [row for row in rows if row["car_category_id"] == car_category_id]
+            removed = [item for item in removed if item[1] == car_category_id]
+        data = {"event_id": self.event_id, "event_phase_id": self.event_phase_id}
+        if self.kind == "snapshot":
+            data["results"] = rows
+        elif rows or removed:
+            data["changed"] = rows
+            data["removed"] = [registration_id for registration_id, _ in removed]
+        else:
+            data = None
+        encoded = self._encoded[car_category_id] = encode_event(self.kind, f"{self.epoch}-{self.seq}", data) if data else None
+        return encoded
+
+
+class StandingsFeed:
+    def __init__(self, event_id, event_phase_id):
+        self.event_id = event_id
+        self.event_phase_id = event_phase_id
+        self.subscribers = 0
+        # Id zpráv (Last-Event-ID) je "epocha-seq", epocha odliší feedy různých workerů a běhů
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.closed = False
+        self._messages = collections.deque(maxlen=STANDINGS_FEED_BUFFER)
+        # event_registration_id -> (kategorie, pořadí, čas v ms) naposledy odeslaného stavu
+        self._values = {}
+        self._rows = {}
+        # event_registration_id -> (název kategorie, jméno jezdce, startovní číslo)
+        self._roster = {}
+        self._snapshot = None
+        # Naposledy promítnuté pořadí (objekt PhaseStandings a jeho verze)
+        self._state = None
+        self._refresh_lock = asyncio.Lock()
+        self._changed = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _load_roster(self):
+        db_connection = await prioritized_get_db_connection(priority="low")
+        cursor = db_connection.cursor()
+        try:
+            await cursor.execute(ROSTER_QUERY, (self.event_id,))
+            self._roster = {registration_id: (category_name, full_name, number)
+                            for registration_id, category_name, full_name, number in await cursor.fetchall()}
+        finally:
+            await cursor.close()
+            await db_connection.close()
+
+    def _row(self, row):
+        category_name, full_name, number = self._roster.get(row["event_registration_id"], (None, None, None))
+        return {
+            "event_registration_id": row["event_registration_id"],
+            "car_category_id": row["car_category_id"],
+            "category_name": category_name,
+            "position": row["position"],
+            "total_time": format_time_ms(row["total_time_ms"]),
+            "total_time_ms": row["total_time_ms"],
+            "full_name": full_name,
+            "number": number,
+        }
+
+    async def refresh(self):
+        """
+        Dočte pořadí fáze a při změně přidá do bufferu zprávu s rozdílem. Vrátí True při změně.
+        """
+        async with self._refresh_lock:
+            standings = await standings_engine.sync(self.event_id, self.event_phase_id)
+            if self._state is not None and self._state[0] is standings and self._state[1] == standings.version:
+                return False
+            first = self._state is None
+            # Verze odpovídající řádkům, kola promítnutá během načítání jmen přijdou v další zprávě
+            version = standings.version
+            rows = list(standings.rows())
+            values = {row["event_registration_id"]: (row["car_category_id"], row["position"], row["total_time_ms"])
+                      for row in rows}
+            changed = [row for row in rows if self._values.get(row["event_registration_id"]) != values[row["event_registration_id"]]]
+            removed = [(registration_id, value[0]) for registration_id, value in self._values.items()
+                       if registration_id not in values]
+            if changed and any(row["event_registration_id"] not in self._roster for row in changed):
+                await self._load_roster()
+            self._state = (standings, version)
+            if not changed and not removed:
+                return False
+
+            self._values = values
+            changed = [self._row(row) for row in changed]
+            for row in changed:
+                self._rows[row["event_registration_id"]] = row
+            for registration_id, _ in removed:
+                self._rows.pop(registration_id, None)
+            self._snapshot = None
+            if first:
+                # Stav před prvním odběratelem, ten dostane snapshot
+                return True
+            self.seq += 1
+            self._messages.append(FeedMessage(self.epoch, self.seq, "diff", self.event_id, self.event_phase_id, changed, removed))
+            STANDINGS_FEED_MESSAGES.inc(kind="diff")
+            # Probudí všechny čekající odběratele najednou
+            self._changed.set()
+            self._changed = asyncio.Event()
+            return True
+
+    def snapshot(self):
+        if self._snapshot is None or self._snapshot.seq != self.seq:
+            rows = sorted(self._rows.values(), key=lambda row: (row["car_category_id"], row["position"]))
+            self._snapshot = FeedMessage(self.epoch, self.seq, "snapshot", self.event_id, self.event_phase_id, rows)
+            STANDINGS_FEED_MESSAGES.inc(kind="snapshot")
+        return self._snapshot
+
+    def _replayable(self, seq):
+        """
+        Zda jsou v bufferu všechny zprávy po seq.
+        """
+        if seq == self.seq:
+            return True
+        return bool(self._messages) and self._messages[0].seq <= seq + 1 and seq < self.seq
+
+    def _resume_seq(self, last_event_id):
+        """
+        Pozice odběratele podle Last-Event-ID, nebo None, pokud se musí začít snapshotem.
+        """
+        epoch, _, seq = (last_event_id or "").partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if self._replayable(seq) else None
+
+    async def stream(self, car_category_id=None, last_event_id=None):
+        """
+        Zprávy SSE pro jednoho odběratele: snapshot (nebo zprávy od last_event_id z bufferu),
+        potom rozdíly. Klient čte svým tempem, pozadu zůstane jen jeho pozice v bufferu.
+        """
+        yield f"retry: {STANDINGS_FEED_RETRY_MS}\n\n"
+        seq = self._resume_seq(last_event_id)
+        while not self.closed:
+            if seq is None or not self._replayable(seq):
+                snapshot = self.snapshot()
+                yield snapshot.encode(car_category_id)
+                STANDINGS_FEED_SENT.inc(kind="snapshot")
+                seq = snapshot.seq
+                continue
+            if seq < self.seq:
+                for message in [message for message in self._messages if message.seq > seq]:
+                    encoded = message.encode(car_category_id)
+                    if encoded is not None:
+                        yield encoded
+                        STANDINGS_FEED_SENT.inc(kind="diff")
+                    seq = message.seq
+                continue
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), STANDINGS_FEED_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                STANDINGS_FEED_SENT.inc(kind="keepalive")
+
+    async def run(self):
+        """
+        Smyčka feedu, běží, dokud má odběratele.
+        """
+        refreshed_at = 0.0
+        while self.subscribers and not self.closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), STANDINGS_FEED_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            delay = refreshed_at + STANDINGS_FEED_MIN_INTERVAL_MS / 1000 - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            refreshed_at = time.monotonic()
+            if not self.subscribers or self.closed:
+                break
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Živé pořadí závodu {self.event_id} ve fázi {self.event_phase_id} se nepodařilo dočíst: {e}")
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+        self._changed.set()
+
+
+class StandingsFeeds:
+    def __init__(self):
+        self._feeds = {}
+        standings_engine.listeners.append(self.notify)
+
+    def __len__(self):
+        return len(self._feeds)
+
+    def subscribers(self):
+        return sum(feed.subscribers for feed in self._feeds.values())
+
+    def notify(self, event_id, event_phase_id):
+        """
+        Nové kolo uložené v tomto workeru, feed fáze se přepočítá hned (nejvýše jednou za
+        STANDINGS_FEED_MIN_INTERVAL_MS).
+        """
+        feed = self._feeds.get((event_id, event_phase_id))
+        if feed is not None:
+            feed.wake()
+
+    def _acquire(self, event_id, event_phase_id):
+        key = (int(event_id), int(event_phase_id))
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = StandingsFeed(*key)
+        feed.subscribers += 1
+        if feed._task is None or feed._task.done():
+            feed._task = asyncio.create_task(feed.run())
+        return feed
+
+    def _release(self, feed):
+        feed.subscribers -= 1
+        if feed.subscribers <= 0:
+            feed.wake()
+            if self._feeds.get((feed.event_id, feed.event_phase_id)) is feed:
+                del self._feeds[(feed.event_id, feed.event_phase_id)]
+
+    async def subscribe(self, event_id, event_phase_id, car_category_id=None, last_event_id=None):
+        """
+        Odběr živého pořadí fáze jako async generátor zpráv SSE (tělo StreamingResponse).
+        Odběratel se odhlásí, když generátor skončí nebo se zruší (odpojení klienta).
+        """
+        feed = self._acquire(event_id, event_phase_id)
+        try:
+            if not feed.loaded:
+                try:
+                    await feed.refresh()
+                except Exception as e:
+                    logger.error(f"Error loading live standings for event_id={event_id}, event_phase_id={event_phase_id}: {e}")
+                    yield encode_event("error", None, {"detail": "Live standings unavailable"})
+                    return
+            async for chunk in feed.stream(car_category_id, last_event_id):
+                yield chunk
+        finally:
+            self._release(feed)
+
+    async def stop(self):
+        """
+        Ukončí všechny feedy a jejich odběry. Volá se při vypínání workeru, aby otevřená
+        spojení nebránila jeho ukončení.
+        """
+        tasks = [feed._task for feed in self._feeds.values() if feed._task is not None]
+        for feed in self._feeds.values():
+            feed.close()
+        self._feeds.clear()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+standings_feeds = StandingsFeeds()
+
+STANDINGS_FEED_SUBSCRIBERS = Gauge(
+    "laplink_standings_feed_subscribers", "Otevřené odběry živého pořadí (SSE) ve workeru.",
+    collect=lambda: {(): standings_feeds.subscribers()})
+STANDINGS_FEEDS = Gauge(
+    "laplink_standings_feeds", "Počet feedů živého pořadí (dvojic závod a fáze) ve workeru.",
+    collect=lambda: {(): len(standings_feeds)})
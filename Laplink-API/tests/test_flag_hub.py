@@ -0,0 +1,134 @@
+"""
+Rozesílání vlajek (service/flag_hub.py) na simulovaných WebSocket připojeních.
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+import service.flag_hub as flag_hub_module
+from service.flag_hub import FlagHub
+
+EVENT_ID = 1
+
+
+class FakeWebSocket:
+    """
+    Přijaté WebSocket připojení zařízení. Odeslání zprávy trvá latency sekund.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.received = []
+        self.close_code = None
+        self._closed = asyncio.Event()
+
+    async def send_text(self, text):
+        await asyncio.sleep(self.latency)
+        self.received.append((time.perf_counter(), json.loads(text)))
+
+    async def receive_text(self):
+        # Zařízení nic neposílá, čeká se do zavření
+        await self._closed.wait()
+        raise RuntimeError("WebSocket is not connected")
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self._closed.set()
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    monkeypatch.setattr(flag_hub_module, "FLAG_SEND_TIMEOUT_MS", 200)
+    return FlagHub()
+
+
+async def connect(hub, sockets, event_id=EVENT_ID):
+    serving = [asyncio.create_task(hub.serve(socket, event_id, driver_id))
+               for driver_id, socket in enumerate(sockets, start=1)]
+    await asyncio.sleep(0)
+    return serving
+
+
+async def disconnect(hub, serving):
+    await hub.close()
+    await asyncio.gather(*serving, return_exceptions=True)
+
+
+async def wait_until(condition, timeout):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(int(len(sorted_values) * fraction + 0.5) - 1, 0)]
+
+
+async def test_slow_device_does_not_delay_broadcast(hub):
+    flags = 5
+    fast = [FakeWebSocket(latency=0.001 * (index % 10)) for index in range(499)]
+    slow = FakeWebSocket(latency=10)
+    # Pomalé zařízení první, postupné rozesílání by zdrželo všechna ostatní
+    serving = await connect(hub, [slow] + fast)
+
+    sent_at = {}
+    for flag_id in range(flags):
+        sent_at[flag_id] = started = time.perf_counter()
+        assert hub.broadcast(EVENT_ID, {"flag_id": flag_id}) == 500
+        # Rozeslání jen plní fronty, na síť nečeká
+        assert time.perf_counter() - started < 0.1
+        await asyncio.sleep(0.02)
+
+    assert await wait_until(lambda: all(len(socket.received) == flags for socket in fast), timeout=2)
+    assert all([message["flag_id"] for _, message in socket.received] == list(range(flags)) for socket in fast)
+    latencies = sorted(received_at - sent_at[message["flag_id"]]
+                       for socket in fast for received_at, message in socket.received)
+    assert percentile(latencies, 0.95) < 0.1
+
+    # Pomalé zařízení se odpojí po FLAG_SEND_TIMEOUT_MS
+    assert await wait_until(lambda: slow.close_code is not None, timeout=2)
+    assert slow.close_code == 1013
+    assert slow.received == []
+    assert len(hub) == 499
+    await disconnect(hub, serving)
+
+
+async def test_full_queue_evicts_device(hub, monkeypatch):
+    monkeypatch.setattr(flag_hub_module, "FLAG_QUEUE_SIZE", 4)
+    monkeypatch.setattr(flag_hub_module, "FLAG_SEND_TIMEOUT_MS", 10_000)
+    fast, stuck = FakeWebSocket(), FakeWebSocket(latency=60)
+    serving = await connect(hub, [fast, stuck])
+
+    recipients = []
+    for flag_id in range(8):
+        recipients.append(hub.broadcast(EVENT_ID, {"flag_id": flag_id}))
+        await asyncio.sleep(0.01)
+    # Jedna zpráva se odesílá, FLAG_QUEUE_SIZE čeká, další frontu přeplní
+    assert recipients[:5] == [2] * 5 and recipients[-1] == 1
+
+    assert await wait_until(lambda: stuck.close_code is not None, timeout=1)
+    assert stuck.close_code == 1013
+    assert await wait_until(lambda: len(fast.received) == 8, timeout=1)
+    assert len(hub) == 1
+    await disconnect(hub, serving)
+
+
+async def test_send_to_driver_and_event_scope(hub):
+    first, second, other_event = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    serving = await connect(hub, [first, second])
+    serving += await connect(hub, [other_event], event_id=2)
+
+    assert hub.send_to_driver(EVENT_ID, 2, {"flag": "black"}) == 1
+    assert hub.broadcast(EVENT_ID, {"flag": "red"}) == 2
+    assert hub.send_to_driver(EVENT_ID, 3, {"flag": "blue"}) == 0
+
+    assert await wait_until(lambda: len(second.received) == 2 and len(first.received) == 1, timeout=1)
+    assert [message for _, message in second.received] == [{"flag": "black"}, {"flag": "red"}]
+    assert other_event.received == []
+
+    await disconnect(hub, serving)
+    assert len(hub) == 0
+    assert first.close_code == second.close_code == 1000
@@ -0,0 +1,164 @@
+"""
+Volba vedoucího workeru (service/leader.py) bez databáze.
+
+LockServer napodobuje pojmenované zámky MariaDB (GET_LOCK, RELEASE_LOCK,
+RELEASE_ALL_LOCKS): zámek patří připojení a server ho pustí, když se připojení
+zavře nebo ho server ukončí (pád workeru). Každý worker je vlastní LeaderElection
+s vlastním připojením, stejně jako samostatné procesy API.
+"""
+import asyncio
+
+import pytest
+
+import service.leader as leader
+from service.leader import LeaderElection
+
+KEYS = {(1, 1), (1, 2), (2, 3)}
+
+
+class LockServer:
+    def __init__(self):
+        # jméno zámku -> připojení, které ho drží
+        self.locks = {}
+        self.changed = asyncio.Condition()
+
+    async def connect(self, **kwargs):
+        return LockConnection(self)
+
+    def holders(self, election):
+        name = election.lock_name
+        return {key: self.locks.get(name(key)) for key in KEYS}
+
+    async def get_lock(self, connection, name, timeout):
+        def free():
+            return self.locks.get(name) in (None, connection)
+
+        async with self.changed:
+            if not free():
+                try:
+                    await asyncio.wait_for(self.changed.wait_for(free), timeout)
+                except asyncio.TimeoutError:
+                    return 0
+            self.locks[name] = connection
+            return 1
+
+    async def release(self, connection, names=None):
+        async with self.changed:
+            for name, holder in list(self.locks.items()):
+                if holder is connection and (names is None or name in names):
+                    del self.locks[name]
+            self.changed.notify_all()
+
+    def kill(self, connection):
+        """
+        Ukončí připojení ze strany serveru, jako po pádu procesu workeru.
+        """
+        connection.killed = True
+        asyncio.get_running_loop().create_task(self.release(connection))
+
+
+class LockCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.row = None
+
+    async def execute(self, operation, params=None):
+        connection, server = self.connection, self.connection.server
+        if connection.killed:
+            raise OSError("Lost connection to server during query")
+        if operation.startswith("SELECT GET_LOCK"):
+            name, timeout = params if len(params) == 2 else (params[0], 0)
+            self.row = (await server.get_lock(connection, name, timeout),)
+        elif operation.startswith("SELECT RELEASE_LOCK"):
+            await server.release(connection, {params[0]})
+            self.row = (1,)
+        elif operation.startswith("SELECT RELEASE_ALL_LOCKS"):
+            await server.release(connection)
+            self.row = (1,)
+        else:
+            self.row = (1,)
+
+    async def fetchone(self):
+        return self.row
+
+    async def close(self):
+        pass
+
+
+class LockConnection:
+    def __init__(self, server):
+        self.server = server
+        self.killed = False
+
+    def cursor(self):
+        return LockCursor(self)
+
+    def close(self):
+        if not self.killed:
+            self.killed = True
+            asyncio.get_running_loop().create_task(self.server.release(self))
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = LockServer()
+    monkeypatch.setattr(leader.asyncmy, "connect", server.connect)
+    return server
+
+
+def leaders(workers, key):
+    return [worker for worker in workers if worker.holds(key)]
+
+
+async def elect_all(workers, wanted=KEYS):
+    await asyncio.gather(*(worker.elect(wanted) for worker in workers))
+
+
+async def test_exactly_one_leader_per_key(server):
+    workers = [LeaderElection("results") for _ in range(5)]
+    for _ in range(3):
+        await elect_all(workers)
+        for key in KEYS:
+            assert len(leaders(workers, key)) == 1
+    # Vedoucí klíče je ten, jehož připojení drží zámek na serveru
+    for key, holder in server.holders(workers[0]).items():
+        assert leaders(workers, key)[0]._connection is holder
+
+
+async def test_takeover_after_leader_is_killed(server):
+    workers = [LeaderElection("results") for _ in range(3)]
+    await elect_all(workers)
+    key = (1, 1)
+    killed = leaders(workers, key)[0]
+    server.kill(killed._connection)
+    await asyncio.sleep(0)
+
+    survivors = [worker for worker in workers if worker is not killed]
+    await elect_all(survivors)
+    assert len(leaders(survivors, key)) == 1
+    # Zabitý worker po obnovení zjistí ztrátu připojení a vedení nepřevezme zpět
+    acquired, lost = await killed.elect(KEYS)
+    assert key in lost and key not in acquired
+    assert not killed.holds(key)
+    for key in KEYS:
+        assert len(leaders(workers, key)) == 1
+
+
+async def test_released_keys_are_taken_over(server):
+    first, second = LeaderElection("results"), LeaderElection("results")
+    await first.elect(KEYS)
+    await second.elect(KEYS)
+    assert first.held == KEYS and not second.held
+
+    # Fáze skončila: první worker vedení pustí, druhý ho převezme při další volbě
+    acquired, released = await first.elect(KEYS - {(2, 3)})
+    assert released == {(2, 3)}
+    acquired, _ = await second.elect(KEYS)
+    assert acquired == {(2, 3)}
+
+    # Vypnutí workeru pustí všechna vedení najednou
+    await first.close()
+    await asyncio.sleep(0)
+    acquired, _ = await second.elect(KEYS)
+    assert acquired == {(1, 1), (1, 2)}
+    assert second.held == KEYS
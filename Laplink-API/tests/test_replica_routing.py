@@ -0,0 +1,162 @@
+"""
+Směrování připojení mezi primárním serverem a read replikou (db/connection.py).
+
+Oba servery zastupuje v procesu FakeServer na místě poolu asyncmy, replika vrací
+zadané zpoždění v SHOW REPLICA STATUS.
+"""
+import time
+
+import pytest
+
+import db.connection as connection
+from db.connection import PrioritizedConnectionPool, prioritized_get_db_connection
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self.server = server
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, operation, params=None):
+        self.server.queries.append(operation)
+
+    async def fetchone(self):
+        if not self.server.replica:
+            return None
+        return {"Seconds_Behind_Master": self.server.lag}
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, cursor_class=None):
+        return FakeCursor(self.server)
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    """
+    Pool asyncmy jednoho serveru. Replika s lag=None má zastavenou replikaci.
+    """
+
+    def __init__(self, name, replica=False, lag=None):
+        self.name = name
+        self.replica = replica
+        self.lag = lag
+        self.reachable = True
+        self.queries = []
+
+    async def acquire(self):
+        if not self.reachable:
+            raise OSError(f"{self.name} is unreachable")
+        return FakeConnection(self)
+
+    def release(self, connection):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    primary = FakeServer("primary")
+    replica = FakeServer("replica", replica=True, lag=0)
+    monkeypatch.setattr(connection, "REPLICA_ENABLED", True)
+    monkeypatch.setattr(connection, "REPLICA_MAX_LAG", 5)
+    monkeypatch.setattr(connection, "connection_pool", PrioritizedConnectionPool(primary, 4, 1, 0.05, "primary"))
+    monkeypatch.setattr(connection, "replica_pool", PrioritizedConnectionPool(replica, 1, 0, 0.05, "replica"))
+    # Stav repliky se ověří při prvním požadavku
+    monkeypatch.setattr(connection, "replica_state", {"healthy": True, "lag_seconds": None, "checked_at": float("-inf")})
+    return primary, replica
+
+
+async def server_for(**kwargs):
+    db_connection = await prioritized_get_db_connection(**kwargs)
+    try:
+        return db_connection.raw_connection.server
+    finally:
+        await db_connection.close()
+
+
+async def test_low_priority_read_uses_replica(servers):
+    primary, replica = servers
+    assert await server_for(priority="low") is replica
+    assert connection.replica_state["lag_seconds"] == 0
+
+
+async def test_lagging_replica_falls_back_to_primary(servers):
+    primary, replica = servers
+    replica.lag = 30
+    assert await server_for(priority="low") is primary
+    assert connection.replica_state["healthy"] is False
+    assert connection.replica_state["lag_seconds"] == 30
+
+
+async def test_stopped_replication_falls_back_to_primary(servers):
+    primary, replica = servers
+    replica.lag = None
+    assert await server_for(priority="low") is primary
+    assert connection.replica_state["healthy"] is False
+
+
+async def test_writes_and_high_priority_use_primary(servers):
+    primary, replica = servers
+    assert await server_for(priority="low", read_only=False) is primary
+    assert await server_for(priority="high") is primary
+    assert await server_for(priority="high", read_only=True) is primary
+    # Zápisy ani high se na repliku neptají
+    assert replica.queries == []
+
+
+async def test_unreachable_replica_falls_back_to_primary(servers):
+    primary, replica = servers
+    replica.reachable = False
+    assert await server_for(priority="low") is primary
+    assert connection.replica_state["healthy"] is False
+
+
+async def test_busy_replica_falls_back_to_primary(servers):
+    primary, replica = servers
+    # Ověření zpoždění proběhne dřív, než replika obsadí své jediné připojení
+    assert await server_for(priority="low") is replica
+    held = await connection.replica_pool.acquire("low")
+    try:
+        assert await server_for(priority="low") is primary
+        assert connection.replica_state["healthy"] is True
+    finally:
+        await connection.replica_pool.release(held, "low")
+
+
+async def test_busy_replica_falls_back_without_waiting(servers, monkeypatch):
+    primary, replica = servers
+    # Čekání na repliku by trvalo celý acquire_timeout poolu
+    monkeypatch.setattr(connection.replica_pool, "acquire_timeout", 5)
+    assert await server_for(priority="low") is replica
+    held = await connection.replica_pool.acquire("low")
+    try:
+        for checked_at in (time.monotonic(), float("-inf")):
+            # Podruhé proběhne i ověření zpoždění repliky
+            connection.replica_state["checked_at"] = checked_at
+            started = time.perf_counter()
+            assert await server_for(priority="low") is primary
+            assert time.perf_counter() - started < 0.1
+    finally:
+        await connection.replica_pool.release(held, "low")
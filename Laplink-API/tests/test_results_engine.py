@@ -0,0 +1,117 @@
+"""
+Pravidla konečných výsledků fáze (service/results_engine.py).
+"""
+from service.results_engine import compute_phase_results, result_rows
+from service.results_store import compute_phase_rows, load_phase_data
+
+# Registrace 1-4 v kategorii 10, registrace 5 v kategorii 20
+REGISTRATION_IDS = [1, 2, 3, 4, 5]
+CATEGORY_IDS = [10, 10, 10, 10, 20]
+
+
+def results(lap_registration_ids, laptimes_ms, result_type, **kwargs):
+    return result_rows(compute_phase_results(
+        REGISTRATION_IDS, CATEGORY_IDS, lap_registration_ids, laptimes_ms, result_type, **kwargs))
+
+
+def column(rows, name):
+    return [row[name] for row in rows]
+
+
+def test_min_takes_best_lap_and_sum_adds_laps():
+    laps = ([1, 1, 2, 2], [60_000, 70_000, 65_000, 62_000])
+
+    rows = results(*laps, "MIN", event_phase_id=1)
+    assert column(rows, "event_registration_id") == [1, 2]
+    assert column(rows, "total_time_ms") == [60_000, 62_000]
+    assert column(rows, "position") == [1, 2]
+
+    rows = results(*laps, "SUM", event_phase_id=1)
+    assert column(rows, "event_registration_id") == [2, 1]
+    assert column(rows, "total_time_ms") == [127_000, 130_000]
+
+
+def test_registrations_without_laps_and_unknown_laps_are_skipped():
+    rows = results([3, 99], [61_000, 50_000], "MIN", event_phase_id=1)
+    assert column(rows, "event_registration_id") == [3]
+    # Fáze bez result_type výsledky nemá
+    assert results([3], [61_000], None, event_phase_id=1) == []
+
+
+def test_positions_restart_in_each_category():
+    rows = results([1, 2, 5], [62_000, 61_000, 70_000], "MIN", event_phase_id=1)
+    assert [(row["car_category_id"], row["event_registration_id"], row["position"]) for row in rows] == [
+        (10, 2, 1), (10, 1, 2), (20, 5, 1)]
+
+
+def test_dnf_is_last_only_in_race_phase():
+    laps = ([1, 2, 3], [3_000_000, 3_100_000, 3_200_000])
+    dnf = [1, 0, 0, 0, 0]
+
+    rows = results(*laps, "SUM", event_phase_id=3, dnf=dnf)
+    assert column(rows, "event_registration_id") == [2, 3, 1]
+    assert column(rows, "position") == [1, 2, 3]
+
+    rows = results(*laps, "SUM", event_phase_id=1, dnf=dnf)
+    assert column(rows, "event_registration_id") == [1, 2, 3]
+
+
+def test_qualification_points():
+    laps = ([1, 2, 3, 4], [60_000, 61_000, 62_000, 63_000])
+    assert column(results(*laps, "MIN", event_phase_id=2), "points") == [6, 3, 1, 0]
+    # Ostatní fáze MIN body nedávají
+    assert column(results(*laps, "MIN", event_phase_id=1), "points") == [0, 0, 0, 0]
+
+
+def test_sum_points_follow_points_definition():
+    laps = ([1, 2, 3, 5], [3_000_000, 3_100_000, 3_200_000, 3_300_000])
+    points_definition = [(1, 25), (2, 18)]
+
+    rows = results(*laps, "SUM", event_phase_id=3, points_definition=points_definition)
+    # Pozice mimo tabulku mají 0, každá kategorie se boduje zvlášť
+    assert [(row["event_registration_id"], row["points"]) for row in rows] == [(1, 25), (2, 18), (3, 0), (5, 25)]
+    assert column(results(*laps, "SUM", event_phase_id=3), "points") == [0, 0, 0, 0]
+
+
+def test_zero_point_category_gets_no_points():
+    laps = ([1, 5], [60_000, 70_000])
+    rows = results(*laps, "MIN", event_phase_id=2, zero_point_category_ids={20})
+    assert [(row["event_registration_id"], row["position"], row["points"]) for row in rows] == [(1, 1, 6), (5, 1, 0)]
+
+
+def test_ties_are_decided_by_registration_id():
+    rows = results([3, 1, 2], [60_000, 60_000, 60_000], "MIN", event_phase_id=2)
+    assert column(rows, "event_registration_id") == [1, 2, 3]
+    assert column(rows, "position") == [1, 2, 3]
+    assert column(rows, "points") == [6, 3, 1]
+
+
+class FakeCursor:
+    def __init__(self, results):
+        # Výsledky dotazů v pořadí, v jakém je load_phase_data posílá
+        self.results = list(results)
+
+    async def execute(self, operation, params=None):
+        self.rows = self.results.pop(0)
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+
+async def test_load_phase_data_maps_zero_point_categories():
+    cursor = FakeCursor([
+        [("SUM",)],
+        [(1, 10, 0, "S1"), (2, 10, 1, "S1"), (5, 20, 0, "S1+")],
+        [(1, 3_000_000), (2, 2_900_000), (5, 3_100_000)],
+        [(1, 25), (2, 18)],
+    ])
+    data = await load_phase_data(cursor, 1, 3)
+    assert data["zero_point_category_ids"] == {20}
+    assert data["points_definition"] == [(1, 25), (2, 18)]
+
+    rows = compute_phase_rows(data)
+    assert [(row["event_registration_id"], row["position"], row["points"]) for row in rows] == [
+        (1, 1, 25), (2, 2, 18), (5, 1, 0)]
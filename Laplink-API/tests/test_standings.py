@@ -0,0 +1,156 @@
+"""
+Průběžné pořadí (service/standings.py) nad event_lap v paměti testu.
+
+LapTable napodobuje tabulku event_lap: id kola se přidělí při insertu, ale dotazy
+ho vidí až po commitu. Kolo s nižším id tak může být vidět později než kolo s vyšším.
+"""
+import pytest
+
+import service.standings as standings_module
+from service.standings import LAPS_QUERY, PHASE_QUERY, REGISTRATIONS_QUERY, CategoryStandings, StandingsEngine
+
+EVENT_ID, PHASE_ID = 1, 2
+# event_registration_id -> car_category_id
+REGISTRATIONS = {1: 10, 2: 10, 3: 20}
+
+
+class LapTable:
+    def __init__(self, result_type):
+        self.result_type = result_type
+        self.now = 0.0
+        self._next_id = 1
+        # id kola -> (registrace, čas v ms, created_at)
+        self._laps = {}
+        self._committed = set()
+
+    def insert(self, registration_id, laptime_ms):
+        lap_id = self._next_id
+        self._next_id += 1
+        self._laps[lap_id] = (registration_id, laptime_ms, self.now)
+        return lap_id
+
+    def commit(self, *lap_ids):
+        self._committed.update(lap_ids)
+
+    def add(self, registration_id, laptime_ms):
+        lap_id = self.insert(registration_id, laptime_ms)
+        self.commit(lap_id)
+        return lap_id
+
+    def select(self, watermark, window):
+        return [(lap_id, registration_id, laptime_ms)
+                for lap_id, (registration_id, laptime_ms, created_at) in sorted(self._laps.items())
+                if lap_id in self._committed and (lap_id > watermark or created_at >= self.now - window)]
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+        self.rows = []
+
+    async def execute(self, operation, params=None):
+        if operation == PHASE_QUERY:
+            self.rows = [(self.table.result_type,)]
+        elif operation == REGISTRATIONS_QUERY:
+            self.rows = list(REGISTRATIONS.items())
+        elif operation == LAPS_QUERY:
+            event_id, event_phase_id, watermark, window = params
+            self.rows = self.table.select(watermark, window)
+        else:
+            raise AssertionError(f"Unexpected query: {operation}")
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    async def fetchall(self):
+        return self.rows
+
+    async def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+    async def close(self):
+        pass
+
+
+def use_table(monkeypatch, result_type):
+    table = LapTable(result_type)
+
+    async def get_connection(**kwargs):
+        return FakeConnection(table)
+
+    monkeypatch.setattr(standings_module, "prioritized_get_db_connection", get_connection)
+    monkeypatch.setattr(standings_module, "STANDINGS_SYNC_WINDOW", 60)
+    return table
+
+
+def test_category_standings_moves_registration():
+    category = CategoryStandings()
+    for registration_id, laptime_ms in ((1, 61_000), (2, 60_000), (3, 62_000), (4, 60_000)):
+        category.add((laptime_ms, registration_id))
+    # Shodný čas rozhoduje id registrace
+    assert [registration_id for _, registration_id in category] == [2, 4, 1, 3]
+
+    category.remove((62_000, 3))
+    category.add((59_000, 3))
+    category.remove((1, 1))
+    assert list(category) == [(59_000, 3), (60_000, 2), (60_000, 4), (61_000, 1)]
+    assert category.position((60_000, 4)) == 3
+    assert len(category) == 4
+
+
+@pytest.fixture
+def engine():
+    return StandingsEngine()
+
+
+async def test_lap_committed_out_of_id_order_is_synced(engine, monkeypatch):
+    table = use_table(monkeypatch, "MIN")
+    table.add(1, 60_000)
+    standings = await engine.load(EVENT_ID, PHASE_ID)
+
+    # Kolo 2 čeká ve skupinovém commitu, kolo 3 jiného workeru se commitne dřív
+    late = table.insert(2, 55_000)
+    table.add(1, 59_000)
+    await engine.sync(EVENT_ID, PHASE_ID)
+    assert standings.watermark == 3
+    assert standings.entry(1) == (1, 59_000)
+    assert standings.entry(2) is None
+
+    table.now += 1
+    table.commit(late)
+    await engine.sync(EVENT_ID, PHASE_ID)
+    assert standings.entry(2) == (1, 55_000)
+    assert standings.entry(1) == (2, 59_000)
+    assert standings.lap_count == 3
+
+
+async def test_sync_window_does_not_count_laps_twice(engine, monkeypatch):
+    table = use_table(monkeypatch, "SUM")
+    table.add(1, 60_000)
+    table.add(3, 61_000)
+    standings = await engine.load(EVENT_ID, PHASE_ID)
+
+    late = table.insert(1, 62_000)
+    table.add(3, 63_000)
+    await engine.sync(EVENT_ID, PHASE_ID)
+    table.commit(late)
+    for _ in range(3):
+        await engine.sync(EVENT_ID, PHASE_ID)
+    assert standings.entry(1) == (1, 122_000)
+    assert standings.entry(3) == (1, 124_000)
+    assert standings.lap_count == 4
+
+    # Kolo uložené tímto workerem (record_lap) se při sync nezapočítá podruhé
+    lap_id = table.add(1, 64_000)
+    engine.record_lap(EVENT_ID, PHASE_ID, lap_id, 1, 64_000)
+    await engine.sync(EVENT_ID, PHASE_ID)
+    assert standings.entry(1) == (1, 186_000)
+    assert [(row["event_registration_id"], row["position"]) for row in standings.rows()] == [(1, 1), (3, 1)]
@@ -14,4 +14,27 @@ def get_formated_event_driver_event_results(row):
     return {
         "lap": row[0],
         "time": row[1],
-    }
\ No newline at end of file
+    }
+
+def laptime_to_ms(laptime):
+    """Převede čas ve formátu HH:MM:SS.mm na celé milisekundy"""
+    hours, minutes, seconds = laptime.split(":")
+    whole, _, fraction = seconds.partition(".")
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(whole)) * 1000 + int(fraction.ljust(3, "0")[:3])
+
+def format_time_ms(ms, fraction_digits=2):
+    """Převede milisekundy na řetězec HH:MM:SS.mm, s fraction_digits=3 na HH:MM:SS.mmm"""
+    if ms is None:
+        return None
+    # Průměr z databáze přichází jako Decimal
+    seconds, millis = divmod(int(round(ms)), 1000)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02}:{minutes:02}:{seconds:02}." + f"{millis:03}"[:fraction_digits]
+
+def format_time_columns(rows, *columns, fraction_digits=2):
+    """V řádcích z databáze nahradí sloupce <sloupec>_ms řetězcem pod jménem <sloupec>"""
+    for row in rows:
+        for column in columns:
+            row[column] = format_time_ms(row.pop(f"{column}_ms"), fraction_digits)
+    return rows
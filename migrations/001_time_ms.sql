@@ -0,0 +1,233 @@
+-- Časy kol a výsledků jako celé milisekundy.
+--
+-- event_lap.laptime a event_result.total_time jsou varchar(12) ve formátu HH:MM:SS.mm.
+-- Přepočet výsledků nad nimi počítal TIME_TO_SEC a řetězcové MIN() pro každé kolo
+-- a nemohl použít index. Migrace přidá sloupce laptime_ms a total_time_ms, dopočítá
+-- je pro existující data a přepne procedury výsledků na číselné sloupce.
+--
+-- Po dobu přechodu se řetězcové sloupce dál plní (API zapisuje oba, triggery dopočítají
+-- milisekundy pro zápisy, které je neposílají, procedury plní oba sloupce výsledku).
+-- Řetězcové sloupce lze odstranit, až je nebude číst žádný klient.
+--
+-- Spuštění: mysql u114951875_laplink < migrations/001_time_ms.sql
+
+ALTER TABLE `event_lap`
+  ADD COLUMN `laptime_ms` int(10) UNSIGNED DEFAULT NULL AFTER `laptime`;
+
+ALTER TABLE `event_result`
+  ADD COLUMN `total_time_ms` int(10) UNSIGNED DEFAULT NULL AFTER `total_time`;
+
+DELIMITER $$
+
+DROP TRIGGER IF EXISTS `before_event_lap_insert`$$
+CREATE TRIGGER `before_event_lap_insert` BEFORE INSERT ON `event_lap` FOR EACH ROW BEGIN
+    IF NEW.laptime_ms IS NULL THEN
+        SET NEW.laptime_ms = ROUND(TIME_TO_SEC(NEW.laptime) * 1000);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS `before_event_result_insert`$$
+CREATE TRIGGER `before_event_result_insert` BEFORE INSERT ON `event_result` FOR EACH ROW BEGIN
+    IF NEW.total_time_ms IS NULL THEN
+        SET NEW.total_time_ms = ROUND(TIME_TO_SEC(NEW.total_time) * 1000);
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- Dopočet až po vytvoření triggerů, aby žádný nový řádek nezůstal bez hodnoty
+UPDATE `event_lap` SET `laptime_ms` = ROUND(TIME_TO_SEC(`laptime`) * 1000) WHERE `laptime_ms` IS NULL;
+UPDATE `event_result` SET `total_time_ms` = ROUND(TIME_TO_SEC(`total_time`) * 1000) WHERE `total_time_ms` IS NULL;
+
+ALTER TABLE `event_lap`
+  MODIFY `laptime_ms` int(10) UNSIGNED NOT NULL,
+  ADD KEY `idx_event_lap_registration_phase_time` (`event_registration_id`,`event_phase_id`,`laptime_ms`);
+
+ALTER TABLE `event_result`
+  MODIFY `total_time_ms` int(10) UNSIGNED NOT NULL;
+
+DELIMITER $$
+
+DROP FUNCTION IF EXISTS `FormatTimeMs`$$
+CREATE FUNCTION `FormatTimeMs` (`ms` INT UNSIGNED) RETURNS VARCHAR(12) CHARSET utf8mb4 COLLATE utf8mb4_general_ci DETERMINISTIC NO SQL RETURN CONCAT(
+        LPAD(FLOOR(ms / 3600000), 2, '0'), ':',
+        LPAD(FLOOR(MOD(ms, 3600000) / 60000), 2, '0'), ':',
+        LPAD(FLOOR(MOD(ms, 60000) / 1000), 2, '0'), '.',
+        LPAD(FLOOR(MOD(ms, 1000) / 10), 2, '0')
+    )$$
+
+DROP PROCEDURE IF EXISTS `CreateActiveEventPhaseResult`$$
+CREATE PROCEDURE `CreateActiveEventPhaseResult` (IN `EventId` INT, IN `EventPhaseId` INT)   BEGIN
+    DECLARE v_result_type VARCHAR(4);
+
+    SELECT ep.result_type 
+      INTO v_result_type
+      FROM event_phase ep
+     WHERE ep.id = EventPhaseId;
+
+    DELETE FROM event_result 
+     WHERE event_phase_id = EventPhaseId
+       AND event_registration_id IN (
+           SELECT id 
+             FROM event_registration 
+            WHERE event_id = EventId
+       );
+
+    IF v_result_type = 'MIN' THEN
+        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, points, position)
+        SELECT 
+            er.id,
+            EventPhaseId,
+            FormatTimeMs(MIN(el.laptime_ms)) AS total_time,
+            MIN(el.laptime_ms) AS total_time_ms,
+
+            CASE
+                WHEN cc.name = 'S1+' THEN
+                    0
+                WHEN EventPhaseId = 2 THEN
+                    CASE 
+                      WHEN ROW_NUMBER() OVER (
+                             PARTITION BY er.car_category_id 
+                             ORDER BY 
+                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                               MIN(el.laptime_ms)
+                           ) = 1 THEN 6
+                      WHEN ROW_NUMBER() OVER (
+                             PARTITION BY er.car_category_id 
+                             ORDER BY 
+                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                               MIN(el.laptime_ms)
+                           ) = 2 THEN 3
+                      WHEN ROW_NUMBER() OVER (
+                             PARTITION BY er.car_category_id 
+                             ORDER BY 
+                               CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                               MIN(el.laptime_ms)
+                           ) = 3 THEN 1
+                      ELSE 0
+                    END
+                ELSE
+                    0
+            END AS points,
+
+            ROW_NUMBER() OVER (
+                PARTITION BY er.car_category_id 
+                ORDER BY 
+                    CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                    MIN(el.laptime_ms)
+            ) AS position
+
+        FROM event_registration er
+        INNER JOIN event_lap el 
+                ON er.id = el.event_registration_id
+        INNER JOIN car_category cc
+                ON er.car_category_id = cc.id
+        WHERE er.event_id = EventId
+          AND el.event_phase_id = EventPhaseId
+        GROUP BY er.id, er.car_category_id, cc.name
+        HAVING MIN(el.laptime_ms) IS NOT NULL
+        ORDER BY er.car_category_id,
+                 CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                 MIN(el.laptime_ms);
+
+    ELSEIF v_result_type = 'SUM' THEN
+        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, points, position)
+        SELECT 
+            er.id,
+            EventPhaseId,
+            FormatTimeMs(SUM(el.laptime_ms)),
+            SUM(el.laptime_ms),
+            0,
+            ROW_NUMBER() OVER (
+                PARTITION BY er.car_category_id 
+                ORDER BY 
+                  CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END, 
+                  SUM(el.laptime_ms)
+            ) AS position
+        FROM event_registration er
+        INNER JOIN event_lap el 
+                ON er.id = el.event_registration_id
+        WHERE er.event_id = EventId
+          AND el.event_phase_id = EventPhaseId
+          AND el.laptime_ms IS NOT NULL
+        GROUP BY er.id, er.car_category_id
+        HAVING SUM(el.laptime_ms) IS NOT NULL
+        ORDER BY er.car_category_id,
+                 CASE WHEN EventPhaseId = 3 AND er.dnf = 1 THEN 1 ELSE 0 END,
+                 SUM(el.laptime_ms);
+
+        UPDATE event_result er
+        INNER JOIN points_definition pd 
+                ON er.position = pd.position
+        INNER JOIN event_registration reg 
+                ON er.event_registration_id = reg.id
+        INNER JOIN car_category cc
+                ON reg.car_category_id = cc.id
+        SET er.points = pd.points
+        WHERE reg.event_id = EventId
+          AND er.event_phase_id = EventPhaseId
+          AND cc.name <> 'S1+';
+    END IF;
+
+END$$
+
+DROP PROCEDURE IF EXISTS `UpdateActiveEventPhaseResults`$$
+CREATE PROCEDURE `UpdateActiveEventPhaseResults` (IN `EventId` INT, IN `EventPhaseId` INT)   BEGIN
+    DECLARE v_result_type VARCHAR(4);
+
+    SELECT ep.result_type INTO v_result_type
+    FROM event_phase ep
+    WHERE ep.id = EventPhaseId;
+
+    DELETE FROM event_result 
+    WHERE event_phase_id = EventPhaseId
+    AND event_registration_id IN (
+        SELECT id FROM event_registration WHERE event_id = EventId
+    );
+
+    IF v_result_type = 'MIN' THEN
+        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, position)
+        SELECT 
+            er.id AS event_registration_id,
+            EventPhaseId,
+            FormatTimeMs(MIN(el.laptime_ms)) AS total_time,
+            MIN(el.laptime_ms) AS total_time_ms,
+            ROW_NUMBER() OVER (
+                PARTITION BY er.car_category_id 
+                ORDER BY MIN(el.laptime_ms)
+            ) AS position
+        FROM 
+            event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE 
+            er.event_id = EventId
+            AND el.event_phase_id = EventPhaseId
+        GROUP BY 
+            er.id, er.car_category_id
+        HAVING MIN(el.laptime_ms) IS NOT NULL;
+
+    ELSEIF v_result_type = 'SUM' THEN
+        INSERT INTO event_result (event_registration_id, event_phase_id, total_time, total_time_ms, position)
+        SELECT 
+            er.id AS event_registration_id,
+            EventPhaseId,
+            FormatTimeMs(SUM(el.laptime_ms)) AS total_time,
+            SUM(el.laptime_ms) AS total_time_ms,
+            ROW_NUMBER() OVER (
+                PARTITION BY er.car_category_id 
+                ORDER BY SUM(el.laptime_ms)
+            ) AS position
+        FROM 
+            event_registration er
+        INNER JOIN event_lap el ON er.id = el.event_registration_id
+        WHERE 
+            er.event_id = EventId
+            AND el.event_phase_id = EventPhaseId
+        GROUP BY 
+            er.id, er.car_category_id
+        HAVING SUM(el.laptime_ms) IS NOT NULL;
+    END IF;
+
+END$$
+
+DELIMITER ;
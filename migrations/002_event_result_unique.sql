@@ -0,0 +1,21 @@
+-- Jeden výsledek registrace ve fázi.
+--
+-- Průběžné výsledky se neukládají smazáním a novým vložením celé fáze, API zapisuje
+-- jen změněné řádky (INSERT ... ON DUPLICATE KEY UPDATE). Unikátní klíč zaručí, že dva
+-- workery ukládající výsledky stejné fáze současně nevloží jednu registraci dvakrát.
+--
+-- Spuštění: mysql u114951875_laplink < migrations/002_event_result_unique.sql
+
+-- Případné duplicity z dřívějších souběžných přepočtů, ponechá se nejnovější řádek
+DELETE older FROM `event_result` older
+  INNER JOIN `event_result` newer
+    ON older.`event_registration_id` = newer.`event_registration_id`
+   AND older.`event_phase_id` = newer.`event_phase_id`
+   AND older.`id` < newer.`id`;
+
+ALTER TABLE `event_result`
+  ADD UNIQUE KEY `uq_event_result_registration_phase` (`event_registration_id`,`event_phase_id`);
+
+-- Cizí klíč na registraci teď pokryje unikátní klíč, původní index je zbytečný
+ALTER TABLE `event_result`
+  DROP KEY `fk_event_result_registration`;
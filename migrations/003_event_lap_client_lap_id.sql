@@ -0,0 +1,14 @@
+-- Klientský identifikátor kola.
+--
+-- Zařízení na trati při výpadku spojení odeslání kola opakuje. Kolo s client_lap_id se
+-- uloží nejvýše jednou (service/lap_dedup.py), unikátní klíč zachytí opakování i po
+-- restartu API nebo v jiném workeru. Identifikátor se porovnává binárně a klíč obsahuje
+-- fázi, protože zařízení může číslovat kola v každé fázi znovu od 1.
+--
+-- Existující kola client_lap_id nemají, NULL se v unikátním klíči neporovnává.
+--
+-- Spuštění: mysql u114951875_laplink < migrations/003_event_lap_client_lap_id.sql
+
+ALTER TABLE `event_lap`
+  ADD COLUMN `client_lap_id` varchar(64) COLLATE utf8mb4_bin DEFAULT NULL AFTER `event_phase_id`,
+  ADD UNIQUE KEY `uq_event_lap_client_lap` (`event_registration_id`,`event_phase_id`,`client_lap_id`);
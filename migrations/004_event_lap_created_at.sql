@@ -0,0 +1,12 @@
+-- Čas uložení kola.
+--
+-- Nečinnost závodu (1,5 hodiny bez kola => fáze 5) se počítala jen v paměti workeru,
+-- po restartu se hodiny nečinnosti nulovaly. Vedoucí worker fáze teď po převzetí
+-- vezme čas posledního kola z databáze.
+--
+-- Existující kola dostanou čas provedení migrace.
+--
+-- Spuštění: mysql u114951875_laplink < migrations/004_event_lap_created_at.sql
+
+ALTER TABLE `event_lap`
+  ADD COLUMN `created_at` timestamp(3) NOT NULL DEFAULT current_timestamp(3) AFTER `client_lap_id`;
@@ -0,0 +1,13 @@
+-- Výpočet výsledků fází v API místo v databázi.
+--
+-- Pořadí a body fáze počítá service/results_engine.py (NumPy), databáze jen vydá kola
+-- a uloží výsledek. Konečné výsledky s body zapisuje API po změně fáze závodu
+-- (service/results_store.py), trigger a procedury přepočtu se proto odstraní.
+-- Průběžné pořadí API počítá samo a procedury nevolá, trigger by po změně fáze přepsal
+-- výsledky uložené API znovu.
+--
+-- Spuštění: mysql u114951875_laplink < migrations/005_results_engine.sql
+
+DROP TRIGGER IF EXISTS `after_event_phase_id_update`;
+DROP PROCEDURE IF EXISTS `CreateActiveEventPhaseResult`;
+DROP PROCEDURE IF EXISTS `UpdateActiveEventPhaseResults`;